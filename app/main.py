@@ -3,11 +3,30 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent))
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import PlainTextResponse
 from app.routers import chat, dashboard, telegram
+from services.client_pool import ClientPool, get_client_pool
+from services.config_service import ConfigService
+from services.metrics import REGISTRY, IN_FLIGHT, PENDING_JOBS
 
-# Initialize the FastAPI app with the lifespan for the Telegram bot
-app = FastAPI(lifespan=telegram.lifespan)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared clients once for the whole process; the config service
+    # replaces them when the configuration is updated
+    config = ConfigService(app.state)
+    await config.start()
+    app.state.config = config
+    try:
+        # Start the Telegram bot on top of the pool
+        async with telegram.lifespan(app):
+            yield
+    finally:
+        await config.close()
+
+# Initialize the FastAPI app with the lifespan for the client pool and the Telegram bot
+app = FastAPI(lifespan=lifespan)
 
 # Include the routers
 app.include_router(chat.router, prefix="/chat")
@@ -17,3 +36,15 @@ app.include_router(telegram.router, prefix="/telegram")
 @app.get("/")
 async def root():
     return {"message": "Welcome to the FastAPI application!"}
+
+@app.get("/health")
+async def health(pool: ClientPool = Depends(get_client_pool)):
+    return await pool.health()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    # Read the pool without a lease so the scrape does not count itself as in flight
+    pool = request.app.state.client_pool
+    IN_FLIGHT.set(pool.active_requests)
+    PENDING_JOBS.set(pool.ingestion_jobs.pending() if pool.ingestion_jobs is not None else 0)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,42 +1,42 @@
 import os
-from dotenv import load_dotenv
-from fastapi import APIRouter, UploadFile, File, HTTPException, Body, Form
+import json
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Body, Form, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from tempfile import NamedTemporaryFile
-from app.services.vectorstore_manager import DocumentsPipeline
-from app.services.convert_html_pipeline import ConvertHTMLPipeline
+from services.client_pool import ClientPool, get_client_pool
+from services.vectorstore_manager import parse_search_cursor
+from services.bulk_ingestion import BulkIngestion, collect_html_files
 from models.models import Metadata
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
 
 # Initialize router
 router = APIRouter()
 
-# get env variables
-dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../variables/.env'))
-load_dotenv(dotenv_path=dotenv_path)
-embedding_model_name = os.getenv('EMBEDDING_MODEL_NAME')
-hugging_api_key = os.getenv('HUGGING_FACE_API_KEY')
-weaviate_cluster_URL = os.getenv('WEAVIATE_CLUSTER_URL')
-weaviate_api_key = os.getenv('WEAVIATE_API_KEY')
-weaviate_collection_name = os.getenv('WEAVIATE_COLLECTION_NAME')
-
 # Routes
 # Add document data from an HTML filer
-@router.post("/add-document/")
+@router.post("/add-document/", status_code=202)
 async def add_document(
     name: str = Form(...),
     active: bool = Form(...),
     date: str = Form(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    pool: ClientPool = Depends(get_client_pool)
 ):
     """
-    Adds document data from an uploaded HTML file to the Weaviate vector store.
+    Queues an uploaded HTML file for ingestion into the Weaviate vector store.
 
     Args:
         file (UploadFile): The HTML file uploaded by the user.
         metadata (Metadata): Metadata associated with the document.
 
     Returns:
-        dict: A response indicating whether the document was successfully added.
+        dict: The id of the ingestion job; its progress is available from /jobs/{job_id}.
     """
     try:
         metadata = {
@@ -45,65 +45,172 @@ async def add_document(
             "date": date
         }
 
-        # Initialize DocumentsPipeline
-        pipeline = DocumentsPipeline(
-            collection_name=weaviate_collection_name,
-            embedding_model_name=embedding_model_name,
-            cluster_URL=weaviate_cluster_URL,
-            weaviate_api_key=weaviate_api_key,
-            hugging_api_key=hugging_api_key
-        )
+        # Use the shared DocumentsPipeline
+        pipeline = pool.documents_pipeline
 
         # Create a temporary file to save the uploaded HTML file
         with NamedTemporaryFile(delete=False, suffix=".html") as temp_file:
             temp_file.write(await file.read())
             temp_file_path = temp_file.name
 
-        print("metadata: ", metadata)
-        # Add document data to the vector store
-        success = pipeline.add_documents_data(html_path=temp_file_path, metadata=metadata)
+        logger.debug(f"metadata: {metadata}")
+
+        def ingest(job):
+            try:
+                return pipeline.ingest_html(temp_file_path, metadata, progress=job.progress)
+            finally:
+                # Clean up the temporary HTML file
+                os.remove(temp_file_path)
+
+        # Cached answers may no longer match the knowledge base once the job is done
+        try:
+            job = pool.submit_job(name, ingest, on_success=lambda job: pool.invalidate_answers())
+        except Exception:
+            # The job will never run to remove the file
+            os.remove(temp_file_path)
+            raise
+        return {"status": "queued", "job_id": job.id}
 
-        # Clean up the temporary HTML file
-        os.remove(temp_file_path)
-        pipeline.close_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-        if success:
-            return {"status": "success", "message": "Document data added successfully"}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to add document data")
+# Add many documents from HTML files or zip archives
+@router.post("/add-documents-bulk/", status_code=202)
+async def add_documents_bulk(
+    active: bool = Form(...),
+    date: str = Form(...),
+    files: List[UploadFile] = File(...),
+    pool: ClientPool = Depends(get_client_pool)
+):
+    """
+    Queues many HTML pages for ingestion in one job. Each page becomes a document named
+    after its file name; zip archives are expanded and their HTML members ingested.
+
+    Args:
+        active (bool): The active flag of every document.
+        date (str): The date of every document.
+        files (List[UploadFile]): HTML files and/or zip archives of HTML files.
+
+    Returns:
+        dict: The id of the ingestion job; the per-file report is its result.
+    """
+    try:
+        uploads = [(file.filename, await file.read()) for file in files]
+        pages = collect_html_files(uploads)
+        if not pages:
+            raise HTTPException(status_code=400, detail="No HTML files found in the upload")
+
+        bulk = BulkIngestion(
+            pool.documents_pipeline,
+            pool.parse_pool,
+        )
+        job = pool.submit_job(
+            f"bulk ({len(pages)} files)",
+            lambda job: bulk.run(pages, active, date, progress=job.progress),
+            on_success=lambda job: pool.invalidate_answers()
+        )
+        return {"status": "queued", "job_id": job.id, "files": len(pages)}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+# Re-embed the whole collection
+@router.post("/reindex", status_code=202)
+async def reindex_collection(pool: ClientPool = Depends(get_client_pool)):
+    """
+    Queues a job that re-embeds every chunk of the collection with the current embedding
+    model and writes the new vectors in place.
+
+    Returns:
+        dict: The id of the reindex job.
+    """
+    try:
+        job = pool.submit_job(
+            "reindex",
+            lambda job: pool.documents_pipeline.reindex_collection(progress=job.progress),
+            on_success=lambda job: pool.invalidate_answers()
+        )
+        return {"status": "queued", "job_id": job.id}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+# Ingestion job status
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str, pool: ClientPool = Depends(get_client_pool)):
+    """
+    Get the status of an ingestion job.
+
+    Returns:
+        dict: The job status with per-stage progress, timings and the error if it failed.
+    """
+    job = await run_in_threadpool(pool.ingestion_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs")
+async def list_ingestion_jobs(pool: ClientPool = Depends(get_client_pool)):
+    """
+    List the recent ingestion jobs, newest first.
+    """
+    return await run_in_threadpool(pool.ingestion_jobs.list)
+
 class SearchRequest(BaseModel):
     property: str
     metadata_filter: str
+    # Properties to return, e.g. without "text"; text, name, active and date if omitted
+    properties: Optional[List[str]] = None
+    limit: int = Field(100, ge=1, le=5000)
+    cursor: Optional[str] = None
+    # Stream every match as NDJSON instead of returning one page
+    stream: bool = False
 
 @router.post("/search-document")
-async def search_documents_by_metadata(request: SearchRequest):
+async def search_documents_by_metadata(request: SearchRequest, pool: ClientPool = Depends(get_client_pool)):
     """
     Search documents by metadata.
 
     Args:
-        request (SearchRequest): The request body containing property and metadata_filter.
+        request (SearchRequest): The request body containing property and metadata_filter,
+            and optionally the properties to return, the page size and the cursor of the
+            page, or stream=true for all matches as NDJSON.
 
     Returns:
-        List[Dict[str, Any]]: A list of documents matching the filter criteria.
+        List[Dict[str, Any]]: One page of documents matching the filter criteria. The cursor
+        of the next page is sent in the X-Next-Cursor header (absent on the last page).
     """
     try:
-        # Initialize DocumentsPipeline
-        pipeline = DocumentsPipeline(
-            collection_name=weaviate_collection_name,
-            embedding_model_name=embedding_model_name,
-            cluster_URL=weaviate_cluster_URL,
-            weaviate_api_key=weaviate_api_key,
-            hugging_api_key=hugging_api_key
-        )
+        after = parse_search_cursor(request.cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # Use the shared DocumentsPipeline
+        pipeline = pool.documents_pipeline
+
+        if request.stream:
+            def lines():
+                # Runs in a worker thread and holds one page of objects at a time
+                with pool.lease():
+                    for properties in pipeline.iter_documents_by_metadata(
+                            request.metadata_filter, request.property,
+                            return_properties=request.properties, after=after):
+                        yield json.dumps(jsonable_encoder(properties), ensure_ascii=False) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
 
         # Search for documents using the specified property and filter
-        chunks = pipeline.search_documents_by_metadata(property=request.property, metadata_filter=request.metadata_filter)
-
-        return chunks
+        chunks, next_cursor = await run_in_threadpool(
+            pipeline.search_documents_page,
+            request.metadata_filter,
+            request.property,
+            limit=request.limit,
+            cursor=request.cursor,
+            return_properties=request.properties
+        )
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return JSONResponse(jsonable_encoder(chunks), headers=headers)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
@@ -113,7 +220,7 @@ class DeleteDocumentRequest(BaseModel):
     metadata_filter: str
 
 @router.post("/delete-document")
-async def delete_documents_by_metadata(request: DeleteDocumentRequest):
+async def delete_documents_by_metadata(request: DeleteDocumentRequest, pool: ClientPool = Depends(get_client_pool)):
     """
     Delete documents by metadata.
 
@@ -124,20 +231,16 @@ async def delete_documents_by_metadata(request: DeleteDocumentRequest):
         List[Dict[str, Any]]: A list of documents matching the filter criteria.
     """
     try:
-        # Initialize DocumentsPipeline
-        pipeline = DocumentsPipeline(
-            collection_name=weaviate_collection_name,
-            embedding_model_name=embedding_model_name,
-            cluster_URL=weaviate_cluster_URL,
-            weaviate_api_key=weaviate_api_key,
-            hugging_api_key=hugging_api_key
-        )
+        # Use the shared DocumentsPipeline
+        pipeline = pool.documents_pipeline
 
         # Delete documents using the specified property and filter
-        chunks = pipeline.delete_documents_by_metadata(
+        chunks = await run_in_threadpool(
+            pipeline.delete_documents_by_metadata,
             property=request.property,
             metadata_filter=request.metadata_filter
         )
+        pool.invalidate_answers()
 
         return chunks
 
@@ -146,26 +249,28 @@ async def delete_documents_by_metadata(request: DeleteDocumentRequest):
 
 # Get all files info from collection
 @router.get("/get-all-files")
-async def get_all_files_unique_by_name():
+async def get_all_files_unique_by_name(
+    response: Response,
+    limit: int = Query(500, ge=1, le=5000),
+    offset: int = Query(0, ge=0),
+    active: Optional[bool] = None,
+    pool: ClientPool = Depends(get_client_pool)
+):
     """
-    Get all files info from collection.
+    Get all files info from the document registry, one page at a time.
+
+    Args:
+        limit (int): Maximum number of files returned.
+        offset (int): Number of files to skip.
+        active (bool): Only files with this active flag if set.
 
     Returns:
-        A list of dict that contains (name, active, date).
+        A list of dict that contains (name, active, date, chunk_count, content_hash, ingested_at).
+        The total number of matching files is sent in the X-Total-Count header.
     """
     try:
-        # Initialize DocumentsPipeline
-        pipeline = DocumentsPipeline(
-            collection_name=weaviate_collection_name,
-            embedding_model_name=embedding_model_name,
-            cluster_URL=weaviate_cluster_URL,
-            weaviate_api_key=weaviate_api_key,
-            hugging_api_key=hugging_api_key
-        )
-
-        # Fetch all unique files by name
-        files = pipeline.get_all_files_uniqe_by_name()
-
+        files, total = await run_in_threadpool(pool.document_registry.list, limit=limit, offset=offset, active=active)
+        response.headers["X-Total-Count"] = str(total)
         return files
 
     except Exception as e:
@@ -174,6 +279,7 @@ async def get_all_files_unique_by_name():
 # update env variables
 @router.post("/update-env")
 async def update_env_variables(
+    request: Request,
     embedding_model_name: str = None, 
     hugging_api_key: str = None, 
     weaviate_cluster_URL: str = None, 
@@ -182,64 +288,91 @@ async def update_env_variables(
     groq_api_key: str = None,
     cohere_api_key: str = None
     ):
-    try:
-        # Path to your .env file
-        env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../variables/.env'))
-
-        # Read current .env file
-        with open(env_path, 'r') as file:
-            lines = file.readlines()
-
-        # Create a dictionary of current env variables
-        env_vars = {}
-        for line in lines:
-            key, value = line.strip().split('=', 1)
-            env_vars[key] = value
-
-        # Update the variables if new values are provided
-        if embedding_model_name:
-            env_vars['EMBEDDING_MODEL_NAME'] = embedding_model_name
-        if hugging_api_key:
-            env_vars['HUGGING_FACE_API_KEY'] = hugging_api_key
-        if weaviate_cluster_URL:
-            env_vars['WEAVIATE_CLUSTER_URL'] = weaviate_cluster_URL
-        if weaviate_api_key:
-            env_vars['WEAVIATE_API_KEY'] = weaviate_api_key
-        if weaviate_collection_name:
-            env_vars['WEAVIATE_COLLECTION_NAME'] = weaviate_collection_name
-        if groq_api_key:
-            env_vars['GROQ_API_KEY'] = groq_api_key
-        if cohere_api_key:
-            env_vars['COHERE_API_KEY'] = cohere_api_key
-
-        # Write the updated variables back to the .env file
-        with open(env_path, 'w') as file:
-            for key, value in env_vars.items():
-                file.write(f"{key}={value}\n")
-
-        # Reload the .env file to update the environment variables in the running app
-        load_dotenv(dotenv_path=env_path)
-
-        return {"status": "Environment variables updated successfully"}
+    """
+    Updates the configuration without a restart. The new clients are built and checked
+    first; the .env file is only rewritten and the clients swapped if they work, and
+    requests already running finish on the old clients.
 
+    Returns:
+        dict: The environment variables that changed.
+    """
+    try:
+        changed = await request.app.state.config.update({
+            "embedding_model_name": embedding_model_name,
+            "hugging_api_key": hugging_api_key,
+            "weaviate_cluster_URL": weaviate_cluster_URL,
+            "weaviate_api_key": weaviate_api_key,
+            "weaviate_collection_name": weaviate_collection_name,
+            "groq_api_key": groq_api_key,
+            "cohere_api_key": cohere_api_key,
+        })
+
+        return {"status": "Environment variables updated successfully", "changed": changed}
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/update-template")
-async def update_prompt_template(prompt_template: str = Body(..., media_type="text/plain")):
+async def update_prompt_template(prompt_template: str = Body(..., media_type="text/plain"),
+                                 pool: ClientPool = Depends(get_client_pool)):
     try:
-        # Validate the template content
-        if len(prompt_template.strip()) == 0:
-            raise HTTPException(status_code=400, detail="Template content cannot be empty")
+        # Validate the template, record it as a new version and write it atomically;
+        # the other workers pick it up from the file
+        version = await run_in_threadpool(pool.template_registry.update, prompt_template)
 
-        # Path to your configuration file
-        config_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../config/prompt_template.txt'))
+        return {"status": "Prompt template updated successfully", "version": version}
 
-        # Write the new template to the configuration file
-        with open(config_path, 'w', encoding='utf-8') as file:
-            file.write(prompt_template)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/template")
+async def get_prompt_template(pool: ClientPool = Depends(get_client_pool)):
+    """
+    Get the current prompt template.
+
+    Returns:
+        dict: The template, its version (None if the file was edited by hand) and fingerprint.
+    """
+    registry = pool.template_registry
+    # Reads the file when it changed since the last check
+    text = await run_in_threadpool(lambda: registry.text)
+    return {"version": registry.version, "fingerprint": registry.fingerprint, "template": text}
+
+@router.get("/template/history")
+async def get_prompt_template_history(pool: ClientPool = Depends(get_client_pool)):
+    """
+    List the recorded prompt template versions, newest first.
+    """
+    return await run_in_threadpool(pool.template_registry.history)
 
-        return {"status": "Prompt template updated successfully"}
+@router.get("/template/history/{version}")
+async def get_prompt_template_version(version: int, pool: ClientPool = Depends(get_client_pool)):
+    """
+    Get the content of a recorded prompt template version.
+    """
+    try:
+        template = await run_in_threadpool(pool.template_registry.read_version, version)
+        return {"version": version, "template": template}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/template/rollback/{version}")
+async def rollback_prompt_template(version: int, pool: ClientPool = Depends(get_client_pool)):
+    """
+    Make a previous prompt template version current again.
+
+    Returns:
+        dict: The new version number, whose content is the restored version.
+    """
+    try:
+        new_version = await run_in_threadpool(pool.template_registry.rollback, version)
+        return {"status": "Prompt template rolled back", "version": new_version, "restored": version}
 
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
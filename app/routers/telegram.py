@@ -1,13 +1,13 @@
 from fastapi import APIRouter, Request, Response, FastAPI
 from http import HTTPStatus
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram.constants import ChatAction, MessageLimit
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, filters
 from telegram.ext._contexttypes import ContextTypes
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import os, uuid, logging
-from services.rag_pipeline import RAGPipeline
-from services.vectorstore_manager import DocumentsPipeline
+import os, time, asyncio, logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,44 +18,59 @@ router = APIRouter()
 dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../variables/.env'))
 load_dotenv(dotenv_path=dotenv_path)
 telegram_api_token = os.getenv('TELEGRAM_API_TOKEN')
-embedding_model_name = os.getenv('EMBEDDING_MODEL_NAME')
-hugging_api_key = os.getenv('HUGGING_FACE_API_KEY')
-groq_api_key = os.getenv('GROQ_API_KEY')
-cohere_api_key = os.getenv('COHERE_API_KEY')
-weaviate_cluster_URL = os.getenv('WEAVIATE_CLUSTER_URL')
-weaviate_api_key = os.getenv('WEAVIATE_API_KEY')
-weaviate_collection_name = os.getenv('WEAVIATE_COLLECTION_NAME')
 app_url = os.getenv('APP_URL')
+concurrent_updates = int(os.getenv('TELEGRAM_CONCURRENT_UPDATES', '16'))
+# Minimum seconds between two edits of a streamed reply
+edit_interval = float(os.getenv('TELEGRAM_EDIT_INTERVAL', '1.0'))
 
-# Placeholder for the RAGPipeline instance
-document_pipeline = DocumentsPipeline(
-    collection_name=weaviate_collection_name,
-    embedding_model_name=embedding_model_name,
-    cluster_URL=weaviate_cluster_URL,
-    weaviate_api_key=weaviate_api_key,
-    hugging_api_key=hugging_api_key
-)
-collection = document_pipeline.get_collection()
-embedder = document_pipeline.init_embedding_model()
-
-rag_pipeline = RAGPipeline(
-            collection=collection,
-            embedder=embedder,
-            cohere_api_key=cohere_api_key,
-        )
+PLACEHOLDER_TEXT = '...'
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes up to `max_concurrent_updates` updates at once, but the updates of one chat
+    strictly in order, so a user's messages are answered in the order they were sent while
+    other chats are not held up by a slow answer.
+
+    An update first waits for its chat and only then for one of the concurrency slots, so
+    updates queued behind a busy chat do not hold slots other chats could use.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}  # chat_id -> [lock, number of updates holding or awaiting it]
+
+    async def process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # Takes the global semaphore, then calls do_process_update
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
 
-# Initialize python telegram bot
-ptb = (
-    Application.builder()
-    .updater(None)
-    .token(telegram_api_token)
-    .read_timeout(7)
-    .get_updates_read_timeout(42)
-    .build()
-)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Share the process-wide client pool with the message handlers
+    ptb.bot_data["client_pool"] = app.state.client_pool
+    app.state.config.on_swap(lambda pool: ptb.bot_data.update(client_pool=pool))
     await ptb.bot.setWebhook(f"{app_url}/telegram/webhook")  # Replace with your webhook URL
     async with ptb:
         await ptb.start()
@@ -66,19 +81,91 @@ async def lifespan(app: FastAPI):
 async def process_update(request: Request):
     req = await request.json()
     update = Update.de_json(req, ptb.bot)
-    await ptb.process_update(update)
+    # Acknowledge right away; the application processes the queued update in the background
+    await ptb.update_queue.put(update)
     return Response(status_code=HTTPStatus.OK)
 
+class ProgressiveReply:
+    """
+    Streams an answer into a Telegram chat by editing a placeholder message.
+
+    Text arriving between two edits is coalesced, and edits are sent at most every
+    `interval` seconds to stay within Telegram's edit rate limits; when Telegram asks to
+    slow down anyway, intermediate edits are skipped until the requested time has passed.
+    Answers longer than one message continue in a new message.
+    """
+
+    def __init__(self, bot, chat_id, interval=1.0, limit=MessageLimit.MAX_TEXT_LENGTH):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.limit = limit
+        self.message = None
+        self.text = ""
+        self._shown = None
+        self._next_edit = 0.0
+
+    async def start(self):
+        """Sends the placeholder message."""
+        self.message = await self.bot.send_message(chat_id=self.chat_id, text=PLACEHOLDER_TEXT)
+
+    async def append(self, text):
+        """Adds streamed text and edits the message if the throttle allows it."""
+        self.text += text
+        while len(self.text) > self.limit:
+            # Close the current message at the last space that fits and continue in a new one
+            cut = self.text.rfind(" ", 0, self.limit)
+            cut = cut if cut > 0 else self.limit
+            head, self.text = self.text[:cut], self.text[cut:].lstrip()
+            await self._edit(head, force=True)
+            self.message = await self.bot.send_message(chat_id=self.chat_id, text=self.text[:self.limit] or PLACEHOLDER_TEXT)
+            self._shown = self.text[:self.limit]
+        await self._edit(self.text)
+
+    async def finish(self):
+        """Shows the complete text."""
+        await self._edit(self.text or PLACEHOLDER_TEXT, force=True)
+
+    async def _edit(self, text, force=False):
+        if not text or text == self._shown:
+            return
+        now = time.monotonic()
+        if now < self._next_edit:
+            if not force:
+                return
+            await asyncio.sleep(self._next_edit - now)
+        try:
+            await self.message.edit_text(text)
+            self._shown = text
+        except RetryAfter as e:
+            self._next_edit = time.monotonic() + float(e.retry_after)
+            if force:
+                await self._edit(text, force=True)
+            return
+        except BadRequest as e:
+            # Raised when the text did not change
+            if "not modified" not in str(e).lower():
+                raise
+        self._next_edit = time.monotonic() + self.interval
+
+
+async def keep_typing(bot, chat_id):
+    """Shows the typing indicator until cancelled; Telegram clears it after about 5 seconds."""
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        except Exception as e:
+            logger.warning(f"Could not send the typing action to {chat_id}: {e}")
+        await asyncio.sleep(4)
+
 # Start command handler
-async def start(update, _: ContextTypes.DEFAULT_TYPE):
+async def start(update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message and create new id when the command /start is issued."""
-    # Generate a unique conversation_id
-    global conversation_id 
-    conversation_id = str(uuid.uuid4())
-   
-    await update.message.reply_text('مرحبًا بك في بوت خدمة العملاء لدينا. كيف يمكنني مساعدتك؟')
+    # Start a new conversation for this chat
+    # The session store may be backed by sqlite, so keep its I/O off the event loop
+    await asyncio.to_thread(context.bot_data["client_pool"].session_store.reset, update.effective_chat.id)
 
-ptb.add_handler(CommandHandler("start", start))
+    await update.message.reply_text('مرحبًا بك في بوت خدمة العملاء لدينا. كيف يمكنني مساعدتك؟')
 
 # Message handler
 async def handle_message(update, context):
@@ -86,11 +173,47 @@ async def handle_message(update, context):
     user_input = update.message.text
     chat_id = update.message.chat_id
     
-    # Generate a response using the conversation_id
-    response = rag_pipeline.generate_response(user_input, conversation_id=conversation_id)
-    
-    # Send a response back to the user
-    await context.bot.send_message(chat_id=chat_id, text=response)
+    # Generate a response in the conversation of this chat
+    with context.bot_data["client_pool"].lease() as pool:
+        conversation_id = await asyncio.to_thread(pool.session_store.get, chat_id)
+
+        # Send a placeholder right away and stream the response into it
+        reply = ProgressiveReply(context.bot, chat_id, interval=edit_interval)
+        await reply.start()
+        # Sending the placeholder clears the typing action, so start it afterwards
+        typing = asyncio.create_task(keep_typing(context.bot, chat_id))
+        try:
+            async for text in pool.rag_pipeline.stream_response(user_input, conversation_id=conversation_id, channel="telegram"):
+                typing.cancel()
+                await reply.append(text)
+        finally:
+            typing.cancel()
+        await reply.finish()
 
-# Register the message handler
-ptb.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+def build_application(token=telegram_api_token, request=None):
+    """
+    Builds the bot application with its handlers.
+
+    Args:
+        token (str): The bot token.
+        request (BaseRequest): Replaces the HTTP client used to call the Bot API, e.g. with
+            a local stand-in for load tests.
+    """
+    builder = (
+        Application.builder()
+        .updater(None)
+        .token(token)
+        .concurrent_updates(PerChatUpdateProcessor(concurrent_updates))
+    )
+    if request is None:
+        builder = builder.read_timeout(7).get_updates_read_timeout(42)
+    else:
+        builder = builder.request(request)
+    application = builder.build()
+    application.add_handler(CommandHandler("start", start))
+    # Register the message handler
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+# Initialize python telegram bot
+ptb = build_application()
@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows allocated for a language on its first answer; doubled as it fills, up to max_size
+INITIAL_ROWS = 64
+
+
+class _LanguageEntries:
+    """The cached answers of one language, in preallocated rows reused oldest first."""
+
+    def __init__(self, dim, capacity):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.created = np.full(capacity, -np.inf)
+        self.answers = [None] * capacity
+        self.size = 0
+        self.next = 0
+
+    def add(self, vector, answer, created_at, max_size):
+        if self.next == len(self.answers) and len(self.answers) < max_size:
+            capacity = min(max_size, 2 * len(self.answers))
+            grown = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            self.created = np.concatenate([self.created, np.full(capacity - len(self.answers), -np.inf)])
+            self.answers.extend([None] * (capacity - len(self.answers)))
+        # Once full, the next row is the oldest answer
+        row = self.next % len(self.answers)
+        self.vectors[row] = vector
+        self.created[row] = created_at
+        self.answers[row] = answer
+        self.next = row + 1
+        self.size = max(self.size, self.next)
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated answers by the embedding of the question they answer.
+
+    A lookup returns the stored answer of the most similar previous question when its cosine
+    similarity reaches the threshold, so paraphrases of an answered question skip the LLM.
+    Answers are scoped by language, expire after a time-to-live and are dropped wholesale
+    whenever the knowledge base or the prompt template changes.
+
+    The other uvicorn workers change the knowledge base too: when a watched file is given
+    (the document registry, which every ingest and delete writes to), a change of the file
+    invalidates the answers of this worker as well.
+    """
+
+    def __init__(self, threshold=0.95, max_size=2000, ttl=3600, watch_path=None, check_interval=2.0):
+        """
+        Args:
+            threshold (float): Minimum cosine similarity for a cached answer to be reused.
+            max_size (int): Maximum number of cached answers per language; the oldest are
+                replaced first.
+            ttl (float): Seconds after which a cached answer is no longer returned.
+            watch_path (str): Optional file whose changes invalidate the cache.
+            check_interval (float): Minimum seconds between two checks of the watched file.
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.watch_path = watch_path
+        self.check_interval = check_interval
+        self._entries = {}  # language -> _LanguageEntries
+        self._lock = threading.Lock()
+        self._stat = self._signature()
+        self._next_check = time.monotonic() + check_interval
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _signature(self):
+        if self.watch_path is None:
+            return None
+        try:
+            stat = os.stat(self.watch_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _check(self):
+        # Called with the lock held; drops the answers if the watched file changed
+        if self.watch_path is None or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+        signature = self._signature()
+        if signature != self._stat:
+            self._stat = signature
+            self._clear()
+            logger.info("Semantic answer cache invalidated by a knowledge base change")
+
+    def _clear(self):
+        self._entries.clear()
+        self.generation += 1
+
+    def current_generation(self):
+        """Returns the generation to pass to store for an answer about to be generated."""
+        with self._lock:
+            self._check()
+            return self.generation
+
+    def lookup(self, vector, language):
+        """
+        Finds the answer of the most similar cached question.
+
+        Args:
+            vector (list): The question embedding.
+            language (str): The language the answer must be in.
+
+        Returns:
+            str: The cached answer, or None if nothing is similar enough.
+        """
+        query = self._unit(vector)
+        with self._lock:
+            self._check()
+            entries = self._entries.get(language)
+            if entries is not None and entries.vectors.shape[1] == len(query):
+                scores = entries.vectors[:entries.size] @ query
+                # Expired rows never match
+                scores[entries.created[:entries.size] < time.time() - self.ttl] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return entries.answers[best]
+            self.misses += 1
+        return None
+
+    def store(self, vector, language, answer, generation):
+        """
+        Stores an answer unless the cache was invalidated while it was being generated.
+
+        Args:
+            vector (list): The question embedding.
+            language (str): The language of the answer.
+            answer (str): The generated answer.
+            generation (int): The cache generation read before generation started.
+        """
+        vector = self._unit(vector)
+        with self._lock:
+            self._check()
+            if generation != self.generation:
+                return
+            entries = self._entries.get(language)
+            if entries is None or entries.vectors.shape[1] != len(vector):
+                entries = self._entries[language] = _LanguageEntries(len(vector), min(INITIAL_ROWS, self.max_size))
+            entries.add(vector, answer, time.time(), self.max_size)
+
+    def invalidate(self):
+        """Drops every cached answer, e.g. after the documents or the prompt changed."""
+        with self._lock:
+            self._clear()
+        logger.info("Semantic answer cache invalidated")
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": sum(entries.size for entries in self._entries.values()),
+                "generation": self.generation,
+            }
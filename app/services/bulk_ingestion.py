@@ -0,0 +1,173 @@
+import io
+import os
+import time
+import zipfile
+import logging
+from concurrent.futures import as_completed
+from .convert_html_pipeline import ConvertHTMLPipeline
+from .chunking import chunk_stats
+
+logger = logging.getLogger(__name__)
+
+HTML_EXTENSIONS = ('.html', '.htm')
+
+
+def parse_html_page(html_bytes):
+    """
+    Parses one HTML page into sections. Runs in a worker process, so it only takes and
+    returns plain picklable data.
+
+    Args:
+        html_bytes (bytes): The UTF-8 encoded page.
+
+    Returns:
+        list: The sections produced by ConvertHTMLPipeline.iter_sections.
+    """
+    return list(ConvertHTMLPipeline().iter_sections(html_bytes.decode('utf-8')))
+
+
+def collect_html_files(uploads):
+    """
+    Expands uploaded files and zip archives into HTML pages.
+
+    Args:
+        uploads (list): (filename, bytes) pairs as uploaded.
+
+    Returns:
+        list: (filename, bytes) pairs of the HTML pages; non-HTML zip members are skipped.
+    """
+    pages = []
+    for filename, data in uploads:
+        if filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir() and member.filename.lower().endswith(HTML_EXTENSIONS):
+                        pages.append((member.filename, archive.read(member)))
+        else:
+            pages.append((filename, data))
+    return pages
+
+
+def document_name(filename):
+    """Returns the document name of an uploaded page: its file name without extension."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+class BulkIngestion:
+    """
+    Ingests many HTML pages in one job.
+
+    Pages are parsed in parallel on a process pool; as each page finishes parsing, its new
+    chunks are queued and handed to one BatchIngestionWriter in waves that span pages, so
+    small pages do not each pay for a separate embedding request. A page is finished (metadata updates and stale
+    chunk deletes) once all of its chunks are written, and gets its own entry in the report.
+    """
+
+    def __init__(self, pipeline, process_pool):
+        """
+        Args:
+            pipeline (DocumentsPipeline): The pipeline used to embed and write chunks.
+            process_pool (concurrent.futures.ProcessPoolExecutor): Pool used for parsing.
+        """
+        self.pipeline = pipeline
+        self.process_pool = process_pool
+
+    def run(self, pages, active, date, progress=None):
+        """
+        Args:
+            pages (list): (filename, bytes) pairs of the HTML pages.
+            active (bool): The active flag stored with every document.
+            date (str): The date stored with every document.
+            progress (callable): Optional progress(stage, done=None, total=None) callback.
+
+        Returns:
+            dict: A per-file report and the overall throughput.
+        """
+        report = progress or (lambda stage, done=None, total=None: None)
+        started = time.perf_counter()
+        converter = ConvertHTMLPipeline(chunker=self.pipeline.chunker)
+        chunk_texts = []
+        writer = self.pipeline.create_writer()
+        files = {}
+        buffer = []
+        embedded = 0
+
+        def flush(documents):
+            nonlocal embedded
+            owners = {doc_owner for doc_owner, _ in documents}
+            try:
+                self.pipeline.write_documents([document for _, document in documents], writer=writer)
+            except Exception as e:
+                for owner in owners:
+                    files[owner]["status"] = "failed"
+                    files[owner]["error"] = str(e)
+                return
+            embedded += len(documents)
+            report("embedded", done=embedded)
+
+        futures = {}
+        for index, (filename, data) in enumerate(pages):
+            name = document_name(filename)
+            if any(entry["name"] == name for entry in files.values()):
+                files[index] = {"file": filename, "name": name, "status": "failed",
+                                   "error": "Duplicate document name in this upload"}
+                continue
+            files[index] = {"file": filename, "name": name, "status": "parsing", "error": None}
+            futures[self.process_pool.submit(parse_html_page, data)] = index
+
+        parsed = 0
+        report("parsed", done=0, total=len(futures))
+        for future in as_completed(futures):
+            index = futures[future]
+            entry = files[index]
+            parsed += 1
+            report("parsed", done=parsed)
+            try:
+                metadata = {"name": entry["name"], "active": active, "date": date}
+                sections = future.result()
+                documents = list(converter.iter_documents(sections, metadata))
+                plan = self.pipeline.plan_ingestion(documents, metadata)
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+                continue
+            chunk_texts.extend(document.page_content for document in documents)
+            entry.update(status="embedding", plan=plan, metadata=metadata)
+            report("chunked", done=parsed, total=len(futures))
+            buffer.extend((index, document) for document in plan["new_documents"])
+            # Flush one full wave of concurrent embedding requests at a time
+            wave = writer.batch_size * writer.concurrency
+            while len(buffer) >= wave:
+                flush(buffer[:wave])
+                del buffer[:wave]
+        if buffer:
+            flush(buffer)
+        report("chunked", done=len(futures), total=len(futures))
+        report("embedded", done=embedded, total=embedded)
+
+        written = 0
+        for entry in files.values():
+            plan = entry.pop("plan", None)
+            metadata = entry.pop("metadata", None)
+            if entry["status"] != "embedding":
+                continue
+            try:
+                entry.update(self.pipeline.finish_ingestion(plan, metadata), status="succeeded")
+                written += 1
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+            report("written", done=written)
+        report("written", done=written, total=written)
+
+        elapsed = time.perf_counter() - started
+        sizes = chunk_stats(chunk_texts)
+        logger.info(f"Chunked {len(files)} files: {sizes}")
+        succeeded = sum(1 for entry in files.values() if entry["status"] == "succeeded")
+        return {
+            "files": list(files.values()),
+            "succeeded": succeeded,
+            "failed": len(files) - succeeded,
+            "seconds": round(elapsed, 2),
+            "files_per_second": round(len(files) / elapsed, 2) if elapsed else None,
+            "chunk_sizes": sizes,
+            "writer": writer.summary(),
+        }
@@ -0,0 +1,198 @@
+import re
+import logging
+from .text_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?؟。])\s+|\n+")
+
+
+def _row_text(row):
+    return " | ".join(cell for cell in row if cell)
+
+
+class SectionChunker:
+    """
+    Splits the header sections produced by ConvertHTMLPipeline into plain-text chunks of
+    about `target_tokens` each.
+
+    Sections are rendered as one line per paragraph, list item or table row instead of
+    indented JSON, and every chunk starts with its section header. Long paragraphs are split
+    at sentence boundaries, consecutive text chunks share `overlap_tokens` of trailing lines,
+    and tables are split into row groups that each repeat the header row. Sections smaller
+    than `min_tokens` are merged with the following ones while the result fits the target.
+    """
+
+    def __init__(self, target_tokens=300, overlap_tokens=40, min_tokens=60):
+        """
+        Args:
+            target_tokens (int): Target estimated tokens per chunk.
+            overlap_tokens (int): Estimated tokens of text repeated at the start of the next
+                chunk of the same section.
+            min_tokens (int): Sections below this size are merged with their neighbours.
+        """
+        self.target_tokens = target_tokens
+        self.overlap_tokens = min(overlap_tokens, target_tokens // 2)
+        self.min_tokens = min_tokens
+
+    def _split_text(self, text):
+        """Splits a paragraph longer than the target into sentence-aligned pieces."""
+        if estimate_tokens(text) <= self.target_tokens:
+            return [text]
+        pieces = []
+        current = ""
+        for sentence in _SENTENCE_END_RE.split(text):
+            if not sentence:
+                continue
+            candidate = f"{current} {sentence}".strip()
+            if current and estimate_tokens(candidate) > self.target_tokens:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+        # A single sentence may still be too long; fall back to splitting on words
+        result = []
+        for piece in pieces:
+            words = piece.split()
+            current = []
+            for word in words:
+                if current and estimate_tokens(" ".join(current + [word])) > self.target_tokens:
+                    result.append(" ".join(current))
+                    current = []
+                current.append(word)
+            if current:
+                result.append(" ".join(current))
+        return result
+
+    def _units(self, section):
+        """
+        Yields the content of a section as (kind, text) units: 'text' for paragraph pieces
+        and list items, 'table' for a pre-grouped run of table rows.
+        """
+        for element in section.get("text", []):
+            content = element.get("content") if isinstance(element, dict) else element
+            kind = element.get("type") if isinstance(element, dict) else None
+            if kind == "table" and isinstance(content, list):
+                yield from self._table_units(content)
+            elif isinstance(content, list):
+                for item in content:
+                    if item:
+                        yield from (("text", f"- {piece}") for piece in self._split_text(str(item)))
+            elif content:
+                yield from (("text", piece) for piece in self._split_text(str(content)))
+
+    def _table_units(self, rows):
+        rows = [_row_text(row) for row in rows if any(row)]
+        if not rows:
+            return
+        header, body = rows[0], rows[1:]
+        if not body:
+            yield "table", header
+            return
+        budget = self.target_tokens - estimate_tokens(header)
+        group = []
+        used = 0
+        for row in body:
+            tokens = estimate_tokens(row)
+            if group and used + tokens > budget:
+                yield "table", "\n".join([header] + group)
+                group, used = [], 0
+            group.append(row)
+            used += tokens
+        if group:
+            yield "table", "\n".join([header] + group)
+
+    def _chunk_section(self, section):
+        header = section.get("header")
+        header = header if header and header != "No header" else ""
+        header_tokens = estimate_tokens(header)
+        chunks = []
+        lines = []
+        used = header_tokens
+
+        def flush():
+            if lines:
+                chunks.append("\n".join(([header] if header else []) + lines))
+
+        for kind, text in self._units(section):
+            tokens = estimate_tokens(text)
+            if kind == "table":
+                # Row groups are already sized and carry their own header row; short text
+                # before a table, such as its caption, stays with the first group
+                if not lines or used + tokens > self.target_tokens:
+                    flush()
+                    lines = []
+                lines.append(text)
+                flush()
+                lines, used = [], header_tokens
+                continue
+            if lines and used + tokens > self.target_tokens:
+                flush()
+                # Carry the trailing lines into the next chunk as overlap
+                overlap = []
+                overlap_used = 0
+                for line in reversed(lines):
+                    line_tokens = estimate_tokens(line)
+                    if overlap_used + line_tokens > self.overlap_tokens:
+                        break
+                    overlap.insert(0, line)
+                    overlap_used += line_tokens
+                lines, used = overlap, header_tokens + overlap_used
+            lines.append(text)
+            used += tokens
+        flush()
+        return chunks
+
+    def chunk(self, sections):
+        """
+        Chunks the sections of one document.
+
+        Args:
+            sections (iterable): Sections with a 'header' and a list of 'text' elements.
+
+        Yields:
+            str: The plain-text chunks, in document order.
+        """
+        # The last chunk of the previous section, held back in case it can be merged
+        pending = ""
+        for section in sections:
+            chunks = self._chunk_section(section)
+            if not chunks:
+                continue
+            first = chunks[0]
+            if pending and (
+                min(estimate_tokens(pending), estimate_tokens(first)) < self.min_tokens
+                and estimate_tokens(pending) + estimate_tokens(first) <= self.target_tokens
+            ):
+                chunks[0] = f"{pending}\n\n{first}"
+            elif pending:
+                yield pending
+            yield from chunks[:-1]
+            pending = chunks[-1]
+        if pending:
+            yield pending
+
+
+def chunk_stats(chunks):
+    """
+    Summarizes chunk sizes in estimated tokens.
+
+    Args:
+        chunks (list): The chunk texts.
+
+    Returns:
+        dict: The number of chunks and the total, min, median, mean and max token counts.
+    """
+    sizes = sorted(estimate_tokens(chunk) for chunk in chunks)
+    if not sizes:
+        return {"chunks": 0, "total_tokens": 0, "min": 0, "median": 0, "mean": 0, "max": 0}
+    return {
+        "chunks": len(sizes),
+        "total_tokens": sum(sizes),
+        "min": sizes[0],
+        "median": sizes[len(sizes) // 2],
+        "mean": round(sum(sizes) / len(sizes), 1),
+        "max": sizes[-1],
+    }
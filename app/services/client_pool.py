@@ -0,0 +1,562 @@
+import os
+import inspect
+import asyncio
+import logging
+import multiprocessing
+from contextlib import contextmanager
+import cohere
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from groq import AsyncGroq
+from dotenv import load_dotenv
+from fastapi import Request
+from .vectorstore_manager import DocumentsPipeline
+from .vector_backends import build_vector_backend
+from .chunking import SectionChunker
+from .session_store import build_session_store
+from .document_registry import DocumentRegistry
+from .template_registry import TemplateRegistry, DEFAULT_TEMPLATE_PATH
+from .rag_pipeline import RAGPipeline
+from .embedding_cache import EmbeddingCache
+from .answer_cache import SemanticAnswerCache
+from .context_builder import ContextBuilder
+from .rerankers import build_reranker
+from .lexical_index import LexicalIndex
+from .ingestion_jobs import IngestionJobManager, JobStore
+
+logger = logging.getLogger(__name__)
+
+ENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../variables/.env'))
+
+_VECTOR_SETTINGS = (
+    "vector_backend", "weaviate_cluster_URL", "weaviate_api_key", "weaviate_collection_name",
+    "local_vector_path", "local_vector_dtype", "local_vector_nprobe",
+)
+_EMBEDDING_SETTINGS = (
+    "embedding_backend", "embedding_model_name", "hugging_api_key", "local_embedding_runtime",
+    "local_embedding_model_file", "local_embedding_quantize", "local_embedding_batch_size",
+    "local_embedding_max_wait_ms", "local_embedding_threads",
+)
+
+# Components a pool takes over from the pool it replaces when none of the settings they
+# are built from changed, so a configuration update only rebuilds what it affects
+REUSABLE_COMPONENTS = {
+    "ingestion_jobs": ("ingestion_workers", "ingestion_jobs_path"),
+    "session_store": ("session_store", "session_store_path", "session_max_chats", "session_ttl"),
+    "document_registry": ("document_registry_path",),
+    "vector_backend": _VECTOR_SETTINGS,
+    "embedder": _EMBEDDING_SETTINGS,
+    "cohere_client": ("cohere_api_key",),
+    "groq_client": ("groq_api_key",),
+    "executor": ("embedding_executor_workers",),
+    "embedding_cache": ("embedding_model_name", "embedding_cache_size", "embedding_cache_ttl", "embedding_cache_path"),
+    "answer_cache": (
+        ("answer_cache_enabled", "answer_cache_threshold", "answer_cache_size", "answer_cache_ttl",
+         "answer_cache_check_seconds", "document_registry_path")
+        + _VECTOR_SETTINGS + _EMBEDDING_SETTINGS
+    ),
+    "lexical_index": ("retrieval_mode",) + _VECTOR_SETTINGS,
+    "parse_pool": ("bulk_parse_processes",),
+}
+
+
+def load_settings(dotenv_path=ENV_PATH, overrides=None):
+    """
+    Loads the environment file and returns the settings needed to build the client pool.
+
+    Args:
+        dotenv_path (str): The path to the .env file.
+        overrides (dict): Environment variables that take precedence over the environment,
+            used to build the settings of a configuration update before applying it.
+
+    Returns:
+        dict: The settings read from the environment.
+    """
+    load_dotenv(dotenv_path=dotenv_path)
+    env = {**os.environ, **(overrides or {})}
+    # Files written at runtime, kept out of the source tree
+    data_dir = os.path.abspath(env.get('DATA_DIR') or os.path.join(os.path.dirname(ENV_PATH), '..', 'data'))
+    return {
+        "data_dir": data_dir,
+        "embedding_model_name": env.get('EMBEDDING_MODEL_NAME'),
+        "hugging_api_key": env.get('HUGGING_FACE_API_KEY'),
+        "groq_api_key": env.get('GROQ_API_KEY'),
+        "cohere_api_key": env.get('COHERE_API_KEY'),
+        "weaviate_cluster_URL": env.get('WEAVIATE_CLUSTER_URL'),
+        "weaviate_api_key": env.get('WEAVIATE_API_KEY'),
+        "weaviate_collection_name": env.get('WEAVIATE_COLLECTION_NAME'),
+        "vector_backend": env.get('VECTOR_BACKEND', 'weaviate'),
+        "local_vector_path": env.get('LOCAL_VECTOR_PATH', os.path.join(data_dir, 'vectors')),
+        "local_vector_dtype": env.get('LOCAL_VECTOR_DTYPE', 'float32'),
+        "local_vector_nprobe": int(env.get('LOCAL_VECTOR_NPROBE', '8')),
+        "embedding_backend": env.get('EMBEDDING_BACKEND', 'huggingface-api'),
+        "local_embedding_runtime": env.get('LOCAL_EMBEDDING_RUNTIME', 'torch'),
+        "local_embedding_model_file": env.get('LOCAL_EMBEDDING_MODEL_FILE') or None,
+        "local_embedding_quantize": env.get('LOCAL_EMBEDDING_QUANTIZE', 'false').lower() == 'true',
+        "local_embedding_batch_size": int(env.get('LOCAL_EMBEDDING_BATCH_SIZE', '32')),
+        "local_embedding_max_wait_ms": float(env.get('LOCAL_EMBEDDING_MAX_WAIT_MS', '2')),
+        "local_embedding_threads": int(env.get('LOCAL_EMBEDDING_THREADS', '0')) or None,
+        "embedding_executor_workers": int(env.get('EMBEDDING_EXECUTOR_WORKERS', '8')),
+        "embedding_cache_size": int(env.get('EMBEDDING_CACHE_SIZE', '10000')),
+        "embedding_cache_ttl": float(env.get('EMBEDDING_CACHE_TTL', '86400')),
+        "embedding_cache_path": env.get('EMBEDDING_CACHE_PATH') or None,
+        "answer_cache_enabled": env.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true',
+        "answer_cache_threshold": float(env.get('ANSWER_CACHE_THRESHOLD', '0.95')),
+        "answer_cache_size": int(env.get('ANSWER_CACHE_SIZE', '2000')),
+        "answer_cache_ttl": float(env.get('ANSWER_CACHE_TTL', '3600')),
+        "answer_cache_check_seconds": float(env.get('ANSWER_CACHE_CHECK_SECONDS', '2')),
+        "context_token_budget": int(env.get('CONTEXT_TOKEN_BUDGET', '3000')),
+        "retrieval_candidates": int(env.get('RETRIEVAL_CANDIDATES', '20')),
+        "retrieval_top_k": int(env.get('RETRIEVAL_TOP_K', '20')),
+        "reranker": env.get('RERANKER', 'none'),
+        "reranker_model": env.get('RERANKER_MODEL') or None,
+        "retrieval_mode": env.get('RETRIEVAL_MODE', 'vector'),
+        "lexical_index_refresh_seconds": float(env.get('LEXICAL_INDEX_REFRESH_SECONDS', '0')),
+        "ingestion_workers": int(env.get('INGESTION_WORKERS', '2')),
+        # Job statuses shared by the uvicorn workers; empty to keep them in memory (one worker only)
+        "ingestion_jobs_path": env.get('INGESTION_JOBS_PATH', os.path.join(data_dir, 'jobs.sqlite3')) or None,
+        "embed_batch_size": int(env.get('EMBED_BATCH_SIZE', '32')),
+        "embed_max_batch_size": int(env.get('EMBED_MAX_BATCH_SIZE', '128')),
+        "embed_concurrency": int(env.get('EMBED_CONCURRENCY', '4')),
+        "embed_max_retries": int(env.get('EMBED_MAX_RETRIES', '5')),
+        "chunk_target_tokens": int(env.get('CHUNK_TARGET_TOKENS', '300')),
+        "chunk_overlap_tokens": int(env.get('CHUNK_OVERLAP_TOKENS', '40')),
+        "chunk_min_tokens": int(env.get('CHUNK_MIN_TOKENS', '60')),
+        "bulk_parse_processes": int(env.get('BULK_PARSE_PROCESSES', '0')) or os.cpu_count(),
+        "document_registry_path": env.get('DOCUMENT_REGISTRY_PATH', os.path.join(data_dir, 'documents.sqlite3')),
+        "prompt_template_path": env.get('PROMPT_TEMPLATE_PATH', DEFAULT_TEMPLATE_PATH),
+        "prompt_template_check_seconds": float(env.get('PROMPT_TEMPLATE_CHECK_SECONDS', '2')),
+        "prompt_template_history": int(env.get('PROMPT_TEMPLATE_HISTORY', '50')),
+        "prompt_template_state_dir": env.get('PROMPT_TEMPLATE_STATE_DIR', os.path.join(data_dir, 'prompt_template')),
+        "config_check_seconds": float(env.get('CONFIG_CHECK_SECONDS', '5')),
+        "config_drain_timeout": float(env.get('CONFIG_DRAIN_TIMEOUT', '60')),
+        "session_store": env.get('SESSION_STORE', 'memory'),
+        "session_store_path": env.get('SESSION_STORE_PATH') or None,
+        "session_max_chats": int(env.get('SESSION_MAX_CHATS', '10000')),
+        "session_ttl": float(env.get('SESSION_TTL', '86400')),
+        "request_log_sample_rate": float(env.get('REQUEST_LOG_SAMPLE_RATE', '0')),
+        "request_coalescing": env.get('REQUEST_COALESCING', 'true').lower() == 'true',
+    }
+
+
+async def _close_quietly(client, name):
+    close = getattr(client, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.warning(f"Error closing {name} client: {e}")
+
+
+class ClientPool:
+    """
+    Process-wide holder of the vector backend and the Cohere, Groq and embedding clients.
+
+    The pool is created once in the application lifespan and shared by the chat, dashboard
+    and telegram routers, so no request pays for opening connections or re-reading the
+    prompt template. Chat traffic goes through the async clients; the blocking backend
+    methods serve the dashboard and ingestion code, which runs in worker threads.
+
+    When the configuration changes, ConfigService builds a new pool and retires this one.
+    The new pool takes over every component whose settings did not change (see
+    REUSABLE_COMPONENTS) and only builds the others; each component is closed by the last
+    pool using it. Requests and ingestion jobs hold a lease on the pool they started with,
+    so it is only closed once they have finished.
+    """
+
+    # Replaced together with the client factories below to run the app against other backends
+    documents_pipeline_class = DocumentsPipeline
+
+    def __init__(self, settings, previous=None):
+        """
+        Args:
+            settings (dict): The settings from load_settings.
+            previous (ClientPool): The pool this one replaces, whose unaffected components
+                are reused; everything is built if None.
+        """
+        self.settings = settings
+        self.active_requests = 0
+        self.active_jobs = 0
+        self._previous = previous
+        # Names of the components this pool closes
+        self._owned = set()
+        self.documents_pipeline = None
+        self.embedder = None
+        self.rag_pipeline = None
+        self.cohere_client = None
+        self.groq_client = None
+        self.vector_backend = None
+        self.executor = None
+        self.embedding_cache = None
+        self.answer_cache = None
+        self.lexical_index = None
+        self._refresh_task = None
+        self.ingestion_jobs = None
+        self.parse_pool = None
+        self.session_store = None
+        self.document_registry = None
+        self.template_registry = None
+
+    def _reusable(self, name):
+        # The component of the previous pool, if none of its settings changed
+        previous = self._previous
+        if previous is None or any(self.settings[key] != previous.settings[key] for key in REUSABLE_COMPONENTS[name]):
+            return None
+        return getattr(previous, name)
+
+    def _component(self, name, build):
+        component = self._reusable(name)
+        if component is None:
+            component = build()
+            self._owned.add(name)
+        return component
+
+    async def startup(self):
+        """Opens all clients and warms them up."""
+        os.makedirs(self.settings["data_dir"], exist_ok=True)
+        if self.settings["retrieval_mode"] == "hybrid":
+            self.lexical_index = self._component("lexical_index", LexicalIndex)
+        self.document_registry = self._component(
+            "document_registry", lambda: DocumentRegistry(self.settings["document_registry_path"]))
+        self.vector_backend = self._component("vector_backend", self.init_vector_backend)
+        if "vector_backend" in self._owned:
+            await self.vector_backend.connect()
+        self.embedder = self._reusable("embedder")
+        self.documents_pipeline = self.documents_pipeline_class(
+            collection_name=self.settings["weaviate_collection_name"],
+            embedding_model_name=self.settings["embedding_model_name"],
+            cluster_URL=self.settings["weaviate_cluster_URL"],
+            weaviate_api_key=self.settings["weaviate_api_key"],
+            hugging_api_key=self.settings["hugging_api_key"],
+            lexical_index=self.lexical_index,
+            writer_options={
+                "batch_size": self.settings["embed_batch_size"],
+                "max_batch_size": self.settings["embed_max_batch_size"],
+                "concurrency": self.settings["embed_concurrency"],
+                "max_retries": self.settings["embed_max_retries"],
+            },
+            chunker=SectionChunker(
+                target_tokens=self.settings["chunk_target_tokens"],
+                overlap_tokens=self.settings["chunk_overlap_tokens"],
+                min_tokens=self.settings["chunk_min_tokens"],
+            ),
+            registry=self.document_registry,
+            backend=self.vector_backend,
+            embedding_backend=self.settings["embedding_backend"],
+            embedding_options=self.embedding_options(),
+            embedder=self.embedder,
+        )
+        if self.embedder is None:
+            self.embedder = self.documents_pipeline.embedder
+            self._owned.add("embedder")
+        self.cohere_client = self._component("cohere_client", self.init_cohere_client)
+        self.groq_client = self._component("groq_client", self.init_groq_client)
+        # Bounded executor for the embedding client, which has no async API
+        self.executor = self._component("executor", lambda: ThreadPoolExecutor(
+            max_workers=self.settings["embedding_executor_workers"],
+            thread_name_prefix="embedder"
+        ))
+        self.embedding_cache = self._component("embedding_cache", lambda: EmbeddingCache(
+            model_name=self.settings["embedding_model_name"],
+            max_size=self.settings["embedding_cache_size"],
+            ttl=self.settings["embedding_cache_ttl"],
+            persist_path=self.settings["embedding_cache_path"],
+        ))
+        if self.settings["answer_cache_enabled"]:
+            self.answer_cache = self._component("answer_cache", lambda: SemanticAnswerCache(
+                threshold=self.settings["answer_cache_threshold"],
+                max_size=self.settings["answer_cache_size"],
+                ttl=self.settings["answer_cache_ttl"],
+                # Every ingest and delete, by any worker, writes to the document registry
+                watch_path=self.settings["document_registry_path"],
+                check_interval=self.settings["answer_cache_check_seconds"],
+            ))
+        self.template_registry = TemplateRegistry(
+            self.settings["prompt_template_path"],
+            check_interval=self.settings["prompt_template_check_seconds"],
+            max_history=self.settings["prompt_template_history"],
+            state_dir=self.settings["prompt_template_state_dir"],
+        )
+        # Answers produced with an older template are stale, including after an update
+        # made by another worker
+        self.template_registry.on_change(lambda version: self.invalidate_answers())
+        self.rag_pipeline = RAGPipeline(
+            vector_store=self.vector_backend,
+            embedder=self.embedder,
+            cohere_client=self.cohere_client,
+            executor=self.executor,
+            embedding_cache=self.embedding_cache,
+            answer_cache=self.answer_cache,
+            context_builder=ContextBuilder(token_budget=self.settings["context_token_budget"]),
+            reranker=build_reranker(self.settings["reranker"], self.settings["reranker_model"]),
+            candidates=self.settings["retrieval_candidates"],
+            k=self.settings["retrieval_top_k"],
+            lexical_index=self.lexical_index,
+            template_registry=self.template_registry,
+            log_sample_rate=self.settings["request_log_sample_rate"],
+            coalesce=self.settings["request_coalescing"],
+        )
+        self.ingestion_jobs = self._component("ingestion_jobs", lambda: IngestionJobManager(
+            workers=self.settings["ingestion_workers"],
+            store=JobStore(self.settings["ingestion_jobs_path"]) if self.settings["ingestion_jobs_path"] else None,
+        ))
+        if "ingestion_jobs" in self._owned:
+            self.ingestion_jobs.start()
+        # Spawned rather than forked: forking a process that holds gRPC channels is unsafe
+        self.parse_pool = self._component("parse_pool", lambda: ProcessPoolExecutor(
+            max_workers=self.settings["bulk_parse_processes"],
+            mp_context=multiprocessing.get_context("spawn")
+        ))
+        # Conversation ids of the Telegram chats
+        self.session_store = self._component("session_store", lambda: build_session_store(
+            self.settings["session_store"],
+            path=self.settings["session_store_path"],
+            max_size=self.settings["session_max_chats"],
+            ttl=self.settings["session_ttl"],
+        ))
+        # The previous pool is only needed to pick the reused components
+        self._previous = None
+        await self.warm_up()
+        if "document_registry" in self._owned and len(self.document_registry) == 0:
+            # First start with an existing collection
+            await self.rebuild_document_registry()
+        if self.lexical_index is not None:
+            if "lexical_index" in self._owned:
+                await self.rebuild_lexical_index()
+            if self.settings["lexical_index_refresh_seconds"] > 0:
+                self._refresh_task = asyncio.create_task(self._refresh_lexical_index())
+
+    def embedding_options(self):
+        """Returns the options of the local embedding backend."""
+        if self.settings["embedding_backend"] != "local":
+            return {}
+        return {
+            "runtime": self.settings["local_embedding_runtime"],
+            "model_file": self.settings["local_embedding_model_file"],
+            "quantize": self.settings["local_embedding_quantize"],
+            "batch_size": self.settings["local_embedding_batch_size"],
+            "max_wait_ms": self.settings["local_embedding_max_wait_ms"],
+            "threads": self.settings["local_embedding_threads"],
+        }
+
+    def init_vector_backend(self):
+        return build_vector_backend(
+            self.settings["vector_backend"],
+            collection_name=self.settings["weaviate_collection_name"],
+            cluster_URL=self.settings["weaviate_cluster_URL"],
+            api_key=self.settings["weaviate_api_key"],
+            path=self.settings["local_vector_path"],
+            dtype=self.settings["local_vector_dtype"],
+            nprobe=self.settings["local_vector_nprobe"],
+        )
+
+    def init_cohere_client(self):
+        return cohere.AsyncClient(api_key=self.settings["cohere_api_key"])
+
+    def init_groq_client(self):
+        return AsyncGroq(api_key=self.settings["groq_api_key"])
+
+    async def rebuild_lexical_index(self):
+        """Rebuilds the lexical index from the collection in a worker thread."""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.documents_pipeline.rebuild_lexical_index)
+        except Exception as e:
+            logger.warning(f"Lexical index rebuild failed: {e}")
+
+    async def rebuild_document_registry(self):
+        """Rebuilds the document registry from the collection in a worker thread."""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.documents_pipeline.rebuild_registry)
+        except Exception as e:
+            logger.warning(f"Document registry rebuild failed: {e}")
+
+    async def _refresh_lexical_index(self):
+        # Picks up documents ingested by other worker processes
+        while True:
+            await asyncio.sleep(self.settings["lexical_index_refresh_seconds"])
+            await self.rebuild_lexical_index()
+
+    async def warm_up(self):
+        """
+        Sends a first request through the vector store and the embedding endpoint so the first user
+        does not pay for connection setup or a cold Inference API model.
+        """
+        try:
+            await self.vector_backend.is_ready()
+            await self.rag_pipeline._embed_query("warm up")
+            logger.info("Client pool warmed up")
+        except Exception as e:
+            logger.warning(f"Client pool warm-up failed: {e}")
+
+    async def health(self):
+        """
+        Checks the pooled clients.
+
+        Returns:
+            dict: The status of every client and an overall status.
+        """
+        checks = {}
+        backend = self.vector_backend.name
+        try:
+            checks[backend] = bool(await self.vector_backend.is_ready())
+        except Exception:
+            checks[backend] = False
+        checks["cohere"] = self.cohere_client is not None
+        checks["groq"] = self.groq_client is not None
+        checks["embedder"] = self.embedder is not None
+        checks["status"] = "ok" if all(checks.values()) else "degraded"
+        if self.vector_backend is not None:
+            checks["vector_store"] = self.vector_backend.stats()
+        if self.embedding_cache is not None:
+            checks["embedding_cache"] = self.embedding_cache.stats()
+        if self.answer_cache is not None:
+            checks["answer_cache"] = self.answer_cache.stats()
+        if self.lexical_index is not None:
+            checks["lexical_index"] = {"chunks": len(self.lexical_index)}
+        if self.session_store is not None:
+            checks["sessions"] = self.session_store.stats()
+        return checks
+
+    async def validate(self):
+        """
+        Checks that the services of the components this pool built are reachable, before the
+        pool takes traffic; the components taken over from the previous pool already serve it.
+
+        Raises:
+            ValueError: If the vector store is not ready, the collection does not exist, the
+                embedding endpoint does not return a vector, or the Cohere or Groq API key
+                is rejected.
+        """
+        if "vector_backend" in self._owned:
+            if not await self.vector_backend.is_ready():
+                raise ValueError(f"The {self.vector_backend.name} vector store is not ready")
+            if not await self.vector_backend.exists():
+                collection_name = self.settings["weaviate_collection_name"]
+                raise ValueError(f"The {self.vector_backend.name} collection {collection_name} does not exist")
+        if "embedder" in self._owned:
+            loop = asyncio.get_running_loop()
+            try:
+                vector = await loop.run_in_executor(self.executor, self.embedder.embed_query, "test")
+            except Exception as e:
+                raise ValueError(f"Embedding model check failed: {e}")
+            if not isinstance(vector, list):
+                raise ValueError(f"Embedding model check failed: {str(vector)[:200]}")
+        if "cohere_client" in self._owned:
+            # Checks the key without generating anything
+            try:
+                response = await self.cohere_client.check_api_key()
+            except Exception as e:
+                raise ValueError(f"Cohere API key check failed: {e}")
+            if not getattr(response, "valid", False):
+                raise ValueError("The Cohere API key is not valid")
+        if "groq_client" in self._owned:
+            try:
+                await self.groq_client.models.list()
+            except Exception as e:
+                raise ValueError(f"Groq API key check failed: {e}")
+
+    def take_over(self, previous):
+        """Takes ownership of the components shared with the pool this one replaces."""
+        for name in REUSABLE_COMPONENTS:
+            component = getattr(self, name)
+            if component is not None and name in previous._owned and component is getattr(previous, name):
+                previous._owned.discard(name)
+                self._owned.add(name)
+
+    @contextmanager
+    def lease(self):
+        """Marks a request as using this pool until the block exits."""
+        self.active_requests += 1
+        try:
+            yield self
+        finally:
+            self.active_requests -= 1
+
+    def submit_job(self, name, func, on_success=None):
+        """
+        Queues an ingestion job that runs on the components of this pool; the pool is not
+        closed before the job has ended, even once it has been replaced.
+
+        Args:
+            name (str): A label shown in the job status, e.g. the document name.
+            func (callable): Blocking callable run in a thread as func(job).
+            on_success (callable): Optional callback run on the event loop with the job
+                after it succeeded.
+
+        Returns:
+            IngestionJob: The queued job.
+        """
+        def release(job):
+            self.active_jobs -= 1
+
+        job = self.ingestion_jobs.submit(name, func, on_success=on_success, on_done=release)
+        self.active_jobs += 1
+        return job
+
+    async def drain(self, timeout=60.0, poll=0.1):
+        """
+        Waits until no request holds a lease, or until the timeout expires, and then until
+        the ingestion jobs submitted to this pool have ended, however long they run.
+
+        Returns:
+            bool: True if the requests drained before the timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        drained = True
+        while self.active_requests > 0:
+            if loop.time() >= deadline:
+                logger.warning(f"Closing the client pool with {self.active_requests} requests still running")
+                drained = False
+                break
+            await asyncio.sleep(poll)
+        # The jobs write through this pool's registry and clients until they end
+        while self.active_jobs > 0:
+            await asyncio.sleep(poll)
+        return drained
+
+    async def close(self):
+        """Closes all pooled clients, except the components shared with another pool."""
+        owned = self._owned
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        if "ingestion_jobs" in owned:
+            await self.ingestion_jobs.stop()
+        if "vector_backend" in owned:
+            await _close_quietly(self.vector_backend, "vector store")
+        if "embedder" in owned:
+            await _close_quietly(self.embedder, "embedding")
+        if "cohere_client" in owned:
+            await _close_quietly(self.cohere_client, "cohere")
+        if "groq_client" in owned:
+            await _close_quietly(self.groq_client, "groq")
+        if "executor" in owned:
+            self.executor.shutdown(wait=False)
+        if "embedding_cache" in owned:
+            self.embedding_cache.close()
+        if "parse_pool" in owned:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+        if "session_store" in owned:
+            self.session_store.close()
+        if "document_registry" in owned:
+            self.document_registry.close()
+        self._owned = set()
+        logger.info("Client pool closed")
+
+    def invalidate_answers(self):
+        """Drops cached answers after the knowledge base or the prompt template changed."""
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
+
+
+def get_client_pool(request: Request):
+    """
+    FastAPI dependency returning the current pool, leased for the duration of the request.
+    Streaming responses outlive the dependency and take their own lease.
+    """
+    with request.app.state.client_pool.lease() as pool:
+        yield pool
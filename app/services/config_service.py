@@ -0,0 +1,196 @@
+import os
+import asyncio
+import logging
+from dotenv import dotenv_values
+from .client_pool import ClientPool, ENV_PATH, load_settings
+from .file_utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Settings that can be changed at runtime, by their update-env parameter name
+UPDATABLE_SETTINGS = {
+    "embedding_model_name": "EMBEDDING_MODEL_NAME",
+    "hugging_api_key": "HUGGING_FACE_API_KEY",
+    "weaviate_cluster_URL": "WEAVIATE_CLUSTER_URL",
+    "weaviate_api_key": "WEAVIATE_API_KEY",
+    "weaviate_collection_name": "WEAVIATE_COLLECTION_NAME",
+    "groq_api_key": "GROQ_API_KEY",
+    "cohere_api_key": "COHERE_API_KEY",
+}
+
+
+def _write_env(path, updates):
+    # Replace the updated keys in place and keep every other line as it is
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            lines = file.read().splitlines()
+    remaining = dict(updates)
+    for i, line in enumerate(lines):
+        key = line.split('=', 1)[0].strip()
+        if key in remaining:
+            lines[i] = f"{key}={remaining.pop(key)}"
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+    atomic_write(path, "\n".join(lines) + "\n")
+
+
+class ConfigService:
+    """
+    Owns the current ClientPool and swaps it when the configuration changes.
+
+    An update is applied by building a new pool from the updated settings, which takes over
+    the components of the old pool that the changed settings do not affect, and validating
+    the rebuilt ones against the real services. Only then is the .env file rewritten and the
+    new pool published; requests and ingestion jobs already running finish on the old pool,
+    which is closed once they have ended. A failed update leaves both the file and the running pool as they
+    were. Other uvicorn workers notice the rewritten .env file and swap their own pools; they
+    only pick up the settings an update can change, so variables set in the real environment
+    keep overriding the other keys of the file.
+    """
+
+    def __init__(self, state, env_path=ENV_PATH, check_interval=None, drain_timeout=None, pool_class=ClientPool):
+        """
+        Args:
+            state: The FastAPI app state; the current pool is published as state.client_pool.
+            env_path (str): The .env file.
+            check_interval (float): Seconds between checks of the .env file for updates made
+                by other workers; 0 disables the check. Defaults to CONFIG_CHECK_SECONDS.
+            drain_timeout (float): Maximum seconds to wait for requests on a retired pool.
+                Defaults to CONFIG_DRAIN_TIMEOUT.
+            pool_class (type): The ClientPool class to build pools with.
+        """
+        self.state = state
+        self.env_path = env_path
+        self.check_interval = check_interval
+        self.drain_timeout = drain_timeout
+        self.pool_class = pool_class
+        self.pool = None
+        self._lock = asyncio.Lock()
+        self._listeners = []
+        self._env_signature = None
+        self._watch_task = None
+        self._retiring = {}  # retire task -> pool
+
+    def on_swap(self, callback):
+        """Registers a callback run with the new pool after every swap."""
+        self._listeners.append(callback)
+
+    async def start(self):
+        """Builds the first pool and starts watching the .env file."""
+        self._env_signature = self._signature()
+        settings = load_settings(self.env_path)
+        if self.check_interval is None:
+            self.check_interval = settings["config_check_seconds"]
+        if self.drain_timeout is None:
+            self.drain_timeout = settings["config_drain_timeout"]
+        self.pool = self.pool_class(settings)
+        await self.pool.startup()
+        self.state.client_pool = self.pool
+        if self.check_interval > 0:
+            self._watch_task = asyncio.create_task(self._watch())
+        return self.pool
+
+    async def update(self, changes):
+        """
+        Validates and applies a configuration update.
+
+        Args:
+            changes (dict): New values by update-env parameter name; None values are ignored.
+
+        Returns:
+            list: The names of the environment variables that changed.
+
+        Raises:
+            ValueError: If a setting is unknown or empty, or the new configuration does not
+                work; the running configuration is left unchanged.
+        """
+        updates = {}
+        for name, value in changes.items():
+            if value is None:
+                continue
+            if name not in UPDATABLE_SETTINGS:
+                raise ValueError(f"Unknown setting: {name}")
+            if not str(value).strip() or "\n" in str(value):
+                raise ValueError(f"Invalid value for {name}")
+            updates[UPDATABLE_SETTINGS[name]] = str(value).strip()
+        if not updates:
+            raise ValueError("No settings to update")
+
+        async with self._lock:
+            current = {key: os.environ.get(key) for key in updates}
+            updates = {key: value for key, value in updates.items() if current[key] != value}
+            if not updates:
+                return []
+            await self._swap(load_settings(self.env_path, overrides=updates))
+            _write_env(self.env_path, updates)
+            os.environ.update(updates)
+            self._env_signature = self._signature()
+        logger.info(f"Configuration updated: {', '.join(sorted(updates))}")
+        return sorted(updates)
+
+    async def _swap(self, settings):
+        old = self.pool
+        new = self.pool_class(settings, previous=old)
+        try:
+            await new.startup()
+            await new.validate()
+        except Exception as e:
+            await new.close()
+            raise ValueError(f"The new configuration was rejected: {e}") from e
+
+        new.take_over(old)
+        self.pool = new
+        self.state.client_pool = new
+        for callback in self._listeners:
+            try:
+                callback(new)
+            except Exception as e:
+                logger.warning(f"Pool swap listener failed: {e}")
+        task = asyncio.create_task(self._retire(old))
+        self._retiring[task] = old
+        task.add_done_callback(lambda done: self._retiring.pop(done, None))
+
+    async def _retire(self, pool):
+        await pool.drain(timeout=self.drain_timeout)
+        await pool.close()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.env_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    async def _watch(self):
+        # Picks up updates written by other workers
+        while True:
+            await asyncio.sleep(self.check_interval)
+            signature = self._signature()
+            if signature == self._env_signature or self._lock.locked():
+                continue
+            async with self._lock:
+                self._env_signature = signature
+                updatable = set(UPDATABLE_SETTINGS.values())
+                updates = {
+                    key: value for key, value in dotenv_values(self.env_path).items()
+                    if key in updatable and value is not None and os.environ.get(key) != value
+                }
+                if not updates:
+                    continue
+                try:
+                    await self._swap(load_settings(self.env_path, overrides=updates))
+                except ValueError as e:
+                    logger.error(f"Ignoring the updated environment file: {e}")
+                    continue
+                os.environ.update(updates)
+                logger.info(f"Configuration reloaded from the environment file: {', '.join(sorted(updates))}")
+
+    async def close(self):
+        """Stops watching and closes the current and retiring pools."""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+        for task, pool in list(self._retiring.items()):
+            task.cancel()
+            await pool.close()
+        if self.pool is not None:
+            await self.pool.close()
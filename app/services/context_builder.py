@@ -0,0 +1,105 @@
+import json
+import hashlib
+import logging
+from .text_utils import estimate_tokens, normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+def render_chunk_text(text):
+    """
+    Renders a stored chunk as compact plain text.
+
+    Chunks ingested from HTML are JSON sections ({"header": ..., "text": [...]}) serialized
+    with indentation; the punctuation and whitespace only cost prompt tokens, so sections are
+    flattened to one line per paragraph, list item or table row. Other text is returned as is.
+
+    Args:
+        text (str): The stored chunk text.
+
+    Returns:
+        str: The plain-text rendering.
+    """
+    try:
+        section = json.loads(text)
+    except (TypeError, ValueError):
+        return text.strip()
+    if not isinstance(section, dict):
+        return text.strip()
+
+    lines = []
+    header = section.get("header")
+    if header and header != "No header":
+        lines.append(header)
+    for element in section.get("text", []):
+        content = element.get("content") if isinstance(element, dict) else element
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, list):
+                    lines.append(" | ".join(cell for cell in item if cell))
+                elif item:
+                    lines.append(f"- {item}")
+        elif content:
+            lines.append(str(content))
+    return "\n".join(line for line in lines if line.strip())
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt context from retrieved chunks.
+
+    Duplicate chunks are dropped, only the content and the document name are kept, chunks
+    are ordered by relevance score and packed until the token budget is used up.
+    """
+
+    def __init__(self, token_budget=3000, text_key="text", label_key="name"):
+        """
+        Args:
+            token_budget (int): Maximum estimated tokens of the assembled context.
+            text_key (str): The property holding the chunk content.
+            label_key (str): The property used to label chunks of the same document.
+        """
+        self.token_budget = token_budget
+        self.text_key = text_key
+        self.label_key = label_key
+
+    def build(self, docs):
+        """
+        Packs the retrieved chunks into a context string.
+
+        Args:
+            docs (list): Retrieved chunks as dicts with 'properties' and 'score' keys.
+
+        Returns:
+            tuple: The context string and a dict with the packing statistics.
+        """
+        seen = set()
+        used_tokens = 0
+        parts = []
+        duplicates = 0
+        for doc in sorted(docs, key=lambda d: d.get("score") or 0.0, reverse=True):
+            properties = doc["properties"]
+            content = render_chunk_text(properties.get(self.text_key) or "")
+            if not content:
+                continue
+            fingerprint = hashlib.sha1(normalize_question(content).encode("utf-8")).hexdigest()
+            if fingerprint in seen:
+                duplicates += 1
+                continue
+            seen.add(fingerprint)
+
+            label = properties.get(self.label_key)
+            block = f"[{label}]\n{content}" if label else content
+            tokens = estimate_tokens(block)
+            if used_tokens + tokens > self.token_budget:
+                continue
+            parts.append(block)
+            used_tokens += tokens
+
+        stats = {
+            "retrieved": len(docs),
+            "duplicates": duplicates,
+            "packed": len(parts),
+            "context_tokens": used_tokens,
+        }
+        return "\n\n".join(parts), stats
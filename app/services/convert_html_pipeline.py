@@ -1,6 +1,20 @@
 import os, json
 from bs4 import BeautifulSoup
+from bs4.element import Tag
 from langchain.schema import Document
+from .chunking import SectionChunker
+
+try:
+    import lxml.html
+    from lxml.etree import ParserError
+    DEFAULT_PARSER = "lxml"
+    # The pages are already decoded; lxml gets them back as UTF-8 bytes because it rejects
+    # strings that carry an encoding declaration, like XHTML exports
+    _UTF8_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+
+HEADER_TAGS = ('h1', 'h2', 'h3')
 
 class ConvertHTMLPipeline:
     """
@@ -9,9 +23,19 @@ class ConvertHTMLPipeline:
     paragraphs, lists, and headers, and converting this data into JSON or Document objects.
     """
 
-    def __init__(self):
-        """Initializes the ConvertHTMLPipeline class."""
-        pass
+    def __init__(self, parser=None, chunker=None):
+        """
+        Initializes the ConvertHTMLPipeline class.
+
+        Args:
+            parser (str): The parser backend used by the single-pass converter: 'lxml' walks
+                the lxml tree directly, any other value is passed to BeautifulSoup.
+                Defaults to 'lxml' when it is installed, otherwise 'html.parser'.
+            chunker (SectionChunker): Splits sections into Document chunks. Defaults to a
+                SectionChunker with its default sizes.
+        """
+        self.parser = parser or DEFAULT_PARSER
+        self.chunker = chunker or SectionChunker()
     
     def _extract_table_data(self, table):
         """
@@ -146,6 +170,149 @@ class ConvertHTMLPipeline:
         # Return as JSON
         return json.dumps(result, ensure_ascii=False, indent=4)
 
+    def iter_sections(self, html_content):
+        """
+        Yields the header sections of an HTML document in a single pass over the parsed tree.
+
+        Produces the same section structure as `_html_to_json`, but every element is visited
+        once: the walk does not descend into paragraphs, tables and lists it has already
+        extracted, so nested content is neither rescanned nor duplicated.
+
+        Args:
+            html_content (str): The HTML content to be converted.
+
+        Yields:
+            dict: A section with a 'header' and a list of 'text' elements.
+        """
+        if self.parser == "lxml":
+            yield from self._iter_sections_lxml(html_content)
+            return
+
+        soup = BeautifulSoup(html_content, self.parser)
+        current_section = {"header": "No header", "text": []}
+        stack = [iter(soup.children)]
+        while stack:
+            element = next(stack[-1], None)
+            if element is None:
+                stack.pop()
+                continue
+            if not isinstance(element, Tag):
+                continue
+            if element.name in HEADER_TAGS:
+                # Start a new section if a header is found
+                if current_section["text"]:
+                    yield current_section
+                    current_section = {"header": element.get_text(strip=True), "text": []}
+                else:
+                    current_section["header"] = element.get_text(strip=True)
+            elif element.name == 'p':
+                current_section["text"].append({
+                    "type": "paragraph",
+                    "content": element.get_text(strip=True)
+                })
+            elif element.name == 'table':
+                current_section["text"].append({
+                    "type": "table",
+                    "content": self._extract_table_data(element)
+                })
+            elif element.name in ('ul', 'ol'):
+                current_section["text"].append({
+                    "type": "list",
+                    "content": [li.get_text(strip=True) for li in element.find_all('li')]
+                })
+            else:
+                stack.append(iter(element.children))
+
+        # Yield the last section
+        if current_section["text"]:
+            yield current_section
+
+    def _iter_sections_lxml(self, html_content):
+        """
+        The lxml version of `iter_sections`. It skips building a BeautifulSoup tree, which is
+        most of the conversion time on large pages, and extracts text the same way as
+        `get_text(strip=True)`.
+        """
+        def text_of(element):
+            return "".join(piece.strip() for piece in element.itertext())
+
+        if isinstance(html_content, str):
+            html_content = html_content.encode("utf-8")
+        try:
+            root = lxml.html.document_fromstring(html_content, parser=_UTF8_PARSER)
+        except ParserError:
+            # Empty document
+            return
+
+        current_section = {"header": "No header", "text": []}
+        stack = [iter(root)]
+        while stack:
+            element = next(stack[-1], None)
+            if element is None:
+                stack.pop()
+                continue
+            tag = element.tag
+            if not isinstance(tag, str):
+                # Comments and processing instructions
+                continue
+            if tag in HEADER_TAGS:
+                if current_section["text"]:
+                    yield current_section
+                    current_section = {"header": text_of(element), "text": []}
+                else:
+                    current_section["header"] = text_of(element)
+            elif tag == 'p':
+                current_section["text"].append({"type": "paragraph", "content": text_of(element)})
+            elif tag == 'table':
+                rows = [[text_of(cell) for cell in row.iter('td', 'th')] for row in element.iter('tr')]
+                current_section["text"].append({"type": "table", "content": rows})
+            elif tag in ('ul', 'ol'):
+                current_section["text"].append({
+                    "type": "list",
+                    "content": [text_of(li) for li in element.iter('li')]
+                })
+            else:
+                stack.append(iter(element))
+
+        if current_section["text"]:
+            yield current_section
+
+    def iter_documents(self, sections, metadata):
+        """
+        Yields the plain-text chunks of the sections as Documents.
+
+        Args:
+            sections (iterable): Sections as produced by `iter_sections`.
+            metadata (dict): Metadata to be associated with each Document.
+
+        Yields:
+            Document: One Document per chunk.
+        """
+        for content in self.chunker.chunk(sections):
+            yield Document(page_content=content, metadata=dict(metadata))
+
+    def convert_html_file_to_documents(self, html_file_path, metadata):
+        """
+        Converts an HTML file straight to Document objects, without an intermediate JSON file.
+
+        Args:
+            html_file_path (str): The file path to the HTML file to be converted.
+            metadata (dict): Metadata to be associated with each Document.
+
+        Returns:
+            list: A list of Document objects.
+
+        Raises:
+            FileNotFoundError: If the specified HTML file does not exist.
+        """
+        if not os.path.exists(html_file_path):
+            raise FileNotFoundError(f"The file '{html_file_path}' does not exist.")
+
+        with open(html_file_path, 'r', encoding='utf-8') as file:
+            html_content = file.read()
+
+        return list(self.iter_documents(self.iter_sections(html_content), metadata))
+
     def convert_html_file_to_json(self, html_file_path):
         """
         Converts an HTML file to a JSON file by extracting and structuring the content.
@@ -0,0 +1,157 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from .text_utils import like_matcher
+
+logger = logging.getLogger(__name__)
+
+# Columns returned for every document, in order
+COLUMNS = ("name", "active", "date", "chunk_count", "content_hash", "ingested_at")
+
+
+class DocumentRegistry:
+    """
+    A local sqlite table of the ingested documents: one row per document name with its
+    metadata, chunk count, content hash and ingest time.
+
+    DocumentsPipeline keeps it in sync on every ingest and delete, so listing the documents
+    is an indexed query that never touches Weaviate or loads chunk text.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The sqlite file.
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "name TEXT PRIMARY KEY, active INTEGER, date TEXT, chunk_count INTEGER, "
+            "content_hash TEXT, ingested_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_active ON documents (active, name)")
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def upsert(self, name, metadata, chunk_count, content_hash=None):
+        """
+        Records an ingested document, replacing the previous row with the same name.
+
+        Args:
+            name (str): The document name.
+            metadata (dict): The document metadata (active, date).
+            chunk_count (int): Number of chunks stored for the document.
+            content_hash (str): Hash of the document content.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (name, active, date, chunk_count, content_hash, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, _to_int(metadata.get("active")), metadata.get("date"), chunk_count, content_hash, time.time())
+            )
+            self._db.commit()
+
+    def delete_where(self, property, pattern):
+        """
+        Removes the documents whose property matches a Weaviate `like` pattern, mirroring
+        DocumentsPipeline.delete_documents_by_metadata with the backends' case-insensitive,
+        word-level matching.
+
+        Args:
+            property (str): name, active or date.
+            pattern (str): The like pattern.
+
+        Returns:
+            int: The number of removed documents.
+        """
+        if property not in ("name", "active", "date"):
+            return 0
+        matches = like_matcher(pattern)
+        with self._lock:
+            rows = self._db.execute(f"SELECT name, {property} FROM documents").fetchall()
+            if property == "active":
+                rows = [(name, bool(value) if value is not None else None) for name, value in rows]
+            names = [(name,) for name, value in rows if matches(value)]
+            self._db.executemany("DELETE FROM documents WHERE name = ?", names)
+            self._db.commit()
+        return len(names)
+
+    def list(self, limit=100, offset=0, active=None):
+        """
+        Returns one page of documents ordered by name.
+
+        Args:
+            limit (int): Maximum number of documents.
+            offset (int): Number of documents to skip.
+            active (bool): Only documents with this active flag if not None.
+
+        Returns:
+            tuple: The documents as dicts and the total number of matching documents.
+        """
+        where, params = ("WHERE active = ?", (_to_int(active),)) if active is not None else ("", ())
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM documents {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM documents {where} ORDER BY name LIMIT ? OFFSET ?",
+                params + (limit, offset)
+            ).fetchall()
+        documents = []
+        for row in rows:
+            document = dict(zip(COLUMNS, row))
+            document["active"] = bool(document["active"]) if document["active"] is not None else None
+            documents.append(document)
+        return documents, total
+
+    def rebuild(self, objects):
+        """
+        Replaces the registry content with the documents of the given chunks.
+
+        Args:
+            objects (iterable): (uuid, properties) pairs of every chunk; the properties need
+                name, active, date and content_hash.
+
+        Returns:
+            int: The number of registered documents.
+        """
+        documents = {}
+        for _, properties in objects:
+            name = properties.get("name")
+            if not name:
+                continue
+            entry = documents.setdefault(name, {"metadata": properties, "hashes": []})
+            entry["hashes"].append(properties.get("content_hash") or "")
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM documents")
+            self._db.executemany(
+                "INSERT INTO documents (name, active, date, chunk_count, content_hash, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (name, _to_int(entry["metadata"].get("active")), entry["metadata"].get("date"),
+                     len(entry["hashes"]), document_hash(entry["hashes"]), now)
+                    for name, entry in documents.items()
+                ]
+            )
+            self._db.commit()
+        logger.info(f"Document registry rebuilt with {len(documents)} documents")
+        return len(documents)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def document_hash(chunk_hashes):
+    """Returns the content hash of a document from the hashes of its chunks."""
+    return hashlib.sha256("\n".join(sorted(chunk_hashes)).encode("utf-8")).hexdigest()
+
+
+def _to_int(value):
+    return None if value is None else int(bool(value))
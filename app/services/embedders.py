@@ -0,0 +1,154 @@
+import time
+import queue
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+from .metrics import LOCAL_EMBEDDING_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Queue priorities: questions wait for users, ingestion chunks do not
+_QUERY, _DOCUMENT, _STOP = 0, 1, 2
+
+
+class LocalEmbeddings:
+    """
+    Embeds texts in-process with a sentence-transformers model on the CPU, with the same
+    embed_query / embed_documents interface as the LangChain embeddings.
+
+    The model is loaded once per worker. Calls from the embedding executor threads do not
+    run their own forward pass: every text is queued, and a single batcher thread collects
+    the texts that arrive within `max_wait_ms` of each other (up to `batch_size`) and
+    embeds them together, so concurrent questions share one forward pass. Questions are
+    served before queued ingestion chunks.
+
+    The vectors are the ones the Inference API returns for the same model, so a collection
+    embedded remotely can be searched with local query embeddings and the other way round.
+    """
+
+    def __init__(self, model_name, runtime="torch", model_file=None, quantize=False, batch_size=32,
+                 max_wait_ms=2.0, threads=None):
+        """
+        Args:
+            model_name (str): The sentence-transformers model, the same as EMBEDDING_MODEL_NAME.
+            runtime (str): 'torch', or 'onnx' to run an ONNX export with onnxruntime.
+            model_file (str): The ONNX file of the model repository to load, e.g. a quantized
+                'onnx/model_qint8_avx512_vnni.onnx'; the default export if None.
+            quantize (bool): Quantize the linear layers to int8 (torch runtime only).
+            batch_size (int): Maximum number of texts per forward pass.
+            max_wait_ms (float): How long the batcher waits for more texts before running a
+                forward pass that is not full.
+            threads (int): Number of intra-op CPU threads; the runtime default if None.
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ValueError("The local embedding backend requires the sentence-transformers package") from e
+        if runtime == "onnx":
+            # Needs sentence-transformers[onnx]
+            model_kwargs = {"file_name": model_file} if model_file else None
+            self.model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        elif runtime == "torch":
+            import torch
+            if threads:
+                torch.set_num_threads(threads)
+            self.model = SentenceTransformer(model_name, device="cpu")
+            if quantize:
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            raise ValueError(f"Unknown embedding runtime: {runtime}")
+        self.model_name = model_name
+        self.runtime = runtime
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Loaded local embedding model {model_name} ({runtime}{', int8' if quantize else ''})")
+
+    def embed_query(self, text):
+        return self._submit([text], _QUERY)[0]
+
+    def embed_documents(self, texts):
+        return self._submit(list(texts), _DOCUMENT)
+
+    def _submit(self, texts, priority):
+        if self._closed or not self._thread.is_alive():
+            raise RuntimeError("The local embedding model is closed")
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((priority, next(self._order), text, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item[0] == _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item[0] == _STOP:
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            texts = [text for _, _, text, _ in batch]
+            LOCAL_EMBEDDING_BATCH.observe(len(texts))
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, _, future), vector in zip(batch, vectors):
+                future.set_result(vector.tolist())
+
+    def close(self):
+        """
+        Stops the batcher once the queued texts are embedded. Returns at once: the pool is
+        closed on the event loop, and the batcher thread ends by itself.
+        """
+        self._closed = True
+        self._queue.put((_STOP, next(self._order), None, None))
+
+
+def build_embedder(name, model_name, hugging_api_key=None, runtime="torch", model_file=None, quantize=False,
+                   batch_size=32, max_wait_ms=2.0, threads=None):
+    """
+    Builds an embedding model by its configured backend name.
+
+    Args:
+        name (str): 'huggingface-api' or 'local'.
+        model_name (str): The embedding model.
+        hugging_api_key (str): The Inference API key.
+        runtime, model_file, quantize, batch_size, max_wait_ms, threads: Options of the local
+            backend, see LocalEmbeddings.
+
+    Returns:
+        The embedding model (embed_query / embed_documents).
+    """
+    name = (name or "huggingface-api").lower()
+    if name == "huggingface-api":
+        return HuggingFaceInferenceAPIEmbeddings(api_key=hugging_api_key, model_name=model_name)
+    if name == "local":
+        return LocalEmbeddings(
+            model_name, runtime=runtime, model_file=model_file, quantize=quantize,
+            batch_size=batch_size, max_wait_ms=max_wait_ms, threads=threads,
+        )
+    raise ValueError(f"Unknown embedding backend: {name}")
@@ -0,0 +1,138 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from .text_utils import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    A bounded LRU cache of query embeddings with a time-to-live and an optional sqlite tier.
+
+    Keys combine the embedding model name with the normalized question, so switching the
+    model never returns vectors from the old one. The in-memory tier is checked on the event
+    loop; the persistent tier does disk I/O and is meant to be read and written from a
+    worker thread. Each tier has its own lock, so a lookup on the loop never waits for disk.
+    """
+
+    def __init__(self, model_name, max_size=10000, ttl=86400, persist_path=None):
+        """
+        Args:
+            model_name (str): The embedding model the cached vectors come from.
+            max_size (int): Maximum number of vectors kept in memory.
+            ttl (float): Seconds after which a vector is considered stale.
+            persist_path (str): Optional sqlite file for the persistent tier.
+        """
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Guards the in-memory tier and the counters; held only for dict operations
+        self._lock = threading.Lock()
+        # Serializes the sqlite connection, which is shared by the worker threads
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, created_at REAL)"
+            )
+            self._db.commit()
+
+    def _key(self, text):
+        raw = f"{self.model_name}\0{normalize_question(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _is_fresh(self, created_at):
+        return time.time() - created_at < self.ttl
+
+    def get(self, text):
+        """
+        Looks up a vector in the in-memory tier.
+
+        Returns:
+            list: The cached vector, or None on a miss.
+        """
+        key = self._key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            if self._db is None:
+                self.misses += 1
+        return None
+
+    def get_persistent(self, text):
+        """
+        Looks up a vector in the sqlite tier and promotes it to memory.
+
+        Returns:
+            list: The cached vector, or None on a miss or when no persistent tier is configured.
+        """
+        if self._db is None:
+            return None
+        key = self._key(text)
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        with self._lock:
+            if row is None or not self._is_fresh(row[1]):
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            vector = array("f", row[0]).tolist()
+            self._store(key, vector, row[1])
+            return vector
+
+    def set(self, text, vector):
+        """Stores a vector in every configured tier; writes to disk when persistent."""
+        key = self._key(text)
+        created_at = time.time()
+        with self._lock:
+            self._store(key, vector, created_at)
+        if self._db is None:
+            return
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    (key, array("f", vector).tobytes(), created_at)
+                )
+                self._db.commit()
+
+    def _store(self, key, vector, created_at):
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+
+def atomic_write(path, text):
+    """
+    Replaces a file's content atomically: readers see either the old or the new content,
+    never a partially written file.
+
+    Args:
+        path (str): The file to write.
+        text (str): The new content.
+    """
+    # Write to a temporary file in the same directory and rename it over the target
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,294 @@
+import time
+import uuid
+import json
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from .metrics import INGESTION_JOBS, INGESTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Ingestion stages in the order they complete
+STAGES = ("parsed", "chunked", "embedded", "written")
+# Minimum seconds between two saves of a job's progress to the job store
+SAVE_INTERVAL = 1.0
+
+
+class IngestionJob:
+    """Status of one background ingestion job."""
+
+    def __init__(self, name, stages=STAGES, on_change=None):
+        """
+        Args:
+            name (str): A label shown in the job status, e.g. the document name.
+            stages (tuple): The stages reported by the job.
+            on_change (callable): Optional callback run with the job when its status changes;
+                progress within a stage is reported at most every SAVE_INTERVAL seconds.
+        """
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.status = "queued"
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {stage: {"status": "pending", "done": 0, "total": None, "duration_ms": None} for stage in stages}
+        self._stage_started = None
+        self._on_change = on_change
+        self._saved_at = 0.0
+
+    def _changed(self, force=True):
+        if self._on_change is None:
+            return
+        now = time.monotonic()
+        if force or now - self._saved_at >= SAVE_INTERVAL:
+            self._saved_at = now
+            self._on_change(self)
+
+    def start(self):
+        self.status = "running"
+        self.started_at = self._stage_started = time.time()
+        self._changed()
+
+    def progress(self, stage, done=None, total=None):
+        """
+        Records progress of a stage. A stage is finished once done reaches total, or as soon
+        as it is reported without any counts.
+
+        Args:
+            stage (str): The stage name.
+            done (int): Number of items processed so far.
+            total (int): Number of items to process.
+        """
+        entry = self.stages.setdefault(stage, {"status": "pending", "done": 0, "total": None, "duration_ms": None})
+        if total is not None:
+            entry["total"] = total
+        if done is not None:
+            entry["done"] = done
+        finished = entry["done"] >= entry["total"] if entry["total"] is not None else done is None
+        if finished:
+            now = time.time()
+            entry["status"] = "done"
+            entry["duration_ms"] = round((now - self._stage_started) * 1000, 1)
+            self._stage_started = now
+        else:
+            entry["status"] = "running"
+        self._changed(force=finished)
+
+    def finish(self, result=None, error=None):
+        self.finished_at = time.time()
+        self.result = result
+        if error is None:
+            self.status = "succeeded"
+        else:
+            self.status = "failed"
+            self.error = error
+            for entry in self.stages.values():
+                if entry["status"] == "running":
+                    entry["status"] = "failed"
+        self._changed()
+
+    def to_dict(self):
+        total_ms = None
+        if self.started_at is not None:
+            total_ms = round(((self.finished_at or time.time()) - self.started_at) * 1000, 1)
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "total_ms": total_ms,
+            "stages": self.stages,
+        }
+
+
+class JobStore:
+    """
+    A sqlite table of the job statuses, shared by the uvicorn workers so that any of them
+    can answer a status query for a job another one runs.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The sqlite file.
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, created_at REAL, status TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at)")
+        self._db.commit()
+
+    def save(self, job):
+        """Records the current status of a job."""
+        status = job.to_dict()
+        with self._lock:
+            if self._db is None:
+                # Closed by a shutdown while the job thread was still running
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, created_at, status) VALUES (?, ?, ?)",
+                (job.id, job.created_at, json.dumps(status))
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def list(self, limit):
+        with self._lock:
+            if self._db is None:
+                return []
+            rows = self._db.execute(
+                "SELECT status FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def prune(self, keep):
+        """Deletes all but the `keep` newest jobs."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)", (keep,)
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs in the background on a bounded pool of workers.
+
+    Jobs are queued by the dashboard routes, which return the job id immediately. Each worker
+    runs one job at a time in a thread, so at most `workers` documents are ingested at once.
+    Finished jobs are kept for status queries until `max_jobs` newer jobs have been submitted.
+    Without a job store, the statuses are only known to the process running the jobs, so
+    the app must run a single uvicorn worker for the job routes to find them.
+    """
+
+    def __init__(self, workers=2, max_jobs=500, store=None):
+        """
+        Args:
+            workers (int): Number of jobs processed concurrently.
+            max_jobs (int): Number of jobs whose status is remembered.
+            store (JobStore): Optional store the statuses are saved to, shared by the workers.
+        """
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.store = store
+        self._jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        """Starts the worker tasks on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stops the workers; jobs still queued are marked as failed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job, _, _, on_done = self._queue.get_nowait()
+            job.finish(error="Cancelled by shutdown")
+            if on_done is not None:
+                on_done(job)
+        for job in self._jobs.values():
+            if job.status in ("queued", "running"):
+                job.finish(error="Cancelled by shutdown")
+        if self.store is not None:
+            self.store.close()
+
+    def submit(self, name, func, on_success=None, on_done=None):
+        """
+        Queues a job.
+
+        Args:
+            name (str): A label shown in the job status, e.g. the document name.
+            func (callable): Blocking callable run in a thread as func(job); its return
+                value is stored as the job result.
+            on_success (callable): Optional callback run on the event loop with the job
+                after it succeeded.
+            on_done (callable): Optional callback run on the event loop with the job once it
+                has ended, whether it succeeded, failed or was cancelled.
+
+        Returns:
+            IngestionJob: The queued job.
+        """
+        job = IngestionJob(name, on_change=self.store.save if self.store is not None else None)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        if self.store is not None:
+            self.store.save(job)
+            self.store.prune(self.max_jobs)
+        self._queue.put_nowait((job, func, on_success, on_done))
+        return job
+
+    def get(self, job_id):
+        """
+        Returns the status of a job, read from the job store when another worker runs it.
+
+        Returns:
+            dict: The job status, or None if the job is unknown.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.get(job_id) if self.store is not None else None
+
+    def list(self):
+        if self.store is not None:
+            return self.store.list(self.max_jobs)
+        return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def pending(self):
+        """Returns the number of queued and running jobs."""
+        return sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, func, on_success, on_done = await self._queue.get()
+            job.start()
+            try:
+                result = await loop.run_in_executor(None, func, job)
+                job.finish(result=result)
+                INGESTION_JOBS.inc(status="succeeded")
+            except Exception as e:
+                logger.error(f"Ingestion job {job.id} ({job.name}) failed: {e}")
+                job.finish(error=str(e))
+                INGESTION_JOBS.inc(status="failed")
+            else:
+                if on_success is not None:
+                    # The job is done; a failing callback does not change its outcome
+                    try:
+                        on_success(job)
+                    except Exception as e:
+                        logger.error(f"Callback of ingestion job {job.id} ({job.name}) failed: {e}")
+            finally:
+                if job.finished_at is None:
+                    # The worker was cancelled by stop()
+                    job.finish(error="Cancelled by shutdown")
+                INGESTION_SECONDS.observe(job.finished_at - job.started_at)
+                if on_done is not None:
+                    on_done(job)
+                self._queue.task_done()
@@ -0,0 +1,223 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from .metrics import EMBEDDING_RETRIES, INGESTED_CHUNKS
+
+logger = logging.getLogger(__name__)
+
+# Fragments of Inference API error messages that are worth retrying
+_RETRYABLE_ERRORS = ("loading", "rate limit", "overloaded", "unavailable", "timed out", "timeout", "429", "503")
+# Fragments of error messages meaning the batch was too large
+_TOO_LARGE_ERRORS = ("too large", "too long", "413", "payload")
+
+
+class EmbeddingError(Exception):
+    """An embedding request failed."""
+
+    def __init__(self, message, retryable=False, too_large=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.too_large = too_large
+        self.retry_after = retry_after
+
+
+def _classify(message, retry_after=None):
+    lowered = message.lower()
+    return EmbeddingError(
+        message,
+        retryable=any(fragment in lowered for fragment in _RETRYABLE_ERRORS),
+        too_large=any(fragment in lowered for fragment in _TOO_LARGE_ERRORS),
+        retry_after=retry_after,
+    )
+
+
+class BatchIngestionWriter:
+    """
+    Embeds and writes chunks for ingestion.
+
+    Texts are embedded in batches whose size adapts to the endpoint: it grows while requests
+    succeed at the first attempt and halves when the endpoint throttles or rejects a batch as
+    too large. Up to `concurrency` batches are in flight at once, and a failed batch is retried
+    with exponential backoff on its own. Objects are written through the vector backend (for
+    Weaviate its dynamic batch, which sizes the write batches itself), and failed objects are
+    collected one by one.
+    """
+
+    def __init__(self, embedder, backend, text_key="text", batch_size=32, max_batch_size=128,
+                 concurrency=4, max_retries=5, backoff=1.0, lexical_index=None):
+        """
+        Args:
+            embedder: The embedding model (embed_documents).
+            backend (VectorBackend): Where the objects are written.
+            text_key (str): The property holding the chunk text.
+            batch_size (int): Initial number of texts per embedding request.
+            max_batch_size (int): Upper bound for the adaptive batch size.
+            concurrency (int): Number of embedding requests in flight.
+            max_retries (int): Retries of a failed embedding batch before giving up.
+            backoff (float): Base delay in seconds of the exponential backoff.
+            lexical_index (LexicalIndex): Optional index updated with the written chunks.
+        """
+        self.embedder = embedder
+        self.backend = backend
+        self.text_key = text_key
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.lexical_index = lexical_index
+        self._lock = threading.Lock()
+        self.stats = {
+            "documents": 0,
+            "embedded": 0,
+            "written": 0,
+            "failed_objects": 0,
+            "errors": [],
+            "retries": 0,
+            "embed_seconds": 0.0,
+            "write_seconds": 0.0,
+        }
+
+    def _call(self, texts):
+        try:
+            vectors = self.embedder.embed_documents(texts)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            raise EmbeddingError(str(e), retryable=status in (429, 500, 502, 503, 504), too_large=status == 413)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise EmbeddingError(str(e), retryable=True)
+        # The Inference API returns an error object instead of raising on 429/503
+        if isinstance(vectors, dict):
+            raise _classify(str(vectors.get("error", vectors)), retry_after=vectors.get("estimated_time"))
+        if not isinstance(vectors, list) or len(vectors) != len(texts):
+            raise EmbeddingError(f"Unexpected embedding response: {str(vectors)[:200]}", retryable=True)
+        return vectors
+
+    def _embed_batch(self, texts):
+        """Embeds one batch with retries; returns (vectors, attempts)."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._call(texts), attempt
+            except EmbeddingError as e:
+                if e.too_large and len(texts) > 1:
+                    # Split the batch instead of retrying it as is
+                    half = len(texts) // 2
+                    with self._lock:
+                        self.batch_size = max(1, min(self.batch_size, half))
+                    left, left_attempts = self._embed_batch(texts[:half])
+                    right, right_attempts = self._embed_batch(texts[half:])
+                    return left + right, max(left_attempts, right_attempts) + 1
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                delay = e.retry_after or self.backoff * 2 ** attempt
+                delay += random.uniform(0, self.backoff)
+                logger.warning(f"Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.1f}s")
+                with self._lock:
+                    self.stats["retries"] += 1
+                EMBEDDING_RETRIES.inc()
+                time.sleep(delay)
+
+    def embed(self, texts, progress=None):
+        """
+        Embeds texts in adaptive, concurrent batches.
+
+        Args:
+            texts (list): The texts to embed.
+            progress (callable): Optional progress(done) callback, called after every wave.
+
+        Returns:
+            list: The vectors in the order of the texts.
+        """
+        started = time.perf_counter()
+        vectors = []
+        position = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingest-embed") as executor:
+            while position < len(texts):
+                # One wave: up to `concurrency` batches of the current size
+                batches = []
+                for _ in range(self.concurrency):
+                    if position >= len(texts):
+                        break
+                    batches.append(texts[position:position + self.batch_size])
+                    position += len(batches[-1])
+                results = list(executor.map(self._embed_batch, batches))
+                for batch_vectors, _ in results:
+                    vectors.extend(batch_vectors)
+                with self._lock:
+                    if all(attempts == 0 for _, attempts in results):
+                        self.batch_size = min(self.max_batch_size, max(self.batch_size + 1, int(self.batch_size * 1.25)))
+                    else:
+                        self.batch_size = max(1, self.batch_size // 2)
+                if progress is not None:
+                    progress(len(vectors))
+        with self._lock:
+            self.stats["embedded"] += len(vectors)
+            self.stats["embed_seconds"] += time.perf_counter() - started
+        return vectors
+
+    def write(self, objects):
+        """
+        Writes objects to the vector backend. Objects with an existing uuid replace the stored
+        object.
+
+        Args:
+            objects (list): (uuid, properties, vector) triples.
+
+        Returns:
+            list: The uuids that were written successfully.
+        """
+        if not objects:
+            return []
+        started = time.perf_counter()
+        failed = self.backend.write(objects)
+        failed_ids = {object_id for object_id, _ in failed}
+        written = [object_id for object_id, _, _ in objects if str(object_id) not in failed_ids]
+        if self.lexical_index is not None:
+            for object_id, properties, _ in objects:
+                if str(object_id) not in failed_ids:
+                    self.lexical_index.add(str(object_id), properties)
+        with self._lock:
+            self.stats["written"] += len(written)
+            self.stats["failed_objects"] += len(failed)
+            for object_id, message in failed[:max(0, 20 - len(self.stats["errors"]))]:
+                self.stats["errors"].append({"uuid": object_id, "message": message})
+            self.stats["write_seconds"] += time.perf_counter() - started
+        INGESTED_CHUNKS.inc(len(written))
+        return written
+
+    def ingest(self, objects, progress=None):
+        """
+        Embeds and writes objects.
+
+        Args:
+            objects (list): (uuid, properties) pairs; the text is read from the text property.
+            progress (callable): Optional progress(stage, done=None, total=None) callback.
+
+        Returns:
+            list: The uuids that were written successfully.
+        """
+        report = progress or (lambda stage, done=None, total=None: None)
+        with self._lock:
+            self.stats["documents"] += len(objects)
+        report("embedded", done=0, total=len(objects))
+        vectors = self.embed(
+            [properties[self.text_key] for _, properties in objects],
+            progress=lambda done: report("embedded", done=done)
+        )
+        written = self.write([(object_id, properties, vector) for (object_id, properties), vector in zip(objects, vectors)])
+        report("written", done=len(written), total=len(objects))
+        return written
+
+    def summary(self):
+        """Returns the counters with the throughput in documents per second."""
+        with self._lock:
+            summary = dict(self.stats)
+        seconds = summary["embed_seconds"] + summary["write_seconds"]
+        summary["documents_per_second"] = round(summary["written"] / seconds, 2) if seconds else None
+        summary["batch_size"] = self.batch_size
+        summary["embed_seconds"] = round(summary["embed_seconds"], 2)
+        summary["write_seconds"] = round(summary["write_seconds"], 2)
+        return summary
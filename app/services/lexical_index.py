@@ -0,0 +1,167 @@
+import math
+import logging
+import threading
+from collections import Counter
+from .context_builder import render_chunk_text
+from .text_utils import tokenize, like_matcher
+
+logger = logging.getLogger(__name__)
+
+
+class LexicalIndex:
+    """
+    An in-process BM25 inverted index over the chunks stored in Weaviate.
+
+    Text is normalized with Arabic-aware folding, so exact product names, bundle codes and
+    prices match regardless of diacritics or alef/ya/ta marbuta spelling. The index is built
+    from the collection at startup and updated by DocumentsPipeline on every add and delete.
+    """
+
+    def __init__(self, text_key="text", k1=1.2, b=0.75):
+        """
+        Args:
+            text_key (str): The property holding the chunk content.
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.text_key = text_key
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._docs = {}  # uuid -> (properties, length)
+        self._postings = {}  # term -> {uuid: term frequency}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, uuid, properties):
+        """
+        Indexes a chunk, replacing any previous version with the same uuid.
+
+        Args:
+            uuid (str): The Weaviate object id.
+            properties (dict): The object properties, including the text.
+        """
+        terms = Counter(tokenize(render_chunk_text(properties.get(self.text_key) or "")))
+        with self._lock:
+            self._remove(uuid)
+            length = sum(terms.values())
+            self._docs[uuid] = (properties, length)
+            self._total_length += length
+            for term, freq in terms.items():
+                self._postings.setdefault(term, {})[uuid] = freq
+
+    def remove(self, uuid):
+        """Removes a chunk from the index if present."""
+        with self._lock:
+            self._remove(uuid)
+
+    def _remove(self, uuid):
+        entry = self._docs.pop(uuid, None)
+        if entry is None:
+            return
+        properties, length = entry
+        self._total_length -= length
+        for term in set(tokenize(render_chunk_text(properties.get(self.text_key) or ""))):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(uuid, None)
+                if not postings:
+                    del self._postings[term]
+
+    def remove_where(self, property, pattern):
+        """
+        Removes every chunk whose property matches a Weaviate `like` pattern, with the same
+        case-insensitive, word-level matching as the vector backends, so the index drops
+        exactly the chunks the backend deleted.
+
+        Args:
+            property (str): The property to match.
+            pattern (str): The like pattern.
+
+        Returns:
+            int: The number of removed chunks.
+        """
+        matches_pattern = like_matcher(pattern)
+        with self._lock:
+            matches = [
+                uuid for uuid, (properties, _) in self._docs.items()
+                if matches_pattern(properties.get(property))
+            ]
+            for uuid in matches:
+                self._remove(uuid)
+        return len(matches)
+
+    def search(self, question, limit):
+        """
+        Scores the indexed chunks against a question with BM25.
+
+        Args:
+            question (str): The question.
+            limit (int): Maximum number of results.
+
+        Returns:
+            list: Dicts with 'uuid', 'properties' and 'score' keys, best first.
+        """
+        query_terms = set(tokenize(question))
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_len = self._total_length / n or 1.0
+            scores = Counter()
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for uuid, freq in postings.items():
+                    length = self._docs[uuid][1]
+                    scores[uuid] += idf * freq * (self.k1 + 1) / (
+                        freq + self.k1 * (1 - self.b + self.b * length / avg_len)
+                    )
+            return [
+                {"uuid": uuid, "properties": self._docs[uuid][0], "score": score}
+                for uuid, score in scores.most_common(limit)
+            ]
+
+    def rebuild(self, objects):
+        """
+        Replaces the index content with the given objects.
+
+        Args:
+            objects (iterable): (uuid, properties) pairs.
+
+        Returns:
+            int: The number of indexed chunks.
+        """
+        fresh = LexicalIndex(text_key=self.text_key, k1=self.k1, b=self.b)
+        for uuid, properties in objects:
+            fresh.add(str(uuid), properties)
+        with self._lock:
+            self._docs = fresh._docs
+            self._postings = fresh._postings
+            self._total_length = fresh._total_length
+        logger.info(f"Lexical index rebuilt with {len(fresh)} chunks")
+        return len(fresh)
+
+
+def reciprocal_rank_fusion(result_lists, limit, k=60):
+    """
+    Fuses ranked result lists with reciprocal rank fusion.
+
+    Args:
+        result_lists (list): Lists of dicts with 'uuid', 'properties' and 'score', best first.
+        limit (int): Maximum number of fused results.
+        k (int): The RRF rank constant.
+
+    Returns:
+        list: The fused results, best first, with 'score' set to the fused score.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            entry = fused.setdefault(doc["uuid"], {**doc, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda d: d["score"], reverse=True)[:limit]
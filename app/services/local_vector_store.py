@@ -0,0 +1,565 @@
+import os
+import re
+import json
+import asyncio
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+from .vector_backends import VectorBackend
+from .text_utils import like_matcher
+from .file_utils import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Properties with their own indexed column in the metadata sidecar
+FILTER_COLUMNS = ("name", "active", "date")
+DTYPES = {"float32": np.float32, "int8": np.int8}
+# Rows scored at a time by the exhaustive search, bounding the float32 copy of int8 vectors
+SCAN_BLOCK_ROWS = 16384
+
+
+def _to_column(property, value):
+    if property == "active":
+        return None if value is None else int(bool(value))
+    return value
+
+
+def _like_text(value, property=None):
+    # The lowered text like_matcher matches a value against; registered as a sqlite function
+    if property is not None:
+        value = json.loads(value).get(property)
+    return str(value).lower()
+
+
+def _column_value(property, value):
+    # Converts a sidecar column back to the property value
+    if property not in FILTER_COLUMNS:
+        return json.loads(value).get(property)
+    if property == "active" and value is not None:
+        return bool(value)
+    return value
+
+
+def _project(text, return_properties):
+    properties = json.loads(text)
+    if return_properties is not None:
+        properties = {key: properties.get(key) for key in return_properties}
+    return properties
+
+
+def _dense(vectors, scales, rows):
+    """Returns the vectors of some rows as float32."""
+    dense = np.asarray(vectors[rows], dtype=np.float32)
+    if scales is not None:
+        dense *= scales[rows][:, None]
+    return dense
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorBackend(VectorBackend):
+    """
+    An embedded vector store in a local directory, for offline development and for serving
+    retrieval without a network round trip.
+
+    Vectors are stored normalized in a memory-mapped file, as float32 or as int8 with one
+    scale per row, so the process only keeps the pages it touches in memory. Properties live
+    in a sqlite sidecar with indexed name, active and date columns for the document filters.
+
+    Small collections are searched exhaustively. Once a collection has `ann_min_rows`
+    objects, an inverted-file index is trained with spherical k-means (about sqrt(n) cells)
+    and a search only scores the rows of the `nprobe` cells nearest to the query. New rows
+    join their nearest cell, and the index is retrained whenever the collection has doubled.
+
+    Several uvicorn workers can share a store: writes are serialized with a file lock and
+    bump a manifest, which the other workers check at most every `check_interval` seconds
+    to reload.
+    """
+
+    name = "local"
+
+    def __init__(self, path, dtype="float32", nprobe=8, ann_min_rows=4096, check_interval=1.0):
+        """
+        Args:
+            path (str): The store directory; created if missing.
+            dtype (str): 'float32' or 'int8'. int8 needs a quarter of the memory at a small
+                cost in precision.
+            nprobe (int): Number of index cells scanned per search; more is slower and closer
+                to an exhaustive search.
+            ann_min_rows (int): Collection size from which the index is used.
+            check_interval (float): Minimum seconds between two checks for writes made by
+                other processes.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.nprobe = nprobe
+        self.ann_min_rows = ann_min_rows
+        self.check_interval = check_interval
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.lock_path = os.path.join(path, ".lock")
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(path, "metadata.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.create_function("like_text", -1, _like_text, deterministic=True)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "row INTEGER PRIMARY KEY, uuid TEXT UNIQUE NOT NULL, name TEXT, active INTEGER, date TEXT, "
+            "properties TEXT NOT NULL)"
+        )
+        for column in FILTER_COLUMNS:
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS objects_{column} ON objects ({column})")
+        self._db.commit()
+        self._training = False
+        self._trained_rows = 0
+        self._signature = None
+        self._next_check = 0.0
+        self._load()
+
+    # Loading and files
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open_array(self, name, dtype, shape):
+        path = self._file(name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if not os.path.exists(path) or os.path.getsize(path) < size:
+            with open(path, 'ab') as file:
+                file.truncate(size)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _load(self):
+        """(Re)loads the store from disk."""
+        self._signature = self._stat()
+        manifest = self._read_manifest()
+        if manifest.get("dtype", self.dtype) != self.dtype:
+            raise ValueError(
+                f"The vector store at {self.path} holds {manifest['dtype']} vectors; "
+                f"delete it or set the dtype to {manifest['dtype']}"
+            )
+        self._dim = manifest.get("dim")
+        self._rows = manifest.get("rows", 0)
+        self._capacity = manifest.get("capacity", 0)
+        self._trained_rows = manifest.get("trained_rows", 0)
+        self._vectors = self._scales = self._cells = None
+        if self._dim:
+            self._map_arrays()
+        self._live = np.zeros(self._capacity, dtype=bool)
+        self._uuid_at = [None] * self._capacity
+        self._row_of = {}
+        for row, object_id in self._db.execute("SELECT row, uuid FROM objects"):
+            self._live[row] = True
+            self._uuid_at[row] = object_id
+            self._row_of[object_id] = row
+        self._free = [row for row in range(self._rows - 1, -1, -1) if not self._live[row]]
+        self._centroids = None
+        if manifest.get("trained_rows") and os.path.exists(self._file("centroids.npy")):
+            self._centroids = np.load(self._file("centroids.npy"))
+        self._lists = None
+
+    def _map_arrays(self):
+        self._vectors = self._open_array(f"vectors.{self.dtype}", DTYPES[self.dtype], (self._capacity, self._dim))
+        if self.dtype == "int8":
+            self._scales = self._open_array("scales.float32", np.float32, (self._capacity,))
+        self._cells = self._open_array("cells.int32", np.int32, (self._capacity,))
+
+    def _grow(self, rows):
+        capacity = max(1024, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        for array in (self._vectors, self._scales, self._cells):
+            if array is not None:
+                array.flush()
+        added = capacity - self._capacity
+        self._capacity = capacity
+        self._map_arrays()
+        self._live = np.concatenate([self._live, np.zeros(added, dtype=bool)])
+        self._uuid_at.extend([None] * added)
+
+    def _write_manifest(self):
+        manifest = self._read_manifest()
+        atomic_write(self.manifest_path, json.dumps({
+            "dim": self._dim,
+            "dtype": self.dtype,
+            "rows": self._rows,
+            "capacity": self._capacity,
+            "trained_rows": self._trained_rows,
+            "generation": manifest.get("generation", 0) + 1,
+            "updated_at": time.time(),
+        }))
+        self._signature = self._stat()
+
+    def _refresh(self, force=False):
+        # Picks up writes made by other processes
+        if not force and time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+        if self._stat() != self._signature:
+            self._load()
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                self._refresh(force=True)
+                yield
+                return
+            with open(self.lock_path, 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh(force=True)
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Vectors and index
+
+    def _store_vectors(self, rows, vectors):
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._vectors[rows] = vectors
+        if self._centroids is not None:
+            self._cells[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+        else:
+            self._cells[rows] = -1
+
+    def _posting_lists(self):
+        # Live rows grouped by index cell, rebuilt lazily after writes
+        if self._lists is None:
+            rows = np.flatnonzero(self._live[:self._rows])
+            cells = np.asarray(self._cells[rows])
+            order = np.argsort(cells, kind="stable")
+            rows, cells = rows[order], cells[order]
+            bounds = np.searchsorted(cells, np.arange(len(self._centroids) + 1))
+            self._lists = (rows, bounds)
+        return self._lists
+
+    def _candidates(self, query):
+        if self._centroids is None or len(self._row_of) < self.ann_min_rows:
+            return None
+        rows, bounds = self._posting_lists()
+        nprobe = min(self.nprobe, len(self._centroids))
+        cells = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([rows[bounds[cell]:bounds[cell + 1]] for cell in cells])
+
+    def query(self, vector, limit):
+        """
+        Returns the nearest objects of a query vector; the blocking version of search.
+
+        Returns:
+            list: (uuid, properties, cosine distance) tuples, nearest first.
+        """
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            if not self._row_of:
+                return []
+            if len(query) != self._dim:
+                raise ValueError(f"Query vectors have {len(query)} dimensions, the store {self._dim}")
+            # Only the candidates are picked under the lock; the scan runs on references to the
+            # current memory maps, which stay valid if a write remaps them meanwhile
+            rows = self._candidates(query)
+            count, vectors, scales = self._rows, self._vectors, self._scales
+            live = self._live[:count].copy() if rows is None else None
+            limit = min(limit, len(self._row_of))
+        if rows is None:
+            # Exhaustive search over contiguous slices, no gather needed
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, SCAN_BLOCK_ROWS):
+                end = min(start + SCAN_BLOCK_ROWS, count)
+                if scales is not None:
+                    block = vectors[start:end].astype(np.float32) @ query
+                    scores[start:end] = block * scales[start:end]
+                else:
+                    scores[start:end] = np.asarray(vectors[start:end]) @ query
+            scores = np.where(live, scores, -np.inf)
+            rows = np.arange(count)
+        else:
+            scores = _dense(vectors, scales, rows) @ query
+        limit = min(limit, len(rows))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        hits = [(int(rows[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+        placeholders = ",".join("?" * len(hits))
+        # Rows deleted during the scan are dropped; the ids are read with the properties
+        with self._lock:
+            objects = {
+                row: (object_id, json.loads(text)) for row, object_id, text in self._db.execute(
+                    f"SELECT row, uuid, properties FROM objects WHERE row IN ({placeholders})", [row for row, _ in hits])
+            }
+        return [(*objects[row], 1.0 - score) for row, score in hits if row in objects]
+
+    async def search(self, vector, limit):
+        # The scan and the sidecar reads block, and the lock may be held by a write
+        return await asyncio.to_thread(self.query, vector, limit)
+
+    def train(self, iterations=10, sample_size=20000, seed=0):
+        """
+        Trains the inverted-file index on the current vectors and assigns every row to a cell.
+        Called automatically by write; the search keeps using the previous index meanwhile.
+        """
+        with self._lock:
+            if self._training or not self._row_of:
+                return
+            self._training = True
+            live = np.flatnonzero(self._live[:self._rows])
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live, min(len(live), sample_size), replace=False))
+            data = _dense(self._vectors, self._scales, sample)
+        try:
+            # Spherical k-means on a sample, outside the lock
+            cells = int(np.clip(np.sqrt(len(live)), 8, 4096))
+            centroids = data[rng.choice(len(data), min(cells, len(data)), replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, data)
+                empty = np.bincount(assignment, minlength=len(centroids)) == 0
+                sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+                centroids = _normalize(sums)
+            with self._write_lock():
+                for start in range(0, self._rows, 16384):
+                    rows = np.arange(start, min(start + 16384, self._rows))
+                    self._cells[rows] = np.argmax(_dense(self._vectors, self._scales, rows) @ centroids.T, axis=1)
+                self._cells.flush()
+                np.save(self._file("centroids.tmp.npy"), centroids)
+                os.replace(self._file("centroids.tmp.npy"), self._file("centroids.npy"))
+                self._centroids = centroids
+                self._trained_rows = len(self._row_of)
+                self._lists = None
+                self._write_manifest()
+            logger.info(f"Vector index trained: {len(centroids)} cells over {self._trained_rows} vectors")
+        finally:
+            self._training = False
+
+    def _needs_training(self):
+        return len(self._row_of) >= self.ann_min_rows and (
+            self._centroids is None or len(self._row_of) >= 2 * self._trained_rows)
+
+    # Objects
+
+    def write(self, objects):
+        failed = [(str(object_id), "Missing vector") for object_id, _, vector in objects if vector is None]
+        objects = [(str(object_id), properties, vector) for object_id, properties, vector in objects if vector is not None]
+        if not objects:
+            return failed
+        vectors = _normalize(np.asarray([vector for _, _, vector in objects], dtype=np.float32))
+        with self._write_lock():
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Vectors have {vectors.shape[1]} dimensions, the store at {self.path} {self._dim}; "
+                    f"delete the store to change the embedding model"
+                )
+            rows = []
+            for object_id, _, _ in objects:
+                row = self._row_of.get(object_id)
+                if row is None:
+                    row = self._free.pop() if self._free else self._rows
+                    self._rows = max(self._rows, row + 1)
+                rows.append(row)
+            self._grow(self._rows)
+            if self._vectors is None:
+                self._map_arrays()
+            self._store_vectors(np.asarray(rows), vectors)
+            self._vectors.flush()
+            if self._scales is not None:
+                self._scales.flush()
+            self._cells.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO objects (row, uuid, name, active, date, properties) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (row, object_id, *(_to_column(c, properties.get(c)) for c in FILTER_COLUMNS),
+                     json.dumps(properties, ensure_ascii=False))
+                    for row, (object_id, properties, _) in zip(rows, objects)
+                ]
+            )
+            self._db.commit()
+            for row, (object_id, _, _) in zip(rows, objects):
+                self._live[row] = True
+                self._uuid_at[row] = object_id
+                self._row_of[object_id] = row
+            self._lists = None
+            self._write_manifest()
+        if self._needs_training():
+            self.train()
+        return failed
+
+    def _select(self, where="", params=(), return_properties=None):
+        with self._lock:
+            self._refresh()
+            rows = self._db.execute(f"SELECT uuid, properties FROM objects {where}", params).fetchall()
+        return [(object_id, _project(text, return_properties)) for object_id, text in rows]
+
+    def find(self, property, value, return_properties=None):
+        if property in FILTER_COLUMNS:
+            return self._select(f"WHERE {property} = ?", (_to_column(property, value),), return_properties)
+        return [
+            (object_id, properties) for object_id, properties in self._select()
+            if properties.get(property) == value
+        ]
+
+    def fetch_page(self, after=None, limit=1000, return_properties=None):
+        return self._select(
+            "WHERE uuid > ? ORDER BY uuid LIMIT ?", (after or "", limit), return_properties
+        )
+
+    @staticmethod
+    def _like_condition(property, pattern, matches):
+        """
+        Translates a like pattern to a condition on the sidecar that every match satisfies.
+
+        Equality and prefix patterns become exact comparisons of the lowered value unless they
+        could also match a single word of it, in which case, like the other patterns, they
+        select the values containing their literal parts; the matcher confirms those.
+
+        Returns:
+            tuple: (condition, params).
+        """
+        if property == "active":
+            # Only three values to test, then the indexed column does the rest
+            values = [int(value) for value in (True, False) if matches(value)]
+            clauses = [f"active IN ({','.join('?' * len(values))})"] if values else []
+            if matches(None):
+                clauses.append("active IS NULL")
+            return "(" + " OR ".join(clauses or ["0"]) + ")", values
+        if property in FILTER_COLUMNS:
+            expression, params = f"like_text({property})", []
+        else:
+            expression, params = "like_text(properties, ?)", [property]
+        text = str(pattern).lower()
+        literal = text[:-1] if text.endswith("*") else text
+        if "*" not in literal and "?" not in literal and not re.fullmatch(r"\w+", literal):
+            if literal == text:
+                return f"{expression} = ?", params + [literal]
+            return f"substr({expression}, 1, {len(literal)}) = ?", params + [literal]
+        parts = [part for part in re.split(r"[*?]", text) if part]
+        if not parts:
+            return "1", []
+        return " AND ".join([f"instr({expression}, ?) > 0"] * len(parts)), [
+            value for part in parts for value in (*params, part)]
+
+    def find_like(self, property, pattern, after=None, limit=100, return_properties=None):
+        matches = like_matcher(pattern)
+        column = property if property in FILTER_COLUMNS else "properties"
+        condition, params = self._like_condition(property, pattern, matches)
+        # Walk the candidates in uuid order one query at a time, so the lock is never held for
+        # the whole walk, and stop once the page is full
+        found = []
+        while len(found) < limit:
+            with self._lock:
+                self._refresh()
+                batch = self._db.execute(
+                    f"SELECT uuid, {column}, properties FROM objects WHERE uuid > ? AND {condition} "
+                    f"ORDER BY uuid LIMIT ?", (after or "", *params, limit)).fetchall()
+            for object_id, value, text in batch:
+                if matches(_column_value(property, value)):
+                    found.append((object_id, _project(text, return_properties)))
+                    if len(found) == limit:
+                        break
+            if len(batch) < limit:
+                break
+            after = batch[-1][0]
+        return found
+
+    def update(self, object_id, properties):
+        with self._write_lock():
+            row = self._db.execute("SELECT properties FROM objects WHERE uuid = ?", (str(object_id),)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown object: {object_id}")
+            merged = {**json.loads(row[0]), **properties}
+            self._db.execute(
+                "UPDATE objects SET name = ?, active = ?, date = ?, properties = ? WHERE uuid = ?",
+                (*(_to_column(c, merged.get(c)) for c in FILTER_COLUMNS),
+                 json.dumps(merged, ensure_ascii=False), str(object_id))
+            )
+            self._db.commit()
+            self._write_manifest()
+
+    def delete(self, object_ids):
+        object_ids = [str(object_id) for object_id in object_ids]
+        if not object_ids:
+            return 0
+        with self._write_lock():
+            rows = [self._row_of.pop(object_id) for object_id in object_ids if object_id in self._row_of]
+            self._db.executemany("DELETE FROM objects WHERE row = ?", [(row,) for row in rows])
+            self._db.commit()
+            for row in rows:
+                self._live[row] = False
+                self._uuid_at[row] = None
+            self._free.extend(rows)
+            self._lists = None
+            self._write_manifest()
+        return len(rows)
+
+    def delete_like(self, property, pattern):
+        matches = like_matcher(pattern)
+        column = property if property in FILTER_COLUMNS else "properties"
+        condition, params = self._like_condition(property, pattern, matches)
+        with self._lock:
+            self._refresh()
+            values = self._db.execute(f"SELECT uuid, {column} FROM objects WHERE {condition}", params).fetchall()
+        object_ids = [object_id for object_id, value in values if matches(_column_value(property, value))]
+        deleted = self.delete(object_ids)
+        return {"matches": len(object_ids), "successful": deleted, "failed": len(object_ids) - deleted}
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "objects": len(self._row_of),
+                "dimensions": self._dim,
+                "dtype": self.dtype,
+                "index_cells": len(self._centroids) if self._centroids is not None else 0,
+                "indexed": self._centroids is not None and len(self._row_of) >= self.ann_min_rows,
+            }
+
+    async def close(self):
+        with self._lock:
+            for array in (self._vectors, self._scales, self._cells):
+                if array is not None:
+                    array.flush()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,214 @@
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits to slow LLM answers
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames and self.type != "histogram":
+            # Unlabelled counters and gauges are exposed from the start
+            items = [((), 0)]
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, set when it is measured."""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Counts observations in cumulative buckets and tracks their sum."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_sample(self, key, entry):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, entry["counts"]):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(entry['sum'])}")
+        lines.append(f"{self.name}_count{labels} {entry['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of this process and renders them in the Prometheus text format.
+
+    Metrics live for the whole process, so they survive client pool swaps. Every uvicorn
+    worker keeps its own registry; Prometheus scrapes and aggregates them per instance.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Chat pipeline
+REQUESTS = REGISTRY.counter(
+    "chatbot_requests_total", "Chat requests by channel, mode and outcome.", ("channel", "mode", "status"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chatbot_request_seconds", "End-to-end latency of chat requests.", ("channel", "mode"))
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "chatbot_time_to_first_token_seconds", "Time from the request to the first streamed token.", ("channel",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "chatbot_stage_seconds",
+    "Latency of the pipeline stages: translate, embed, retrieve, rerank, prompt, llm_first_token and llm.",
+    ("stage",))
+PROMPT_TOKENS = REGISTRY.counter("chatbot_prompt_tokens_total", "Prompt tokens sent to the LLM.")
+COMPLETION_TOKENS = REGISTRY.counter("chatbot_completion_tokens_total", "Completion tokens received from the LLM.")
+REQUEST_PROMPT_TOKENS = REGISTRY.histogram(
+    "chatbot_prompt_tokens", "Prompt tokens sent to the LLM per chat request.", ("channel",),
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000))
+CACHE_REQUESTS = REGISTRY.counter(
+    "chatbot_cache_requests_total", "Cache lookups by cache and result (hit or miss).", ("cache", "result"))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "chatbot_upstream_errors_total", "Failed calls to upstream services.", ("service",))
+COALESCED_REQUESTS = REGISTRY.counter(
+    "chatbot_coalesced_requests_total", "Chat requests that joined an identical computation already in flight, by stage (prepare, complete or stream).",
+    ("mode",))
+
+# Ingestion
+INGESTION_JOBS = REGISTRY.counter("chatbot_ingestion_jobs_total", "Finished ingestion jobs by status.", ("status",))
+INGESTION_SECONDS = REGISTRY.histogram(
+    "chatbot_ingestion_job_seconds", "Duration of ingestion jobs.",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0))
+INGESTED_CHUNKS = REGISTRY.counter("chatbot_ingested_chunks_total", "Chunks embedded and written by ingestion.")
+EMBEDDING_RETRIES = REGISTRY.counter("chatbot_embedding_retries_total", "Retried embedding batches during ingestion.")
+
+# Local embedding model
+LOCAL_EMBEDDING_BATCH = REGISTRY.histogram(
+    "chatbot_local_embedding_batch_size", "Texts embedded per forward pass of the local embedding model.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+# Sampled at scrape time
+IN_FLIGHT = REGISTRY.gauge("chatbot_in_flight_requests", "Requests holding a lease on the current client pool.")
+PENDING_JOBS = REGISTRY.gauge("chatbot_pending_ingestion_jobs", "Queued and running ingestion jobs.")
+
+
+def log_sampled(log, rate, message):
+    """
+    Logs a full-text message (questions, answers) for a sample of requests only.
+
+    Args:
+        log (logging.Logger): The logger to use.
+        rate (float): Share of calls that are logged, 0 to disable.
+        message (str): The message.
+    """
+    if rate > 0 and (rate >= 1 or random.random() < rate):
+        log.info(message)
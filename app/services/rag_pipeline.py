@@ -1,7 +1,18 @@
 from langchain_core.prompts import PromptTemplate
 from typing import AsyncGenerator
-import cohere, os
+from collections import OrderedDict
+from contextlib import contextmanager
+import asyncio, os, time
 import logging
+from .text_utils import normalize_question, estimate_tokens
+from .context_builder import ContextBuilder
+from .rerankers import NoopReranker
+from .lexical_index import reciprocal_rank_fusion
+from .single_flight import SingleFlight
+from .metrics import (
+    CACHE_REQUESTS, COALESCED_REQUESTS, COMPLETION_TOKENS, PROMPT_TOKENS, REQUEST_PROMPT_TOKENS, REQUESTS,
+    REQUEST_SECONDS, STAGE_SECONDS, TIME_TO_FIRST_TOKEN, UPSTREAM_ERRORS, log_sampled,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,105 +31,381 @@ def load_template_from_file():
         # Handle other potential exceptions
         raise ValueError(f"Error reading template file: {e}")
 
+# System preamble per answer language
+PREAMBLES = {
+    "ar": "أنت شات بوت تعمل كموظف خدمة زبائن لدى شركة سيرياتيل.",
+    "en": "You are a chatbot working as a customer service agent for Syriatel. Always answer in English.",
+}
+
+# Appended to the prompt so the model answers directly in the user's language,
+# overriding the Arabic-only instruction of the prompt template
+LANGUAGE_INSTRUCTIONS = {
+    "ar": "",
+    "en": "\n\nImportant: the user wrote in English. Write the whole answer, including the suggested questions, in English only.",
+}
+
+def _record_tokens(response, prompt, completion, channel):
+    # Billed tokens reported by Cohere, estimated when the response does not carry them
+    units = getattr(getattr(response, "meta", None), "billed_units", None)
+    input_tokens = getattr(units, "input_tokens", None)
+    output_tokens = getattr(units, "output_tokens", None)
+    prompt_tokens = int(input_tokens) if input_tokens is not None else estimate_tokens(prompt)
+    PROMPT_TOKENS.inc(prompt_tokens)
+    REQUEST_PROMPT_TOKENS.observe(prompt_tokens, channel=channel)
+    COMPLETION_TOKENS.inc(int(output_tokens) if output_tokens is not None else estimate_tokens(completion))
+
 class RAGPipeline:
-    def __init__(self, collection, embedder, cohere_api_key, k=20):
-        self.collection = collection
+    """
+    Retrieval-augmented chat pipeline.
+
+    Every upstream call is awaited: Cohere and the vector store through their async APIs and the
+    embedding model, which only has a blocking client, through a bounded executor. Concurrent
+    requests in the same worker therefore overlap instead of queueing behind each other.
+
+    Identical questions asked at the same time (same normalized text, language and prompt
+    template) share the work that does not depend on the conversation: translation,
+    embedding, the answer cache lookup, retrieval and prompt building. Generation uses the
+    Cohere conversation history, so it is only shared by identical requests of the same
+    conversation (e.g. a message sent twice), whose streams fan out from the same tokens.
+    """
+
+    def __init__(self, vector_store, embedder, cohere_client, executor=None, embedding_cache=None,
+                 answer_cache=None, translation_cache_size=2000, context_builder=None, reranker=None,
+                 candidates=None, lexical_index=None, template_registry=None, log_sample_rate=0.0,
+                 coalesce=True, k=20):
+        """
+        Args:
+            vector_store (VectorBackend): The vector backend searched for the question.
+            embedder: The embedding model used to embed questions.
+            cohere_client (cohere.AsyncClient): The pooled Cohere client.
+            executor (concurrent.futures.Executor): Executor for the blocking embedding calls.
+            embedding_cache (EmbeddingCache): Optional cache of query embeddings.
+            answer_cache (SemanticAnswerCache): Optional cache of answers to similar questions.
+            translation_cache_size (int): Number of translated questions kept in memory.
+            context_builder (ContextBuilder): Packs retrieved chunks into the prompt context.
+            reranker (NoopReranker): Re-ranks the vector-search candidates locally.
+            candidates (int): Number of candidates fetched from the vector store; defaults to k.
+            lexical_index (LexicalIndex): When given, retrieval fuses BM25 hits with vector hits.
+            template_registry (TemplateRegistry): Source of the prompt template; when None the
+                template file is read once.
+            log_sample_rate (float): Share of requests whose question and answer are logged.
+            coalesce (bool): Share one computation between identical concurrent questions.
+            k (int): Number of documents kept for the prompt.
+        """
+        self.vector_store = vector_store
         self.embedder = embedder
         self.k = k
-        self.prompt_template = PromptTemplate.from_template(self._get_default_template())
-        self.co = cohere.Client(api_key=cohere_api_key)
+        self.template_registry = template_registry
+        self._prompt_template = None if template_registry else PromptTemplate.from_template(self._get_default_template())
+        self.co = cohere_client
+        self.executor = executor
+        self.embedding_cache = embedding_cache
+        self.answer_cache = answer_cache
+        self.translation_cache_size = translation_cache_size
+        self._translations = OrderedDict()
+        self.context_builder = context_builder or ContextBuilder()
+        self.reranker = reranker or NoopReranker()
+        self.candidates = max(candidates or k, k)
+        self.lexical_index = lexical_index
+        self.log_sample_rate = log_sample_rate
+        self.flights = SingleFlight(enabled=coalesce)
         
     def _get_default_template(self):
         return load_template_from_file()
 
-    def generate_response(self, question, conversation_id, is_en=False):
+    @property
+    def prompt_template(self):
+        if self.template_registry is not None:
+            return self.template_registry.get()
+        return self._prompt_template
+
+    def reload_template(self):
+        """Re-reads the prompt template after it was updated from the dashboard."""
+        if self.template_registry is not None:
+            self.template_registry.refresh(force=True)
+        else:
+            self._prompt_template = PromptTemplate.from_template(self._get_default_template())
+
+    async def generate_response(self, question, conversation_id, is_en=False, channel="chat"):
+        started = time.perf_counter()
         try:
-            logger.info("Generating response")
-            if is_en:
-                question = self._translate(question, lang="ar")     
-            logger.info(f"question: {question}")
-            retrieved_docs = self._retrieve_documents(question)
-            message = self._create_prompt(retrieved_docs, question)
-            response = self._query_model(message, conversation_id)
-            
-            if is_en:
-                response = self._translate(response, lang="en")
-            logger.info(f"response: {response}")
+            language = "en" if is_en else "ar"
+            with self._join("complete", question, language,
+                            lambda flight: self._generate(flight, question, conversation_id, language, channel),
+                            conversation_id) as flight:
+                response = "".join([chunk async for chunk in flight.follow()])
+            self._record_request(channel, "complete", flight.result, started)
             return response
         except Exception as e:
             logger.error(f"Error generating response: {e}")
+            self._record_request(channel, "complete", "error", started)
             return f"Error generating response: {e}"
 
-    async def stream_response(self, question, conversation_id, is_en=False):
+    async def stream_response(self, question, conversation_id, is_en=False, channel="chat"):
+        started = time.perf_counter()
+        first_token = True
         try:
-            if is_en:
-                question = self._translate(question, lang="ar")     
-            
-            retrieved_docs = self._retrieve_documents(question)
-            message = self._create_prompt(retrieved_docs, question)
-            if is_en:
-                response_ar = self._query_model(message, conversation_id)
-                response = self.co.chat_stream(
-                    model="command-r-plus",
-                    message=f'ترجم لي هذا إلى الانجليزية بطريقة صحيحة بدون أيا كلمات زائدة : {response_ar}',
-                )
-                for event in response:
-                    if event.event_type == "text-generation":
-                        yield event.text
-            else:
-                response = self.co.chat_stream(
-                    model="command-r-plus",
-                    message=message,
-                    preamble="أنت شات بوت تعمل كموظف خدمة زبائن لدى شركة سيرياتيل.",
-                    conversation_id=conversation_id,
-                    max_tokens=1500,  # max number of generated tokens
-                    temperature=0.3,  # Higher temperatures mean more random generations.
-                )
-                for event in response:
-                    if event.event_type == "text-generation":
-                        yield event.text
+            language = "en" if is_en else "ar"
+            with self._join("stream", question, language,
+                            lambda flight: self._stream(flight, question, conversation_id, language, channel),
+                            conversation_id) as flight:
+                async for chunk in flight.follow():
+                    if first_token:
+                        first_token = False
+                        TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, channel=channel)
+                    yield chunk
+            self._record_request(channel, "stream", flight.result, started)
         except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            self._record_request(channel, "stream", "error", started)
             yield f"Error generating response: {str(e)}"
 
-    def _retrieve_documents(self, question):
+    @contextmanager
+    def _join(self, mode, question, language, produce, conversation_id=None):
+        # Template changes alter the answer, so requests on different templates never share
+        template = self.template_registry.fingerprint if self.template_registry is not None else None
+        key = (mode, conversation_id, normalize_question(question), language, template)
+        with self.flights.join(key, produce) as (flight, shared):
+            if shared:
+                COALESCED_REQUESTS.inc(mode=mode)
+            yield flight
+
+    async def _prepare(self, question, language):
+        """
+        Runs the conversation-independent stages once for concurrent identical questions.
+
+        Returns:
+            dict: 'cached' (a cached answer), or 'message' (the prompt), 'query_vector' and
+            'generation' (the answer cache generation the answer must be stored under).
+        """
+        with self._join("prepare", question, language,
+                        lambda flight: self._prepare_flight(flight, question, language)) as flight:
+            async for _ in flight.follow():
+                pass
+        return flight.result
+
+    async def _prepare_flight(self, flight, question, language):
+        # The documents are in Arabic, so retrieval always runs on an Arabic question
+        search_question = await self._translate_question(question) if language == "en" else question
+        log_sampled(logger, self.log_sample_rate, f"question: {search_question}")
+        query_vector = await self._embed_query(search_question)
+        cached = self._lookup_answer(query_vector, language)
+        if cached is not None:
+            flight.result = {"cached": cached}
+            return
+        generation = self._answer_cache_generation()
+        retrieved_docs = await self._retrieve_documents(search_question, query_vector)
+        flight.result = {
+            "message": self._create_prompt(retrieved_docs, question, language),
+            "query_vector": query_vector,
+            "generation": generation,
+        }
+
+    async def _generate(self, flight, question, conversation_id, language, channel):
+        prepared = await self._prepare(question, language)
+        if "cached" in prepared:
+            flight.result = "cached"
+            flight.publish(prepared["cached"])
+            return
+        response = await self._query_model(prepared["message"], conversation_id, language, channel)
+        self._store_answer(prepared["query_vector"], language, response, prepared["generation"])
+        log_sampled(logger, self.log_sample_rate, f"response: {response}")
+        flight.result = "ok"
+        flight.publish(response)
+
+    async def _stream(self, flight, question, conversation_id, language, channel):
+        prepared = await self._prepare(question, language)
+        if "cached" in prepared:
+            flight.result = "cached"
+            async for chunk in self._replay(prepared["cached"]):
+                flight.publish(chunk)
+            return
+        async for text in self._stream_model(prepared["message"], conversation_id, language, channel):
+            flight.publish(text)
+        answer = "".join(flight.chunks)
+        self._store_answer(prepared["query_vector"], language, answer, prepared["generation"])
+        log_sampled(logger, self.log_sample_rate, f"response: {answer}")
+        flight.result = "ok"
+
+    def _record_request(self, channel, mode, status, started):
+        REQUESTS.inc(channel=channel, mode=mode, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, channel=channel, mode=mode)
+
+    def _lookup_answer(self, query_vector, language):
+        if self.answer_cache is None:
+            return None
+        answer = self.answer_cache.lookup(query_vector, language)
+        CACHE_REQUESTS.inc(cache="answer", result="hit" if answer is not None else "miss")
+        return answer
+
+    def _answer_cache_generation(self):
+        return self.answer_cache.current_generation() if self.answer_cache is not None else 0
+
+    def _store_answer(self, query_vector, language, answer, generation):
+        if self.answer_cache is not None and answer:
+            self.answer_cache.store(query_vector, language, answer, generation)
+
+    async def _replay(self, answer, words_per_chunk=4):
+        # Replay a cached answer as a stream so clients see the usual incremental output
+        words = answer.split(" ")
+        for i in range(0, len(words), words_per_chunk):
+            chunk = " ".join(words[i:i + words_per_chunk])
+            yield chunk if i + words_per_chunk >= len(words) else chunk + " "
+            await asyncio.sleep(0)
+
+    async def _embed_query(self, question):
+        with STAGE_SECONDS.time(stage="embed"):
+            if self.embedding_cache is not None:
+                cached = self.embedding_cache.get(question)
+                if cached is not None:
+                    CACHE_REQUESTS.inc(cache="embedding", result="hit")
+                    return cached
+            # The embedding client is blocking, so keep it off the event loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._embed_query_uncached, question)
+
+    def _embed_query_uncached(self, question):
+        if self.embedding_cache is None:
+            return self._call_embedder(question)
+        vector = self.embedding_cache.get_persistent(question)
+        CACHE_REQUESTS.inc(cache="embedding", result="hit" if vector is not None else "miss")
+        if vector is None:
+            vector = self._call_embedder(question)
+            self.embedding_cache.set(question, vector)
+        return vector
+
+    def _call_embedder(self, question):
         try:
-            embedder_qu = self.embedder.embed_query(question)
-            result = self.collection.query.near_vector(
-                near_vector= embedder_qu , 
-                limit=self.k
+            return self.embedder.embed_query(question)
+        except Exception:
+            UPSTREAM_ERRORS.inc(service="embedder")
+            raise
+
+    async def _retrieve_documents(self, question, query_vector=None):
+        try:
+            embedder_qu = query_vector if query_vector is not None else await self._embed_query(question)
+            started = time.perf_counter()
+            try:
+                result = await self.vector_store.search(embedder_qu, self.candidates)
+            except Exception:
+                UPSTREAM_ERRORS.inc(service=self.vector_store.name)
+                raise
+            retrieved_docs = [
+                {
+                    "uuid": object_id,
+                    "properties": properties,
+                    "score": 1.0 - distance if distance is not None else 0.0,
+                }
+                for object_id, properties, distance in result
+            ]
+            if self.lexical_index is not None:
+                # Hybrid mode: fuse exact-term hits with the vector hits
+                lexical_docs = self.lexical_index.search(question, self.candidates)
+                retrieved_docs = reciprocal_rank_fusion([retrieved_docs, lexical_docs], self.candidates)
+            retrieval_ms = (time.perf_counter() - started) * 1000
+            STAGE_SECONDS.observe(retrieval_ms / 1000, stage="retrieve")
+            started = time.perf_counter()
+            retrieved_docs = await self._rerank(question, retrieved_docs)
+            rerank_ms = (time.perf_counter() - started) * 1000
+            STAGE_SECONDS.observe(rerank_ms / 1000, stage="rerank")
+            logger.debug(
+                f"retrieval: {retrieval_ms:.1f} ms for {self.candidates} candidates, "
+                f"rerank ({self.reranker.name}): {rerank_ms:.1f} ms to {len(retrieved_docs)}"
             )
-            retrieved_docs = []
-            for o in result.objects:
-                retrieved_docs.append(o.properties)
-            return {f'doc_{i}': doc for i, doc in enumerate(retrieved_docs)}
+            return retrieved_docs
         except Exception as e:
             raise ValueError(f"Error retrieving documents: {e}")
 
-    def _create_prompt(self, docs, question):
-        return self.prompt_template.format(context=docs, question=question)
+    async def _rerank(self, question, docs):
+        if type(self.reranker) is NoopReranker:
+            return self.reranker.rerank(question, docs, self.k)
+        # Scoring is CPU-bound, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.reranker.rerank, question, docs, self.k)
+
+    def _create_prompt(self, docs, question, language="ar"):
+        with STAGE_SECONDS.time(stage="prompt"):
+            context, stats = self.context_builder.build(docs)
+            message = self.prompt_template.format(context=context, question=question) + LANGUAGE_INSTRUCTIONS[language]
+        log_sampled(
+            logger, self.log_sample_rate,
+            f"prompt tokens: {estimate_tokens(message)} "
+            f"(context {stats['context_tokens']}, chunks {stats['packed']}/{stats['retrieved']}, "
+            f"duplicates {stats['duplicates']})"
+        )
+        return message
+
+    async def _query_model(self, message, conversation_id, language="ar", channel="chat"):
+        try:
+            with STAGE_SECONDS.time(stage="llm"):
+                response = await self.co.chat(
+                    model="command-r-plus",
+                    message=message,
+                    preamble=PREAMBLES[language],
+                    conversation_id=conversation_id,
+                    max_tokens=1500, # max number of generated tokens
+                    temperature=0.3, # Higher temperatures mean more random generations.
+                )
+            _record_tokens(response, message, response.text, channel)
+            return response.text
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(service="cohere")
+            raise ValueError(f"Error querying model: {e}")
 
-    def _query_model(self, message, conversation_id):
+    async def _stream_model(self, message, conversation_id, language="ar", channel="chat"):
+        started = time.perf_counter()
+        parts = []
+        final = None
         try:
-            response = self.co.chat(
+            response = self.co.chat_stream(
                 model="command-r-plus",
                 message=message,
-                preamble="أنت شات بوت تعمل كموظف خدمة زبائن لدى شركة سيرياتيل.",
+                preamble=PREAMBLES[language],
                 conversation_id=conversation_id,
-                max_tokens=1500, # max number of generated tokens
-                temperature=0.3, # Higher temperatures mean more random generations.
+                max_tokens=1500,  # max number of generated tokens
+                temperature=0.3,  # Higher temperatures mean more random generations.
             )
-            return response.text
-        except Exception as e:
-            raise ValueError(f"Error querying model: {e}")
+            async for event in response:
+                if event.event_type == "text-generation":
+                    if not parts:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_first_token")
+                    parts.append(event.text)
+                    yield event.text
+                elif event.event_type == "stream-end":
+                    final = event.response
+        except Exception:
+            UPSTREAM_ERRORS.inc(service="cohere")
+            raise
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm")
+        _record_tokens(final, message, "".join(parts), channel)
+
+    async def _translate_question(self, question):
+        """Translates a question to Arabic, reusing earlier translations of the same question."""
+        key = normalize_question(question)
+        translated = self._translations.get(key)
+        if translated is not None:
+            self._translations.move_to_end(key)
+            CACHE_REQUESTS.inc(cache="translation", result="hit")
+            return translated
+        CACHE_REQUESTS.inc(cache="translation", result="miss")
+        try:
+            with STAGE_SECONDS.time(stage="translate"):
+                translated = await self._translate(question, lang="ar")
+        except Exception:
+            UPSTREAM_ERRORS.inc(service="cohere")
+            raise
+        self._translations[key] = translated
+        while len(self._translations) > self.translation_cache_size:
+            self._translations.popitem(last=False)
+        return translated
         
-    def _translate(self, query, lang) : # lang= ar | en
-        client = cohere.Client('NO7yfaSUsE44j2uPSDbGQEcJpPmVAhIiWzAl3omw')
+    async def _translate(self, query, lang) : # lang= ar | en
         if lang == "ar":
             message=f'ترجم لي هذا إلى العربية بطريقة صحيحة بدون أيا كلمات زائدة : {query}'
         else:
             message=f'ترجم لي هذا إلى الانجليزية بطريقة صحيحة بدون أيا كلمات زائدة : {query}'
         
-        response = client.chat(
+        response = await self.co.chat(
             model="command-r-plus",
             message=message
         )  
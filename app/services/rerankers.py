@@ -0,0 +1,144 @@
+import math
+import logging
+from collections import Counter
+from .context_builder import render_chunk_text
+from .text_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def _min_max(scores):
+    # Scales scores to 0..1 over the candidate set; equal scores all count fully
+    low, high = min(scores), max(scores)
+    if high <= low:
+        return [1.0] * len(scores)
+    return [(score - low) / (high - low) for score in scores]
+
+
+class NoopReranker:
+    """Keeps the vector-search order and only truncates to the final k."""
+
+    name = "none"
+
+    def rerank(self, question, docs, top_k):
+        """
+        Args:
+            question (str): The user question.
+            docs (list): Candidate chunks as dicts with 'properties' and 'score' keys.
+            top_k (int): Number of chunks to keep.
+
+        Returns:
+            list: The top_k chunks, best first, with their 'score' replaced by the rerank score.
+        """
+        return docs[:top_k]
+
+
+class LexicalReranker(NoopReranker):
+    """
+    Re-scores candidates with BM25 computed over the candidate set itself, blended with the
+    retrieval score. Both are min-max normalized over the candidates first, so the blend
+    works the same on vector similarities and on the rank-fusion scores of hybrid
+    retrieval. Cheap enough to run on every request and good at exact terms such as
+    bundle names and prices that embeddings tend to blur.
+    """
+
+    name = "lexical"
+
+    def __init__(self, text_key="text", weight=0.5, k1=1.2, b=0.75):
+        """
+        Args:
+            text_key (str): The property holding the chunk content.
+            weight (float): Share of the lexical score in the blended score (0..1).
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.text_key = text_key
+        self.weight = weight
+        self.k1 = k1
+        self.b = b
+
+    def _bm25_scores(self, query_terms, doc_terms):
+        n = len(doc_terms)
+        avg_len = sum(len(terms) for terms in doc_terms) / n or 1.0
+        df = Counter(term for terms in doc_terms for term in set(terms))
+        scores = []
+        for terms in doc_terms:
+            tf = Counter(terms)
+            score = 0.0
+            for term in query_terms:
+                if term not in tf:
+                    continue
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                freq = tf[term]
+                score += idf * freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * len(terms) / avg_len))
+            scores.append(score)
+        return scores
+
+    def rerank(self, question, docs, top_k):
+        if not docs:
+            return docs
+        query_terms = set(tokenize(question))
+        doc_terms = [tokenize(render_chunk_text(doc["properties"].get(self.text_key) or "")) for doc in docs]
+        lexical = self._bm25_scores(query_terms, doc_terms)
+        top = max(lexical) or 1.0
+        retrieval = _min_max([doc.get("score") or 0.0 for doc in docs])
+        reranked = []
+        for doc, score, retrieval_score in zip(docs, lexical, retrieval):
+            blended = self.weight * (score / top) + (1 - self.weight) * retrieval_score
+            reranked.append({**doc, "score": blended})
+        reranked.sort(key=lambda d: d["score"], reverse=True)
+        return reranked[:top_k]
+
+
+class CrossEncoderReranker(NoopReranker):
+    """
+    Re-scores candidates with a CPU cross-encoder from sentence-transformers. The model is
+    loaded once when the reranker is built.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", text_key="text", batch_size=32):
+        """
+        Args:
+            model_name (str): The cross-encoder model to load.
+            text_key (str): The property holding the chunk content.
+            batch_size (int): Number of (question, chunk) pairs scored per forward pass.
+        """
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ValueError("The cross-encoder reranker requires the sentence-transformers package") from e
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.text_key = text_key
+        self.batch_size = batch_size
+
+    def rerank(self, question, docs, top_k):
+        if not docs:
+            return docs
+        pairs = [(question, render_chunk_text(doc["properties"].get(self.text_key) or "")) for doc in docs]
+        scores = self.model.predict(pairs, batch_size=self.batch_size)
+        reranked = [{**doc, "score": float(score)} for doc, score in zip(docs, scores)]
+        reranked.sort(key=lambda d: d["score"], reverse=True)
+        return reranked[:top_k]
+
+
+def build_reranker(name, model_name=None):
+    """
+    Builds a reranker by its configured name.
+
+    Args:
+        name (str): 'none', 'lexical' or 'cross-encoder'.
+        model_name (str): Optional model for the cross-encoder reranker.
+
+    Returns:
+        NoopReranker: The reranker instance.
+    """
+    name = (name or "none").lower()
+    if name == "none":
+        return NoopReranker()
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "cross-encoder":
+        return CrossEncoderReranker(model_name) if model_name else CrossEncoderReranker()
+    raise ValueError(f"Unknown reranker: {name}")
@@ -0,0 +1,150 @@
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySessionStore:
+    """
+    Maps chat ids to conversation ids in memory, with LRU eviction and a time-to-live.
+
+    A chat gets a new conversation id on its first message, after /start, or once it has
+    been idle for longer than `ttl`. Sessions are lost on restart.
+    """
+
+    def __init__(self, max_size=10000, ttl=86400):
+        """
+        Args:
+            max_size (int): Maximum number of chats remembered.
+            ttl (float): Seconds of inactivity after which a chat starts a new conversation.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # chat_id -> (conversation_id, last_seen)
+        self._lock = threading.Lock()
+
+    def get(self, chat_id):
+        """
+        Returns the conversation id of a chat, starting a new one if there is none.
+
+        Args:
+            chat_id: The Telegram chat id.
+
+        Returns:
+            str: The conversation id.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(chat_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                conversation_id = entry[0]
+            else:
+                conversation_id = str(uuid.uuid4())
+            self._store(chat_id, conversation_id, now)
+            return conversation_id
+
+    def reset(self, chat_id):
+        """Starts a new conversation for a chat and returns its id."""
+        conversation_id = str(uuid.uuid4())
+        with self._lock:
+            self._store(chat_id, conversation_id, time.time())
+        return conversation_id
+
+    def _store(self, chat_id, conversation_id, last_seen):
+        self._sessions[chat_id] = (conversation_id, last_seen)
+        self._sessions.move_to_end(chat_id)
+        while len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions)}
+
+    def close(self):
+        pass
+
+
+class SqliteSessionStore:
+    """
+    Maps chat ids to conversation ids in a local sqlite file, so conversations survive
+    restarts and are shared by workers on the same host. Same semantics as
+    MemorySessionStore; expired rows are purged on startup.
+    """
+
+    def __init__(self, path, ttl=86400):
+        """
+        Args:
+            path (str): The sqlite file.
+            ttl (float): Seconds of inactivity after which a chat starts a new conversation.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (chat_id TEXT PRIMARY KEY, conversation_id TEXT, last_seen REAL)"
+        )
+        self._db.execute("DELETE FROM sessions WHERE last_seen < ?", (time.time() - ttl,))
+        self._db.commit()
+
+    def get(self, chat_id):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT conversation_id, last_seen FROM sessions WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                conversation_id = row[0]
+            else:
+                conversation_id = str(uuid.uuid4())
+            self._store(chat_id, conversation_id, now)
+            return conversation_id
+
+    def reset(self, chat_id):
+        conversation_id = str(uuid.uuid4())
+        with self._lock:
+            self._store(chat_id, conversation_id, time.time())
+        return conversation_id
+
+    def _store(self, chat_id, conversation_id, last_seen):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (chat_id, conversation_id, last_seen) VALUES (?, ?, ?)",
+            (str(chat_id), conversation_id, last_seen)
+        )
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": "sqlite", "sessions": count}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def build_session_store(backend, path=None, max_size=10000, ttl=86400):
+    """
+    Builds a session store by its configured name.
+
+    Args:
+        backend (str): 'memory' or 'sqlite'.
+        path (str): The sqlite file of the sqlite backend.
+        max_size (int): Maximum number of chats kept by the memory backend.
+        ttl (float): Seconds of inactivity after which a chat starts a new conversation.
+
+    Returns:
+        MemorySessionStore | SqliteSessionStore: The session store.
+    """
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        return MemorySessionStore(max_size=max_size, ttl=ttl)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("The sqlite session store requires SESSION_STORE_PATH")
+        return SqliteSessionStore(path, ttl=ttl)
+    raise ValueError(f"Unknown session store: {backend}")
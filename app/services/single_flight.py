@@ -0,0 +1,111 @@
+import asyncio
+from contextlib import contextmanager
+
+
+class Flight:
+    """One computation in progress and the chunks it has produced so far."""
+
+    def __init__(self):
+        self.chunks = []
+        # Set by the producer, e.g. whether the answer came from a cache
+        self.result = None
+        self.error = None
+        self.done = False
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """
+        Yields every chunk from the first one, then the new ones as they are produced, so a
+        subscriber that joins late still receives the whole output.
+
+        Raises:
+            Exception: The error of the producer, after the chunks published before it.
+        """
+        position = 0
+        while True:
+            if position < len(self.chunks):
+                position += 1
+                yield self.chunks[position - 1]
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time in this worker; concurrent callers with
+    the same key subscribe to the running one instead of starting their own.
+
+    The computation runs in its own task, so it is not tied to the request that started it:
+    it keeps going while any subscriber is left and is cancelled when the last one leaves.
+    A key is forgotten as soon as its computation ends, so only requests that overlap in
+    time are collapsed; reusing finished results is the job of the caches.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Args:
+            enabled (bool): When False, every caller gets its own computation.
+        """
+        self.enabled = enabled
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    @contextmanager
+    def join(self, key, produce):
+        """
+        Subscribes to the computation of a key, starting it if none is running.
+
+        Args:
+            key: A hashable key identifying identical computations.
+            produce (callable): produce(flight) -> coroutine that publishes the chunks to the
+                flight; only called when a new computation starts.
+
+        Yields:
+            tuple: The Flight and whether it was already running (shared).
+        """
+        flight = self._flights.get(key) if self.enabled else None
+        shared = flight is not None
+        if flight is None:
+            flight = Flight()
+            if self.enabled:
+                self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+        flight.subscribers += 1
+        try:
+            yield flight, shared
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is waiting for the output any more
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    async def _run(self, key, flight, produce):
+        try:
+            await produce(flight)
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._forget(key, flight)
+            flight._wake()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
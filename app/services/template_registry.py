@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from langchain_core.prompts import PromptTemplate
+from .file_utils import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows: updates are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../config/prompt_template.txt'))
+REQUIRED_VARIABLES = ("context", "question")
+
+
+def _fingerprint(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class TemplateRegistry:
+    """
+    Keeps the compiled prompt template in memory and versions its updates.
+
+    The template file stays the source of truth. Every worker checks its modification time
+    at most every `check_interval` seconds and recompiles the template only when the file
+    changed, so an update written by one uvicorn worker reaches the others without any
+    per-request file reads. Updates are written atomically; every version is kept in a
+    history directory, with a metadata file recording the current version, so a previous
+    version can be restored.
+    """
+
+    def __init__(self, path=DEFAULT_TEMPLATE_PATH, check_interval=2.0, max_history=50, state_dir=None):
+        """
+        Args:
+            path (str): The template file.
+            check_interval (float): Minimum seconds between two checks of the file.
+            max_history (int): Number of versions kept in the history.
+            state_dir (str): Directory of the history, metadata and lock files; next to the
+                template if None.
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.max_history = max_history
+        base = os.path.splitext(path)[0]
+        if state_dir is not None:
+            base = os.path.join(state_dir, os.path.basename(base))
+        self.history_dir = base + "_history"
+        self.meta_path = base + ".meta.json"
+        self.lock_path = base + ".lock"
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._template = None
+        self._text = None
+        self._stat = None
+        self._next_check = 0.0
+        self.version = None
+        self.fingerprint = None
+        os.makedirs(self.history_dir, exist_ok=True)
+        with self._file_lock():
+            if not os.path.exists(self.meta_path):
+                # First start: the current file becomes version 1
+                self._record_version(self._read(), 1, note="initial")
+        self.refresh(force=True)
+
+    def on_change(self, callback):
+        """Registers a callback run with the new version whenever a changed template is loaded."""
+        self._listeners.append(callback)
+
+    def get(self):
+        """
+        Returns the compiled template, reloading it if the file changed since the last check.
+
+        Returns:
+            PromptTemplate: The current template.
+        """
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+        return self._template
+
+    def refresh(self, force=False):
+        """
+        Reloads the template if the file changed.
+
+        Args:
+            force (bool): Reload even if the file looks unchanged.
+
+        Returns:
+            bool: True if a different template was loaded.
+        """
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except OSError as e:
+                logger.error(f"Cannot stat the prompt template: {e}")
+                return False
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if not force and signature == self._stat:
+                return False
+            text = self._read()
+            self._stat = signature
+            fingerprint = _fingerprint(text)
+            if fingerprint == self.fingerprint:
+                return False
+            template = self.compile(text)
+            meta = self._read_meta()
+            self._template = template
+            self._text = text
+            self.fingerprint = fingerprint
+            # A file edited by hand has no version of its own
+            self.version = meta.get("version") if meta.get("fingerprint") == fingerprint else None
+        logger.info(f"Prompt template loaded (version {self.version}, {fingerprint})")
+        for callback in self._listeners:
+            try:
+                callback(self.version)
+            except Exception as e:
+                logger.warning(f"Prompt template listener failed: {e}")
+        return True
+
+    @staticmethod
+    def compile(text):
+        """
+        Compiles and validates a template.
+
+        Raises:
+            ValueError: If the template is empty, cannot be parsed or lacks a required variable.
+        """
+        if not text.strip():
+            raise ValueError("Template content cannot be empty")
+        try:
+            template = PromptTemplate.from_template(text)
+        except Exception as e:
+            raise ValueError(f"Invalid template: {e}")
+        missing = [name for name in REQUIRED_VARIABLES if name not in template.input_variables]
+        if missing:
+            raise ValueError(f"Template is missing the variables: {', '.join(missing)}")
+        return template
+
+    def update(self, text, note=None):
+        """
+        Validates a template, stores it as a new version and makes it current.
+
+        Args:
+            text (str): The template content.
+            note (str): Optional note kept in the history.
+
+        Returns:
+            int: The new version number.
+
+        Raises:
+            ValueError: If the template is invalid.
+        """
+        self.compile(text)
+        with self._file_lock():
+            version = self._read_meta().get("version", 0) + 1
+            self._record_version(text, version, note=note)
+            atomic_write(self.path, text)
+        self.refresh(force=True)
+        return version
+
+    def rollback(self, version):
+        """
+        Makes a previous version current again, recorded as a new version.
+
+        Args:
+            version (int): The version to restore.
+
+        Returns:
+            int: The new version number.
+
+        Raises:
+            KeyError: If the version is not in the history.
+        """
+        path = self._history_path(version)
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown template version: {version}")
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        return self.update(text, note=f"rollback to {version}")
+
+    def history(self):
+        """Returns the recorded versions, newest first."""
+        return list(reversed(self._read_meta().get("history", [])))
+
+    def read_version(self, version):
+        """Returns the content of a recorded version."""
+        path = self._history_path(version)
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown template version: {version}")
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read()
+
+    @property
+    def text(self):
+        """The content of the current template."""
+        self.get()
+        return self._text
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return file.read()
+        except UnicodeDecodeError:
+            raise ValueError("Unable to decode the template file. Please check the file encoding.")
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _history_path(self, version):
+        return os.path.join(self.history_dir, f"v{int(version):05d}.txt")
+
+    def _record_version(self, text, version, note=None):
+        atomic_write(self._history_path(version), text)
+        meta = self._read_meta()
+        history = meta.get("history", [])
+        history.append({
+            "version": version,
+            "fingerprint": _fingerprint(text),
+            "created_at": time.time(),
+            "note": note,
+        })
+        for entry in history[:-self.max_history]:
+            old_path = self._history_path(entry["version"])
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        history = history[-self.max_history:]
+        atomic_write(self.meta_path, json.dumps(
+            {"version": version, "fingerprint": _fingerprint(text), "history": history}, indent=2
+        ))
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes version numbering across the workers of this host
+        with self._lock if fcntl is None else open(self.lock_path, 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,121 @@
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text):
+    """
+    Normalizes a user question so that trivially different spellings map to the same key.
+
+    Args:
+        text (str): The raw question.
+
+    Returns:
+        str: The question in NFKC form, case-folded, with collapsed whitespace.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+# Rough characters-per-token ratio for the Cohere tokenizer on mixed Arabic/English text
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text, chars_per_token=CHARS_PER_TOKEN):
+    """
+    Estimates the number of LLM tokens in a text without calling a tokenizer.
+
+    Args:
+        text (str): The text to measure.
+        chars_per_token (float): Average number of characters per token.
+
+    Returns:
+        int: The estimated token count.
+    """
+    if not text:
+        return 0
+    return max(1, round(len(text) / chars_per_token))
+
+
+_ARABIC_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_ARABIC_FOLDING = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ة": "ه",
+    "ؤ": "و",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_arabic(text):
+    """
+    Folds Arabic spelling variants so that lexical matching ignores them.
+
+    Strips diacritics and tatweel, folds alef, ya and ta marbuta variants and maps
+    Arabic-Indic digits to ASCII digits, on top of normalize_question.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    text = _ARABIC_DIACRITICS_RE.sub("", normalize_question(text))
+    return text.translate(_ARABIC_FOLDING)
+
+
+def tokenize(text):
+    """
+    Splits a text into normalized word tokens for lexical scoring.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The normalized tokens.
+    """
+    return _WORD_RE.findall(normalize_arabic(text))
+
+
+def like_to_regex(pattern):
+    """
+    Compiles a Weaviate `like` pattern ('*' for any run of characters, '?' for one) to a regex.
+
+    Args:
+        pattern (str): The like pattern.
+
+    Returns:
+        re.Pattern: A regex matching the whole value.
+    """
+    parts = []
+    for char in pattern:
+        if char == "*":
+            parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+def like_matcher(pattern):
+    """
+    Returns a predicate matching values against a Weaviate `like` pattern the way Weaviate
+    matches word tokenized properties: case-insensitively, against the whole value or any
+    word of it.
+
+    Args:
+        pattern (str): The like pattern.
+
+    Returns:
+        callable: matches(value) -> bool.
+    """
+    regex = like_to_regex(str(pattern).lower())
+
+    def matches(value):
+        text = str(value).lower()
+        return bool(regex.match(text)) or any(regex.match(word) for word in _WORD_RE.findall(text))
+    return matches
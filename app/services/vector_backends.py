@@ -0,0 +1,266 @@
+import logging
+import weaviate
+from weaviate.classes.init import Auth
+from weaviate.classes.query import Filter, MetadataQuery, Sort
+
+logger = logging.getLogger(__name__)
+
+
+class VectorBackend:
+    """
+    Storage of the chunk objects, each a uuid with its properties and vector, behind
+    DocumentsPipeline and RAGPipeline.
+
+    The blocking methods are called from worker threads by the ingestion and dashboard code;
+    the async ones from the event loop by the chat pipeline and the client pool.
+    """
+
+    name = None
+
+    async def connect(self):
+        """Opens the connections used by the async methods."""
+
+    async def is_ready(self):
+        return True
+
+    async def exists(self):
+        """Returns True if the collection exists."""
+        return True
+
+    async def search(self, vector, limit):
+        """
+        Returns the nearest objects of a query vector.
+
+        Args:
+            vector (list): The query vector.
+            limit (int): Maximum number of objects.
+
+        Returns:
+            list: (uuid, properties, cosine distance) tuples, nearest first.
+        """
+        raise NotImplementedError
+
+    def write(self, objects):
+        """
+        Inserts or replaces objects.
+
+        Args:
+            objects (list): (uuid, properties, vector) tuples.
+
+        Returns:
+            list: (uuid, message) of every object that failed to write.
+        """
+        raise NotImplementedError
+
+    def find(self, property, value, return_properties=None):
+        """
+        Returns the objects whose property equals a value.
+
+        Returns:
+            list: (uuid, properties) tuples.
+        """
+        raise NotImplementedError
+
+    def fetch_page(self, after=None, limit=1000, return_properties=None):
+        """
+        Returns one page of objects in uuid order.
+
+        Args:
+            after (str): Start after this uuid.
+            limit (int): Maximum number of objects.
+            return_properties (list): The properties to fetch; all of them if None.
+
+        Returns:
+            list: (uuid, properties) tuples.
+        """
+        raise NotImplementedError
+
+    def iter_objects(self, return_properties=None, page_size=1000):
+        """Iterates over every object in uuid order as (uuid, properties) tuples."""
+        after = None
+        while True:
+            page = self.fetch_page(after=after, limit=page_size, return_properties=return_properties)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+
+    def find_like(self, property, pattern, after=None, limit=100, return_properties=None):
+        """
+        Returns one page of the objects whose property matches a Weaviate `like` pattern,
+        filtered by the store, in uuid order.
+
+        Args:
+            property (str): The property to match.
+            pattern (str): The like pattern.
+            after (str): Start after this uuid, the last one of the previous page.
+            limit (int): Maximum number of objects.
+            return_properties (list): The properties to fetch.
+
+        Returns:
+            list: (uuid, properties) tuples.
+        """
+        raise NotImplementedError
+
+    def update(self, object_id, properties):
+        """Updates some properties of an object, keeping its vector."""
+        raise NotImplementedError
+
+    def delete(self, object_ids):
+        """Deletes objects by uuid."""
+        raise NotImplementedError
+
+    def delete_like(self, property, pattern):
+        """
+        Deletes the objects whose property matches a Weaviate `like` pattern.
+
+        Returns:
+            The deletion result, with the number of matching and deleted objects.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.name}
+
+    async def close(self):
+        pass
+
+
+class WeaviateBackend(VectorBackend):
+    """
+    A collection on Weaviate Cloud. The sync client serves the blocking methods and the
+    async client the searches of the chat pipeline.
+    """
+
+    name = "weaviate"
+
+    def __init__(self, collection_name, cluster_URL=None, api_key=None, client=None, async_client=None):
+        """
+        Args:
+            collection_name (str): The Weaviate collection.
+            cluster_URL (str): The cluster URL, used when no clients are given.
+            api_key (str): The cluster API key, used when no clients are given.
+            client: A sync Weaviate client to use instead of connecting to the cluster.
+            async_client: An async Weaviate client to use instead of connecting to the cluster.
+        """
+        self.collection_name = collection_name
+        self.client = client or weaviate.connect_to_weaviate_cloud(
+            cluster_url=cluster_URL,
+            auth_credentials=Auth.api_key(api_key),
+            skip_init_checks=True
+        )
+        # Connected in connect(); it must be closed with close()
+        self.async_client = async_client or weaviate.use_async_with_weaviate_cloud(
+            cluster_url=cluster_URL,
+            auth_credentials=Auth.api_key(api_key),
+            skip_init_checks=True
+        )
+
+    @property
+    def collection(self):
+        return self.client.collections.get(self.collection_name)
+
+    async def connect(self):
+        await self.async_client.connect()
+
+    async def is_ready(self):
+        return await self.async_client.is_ready()
+
+    async def exists(self):
+        return await self.async_client.collections.exists(self.collection_name)
+
+    async def search(self, vector, limit):
+        result = await self.async_client.collections.get(self.collection_name).query.near_vector(
+            near_vector=vector,
+            limit=limit,
+            return_metadata=MetadataQuery(distance=True)
+        )
+        return [
+            (str(o.uuid), o.properties, o.metadata.distance if o.metadata is not None else None)
+            for o in result.objects
+        ]
+
+    def write(self, objects):
+        # The dynamic batch sizes the write requests itself and collects failed objects
+        collection = self.collection
+        with collection.batch.dynamic() as batch:
+            for object_id, properties, vector in objects:
+                batch.add_object(properties=properties, uuid=object_id, vector=vector)
+        return [(str(error.object_.uuid), error.message) for error in collection.batch.failed_objects]
+
+    def find(self, property, value, return_properties=None, page_size=1000):
+        collection = self.collection
+        search_filter = Filter.by_property(property).equal(value)
+        objects = []
+        offset = 0
+        while True:
+            result = collection.query.fetch_objects(
+                filters=search_filter,
+                limit=page_size,
+                offset=offset,
+                return_properties=return_properties
+            )
+            objects.extend((str(o.uuid), o.properties) for o in result.objects)
+            if len(result.objects) < page_size:
+                return objects
+            offset += page_size
+
+    def fetch_page(self, after=None, limit=1000, return_properties=None):
+        result = self.collection.query.fetch_objects(limit=limit, after=after, return_properties=return_properties)
+        return [(str(o.uuid), o.properties) for o in result.objects]
+
+    def find_like(self, property, pattern, after=None, limit=100, return_properties=None):
+        # Keyset paging: every page is a first page, so QUERY_MAXIMUM_RESULTS only bounds
+        # the page size and not how deep the search can go
+        filters = Filter.by_property(property).like(pattern)
+        if after is not None:
+            filters = filters & Filter.by_property("_id").greater_than(after)
+        result = self.collection.query.fetch_objects(
+            filters=filters,
+            sort=Sort.by_property("_id"),
+            limit=limit,
+            return_properties=return_properties
+        )
+        return [(str(o.uuid), o.properties) for o in result.objects]
+
+    def update(self, object_id, properties):
+        self.collection.data.update(uuid=object_id, properties=properties)
+
+    def delete(self, object_ids):
+        if object_ids:
+            self.collection.data.delete_many(where=Filter.by_id().contains_any(list(object_ids)))
+
+    def delete_like(self, property, pattern):
+        return self.collection.data.delete_many(where=Filter.by_property(property).like(pattern))
+
+    async def close(self):
+        try:
+            self.client.close()
+        finally:
+            await self.async_client.close()
+
+
+def build_vector_backend(name, collection_name=None, cluster_URL=None, api_key=None, path=None,
+                         dtype="float32", nprobe=8):
+    """
+    Builds a vector backend by its configured name.
+
+    Args:
+        name (str): 'weaviate' or 'local'.
+        collection_name (str): The Weaviate collection.
+        cluster_URL (str): The Weaviate cluster URL.
+        api_key (str): The Weaviate API key.
+        path (str): The directory of the local store.
+        dtype (str): 'float32' or 'int8', the vector storage of the local store.
+        nprobe (int): Number of index cells the local store scans per search.
+
+    Returns:
+        VectorBackend: The backend instance.
+    """
+    name = (name or "weaviate").lower()
+    if name == "weaviate":
+        return WeaviateBackend(collection_name, cluster_URL, api_key)
+    if name == "local":
+        from .local_vector_store import LocalVectorBackend
+        return LocalVectorBackend(path, dtype=dtype, nprobe=nprobe)
+    raise ValueError(f"Unknown vector backend: {name}")
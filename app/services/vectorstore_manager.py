@@ -1,58 +1,100 @@
-import weaviate
-from weaviate.classes.init import Auth
-from weaviate.classes.query import Filter
-from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+import uuid
+import hashlib
+import logging
+from itertools import islice
+from weaviate.util import generate_uuid5
 from langchain_weaviate.vectorstores import WeaviateVectorStore
 from .convert_html_pipeline import ConvertHTMLPipeline
+from .ingestion_writer import BatchIngestionWriter
+from .chunking import SectionChunker, chunk_stats
+from .document_registry import document_hash
+from .vector_backends import WeaviateBackend
+from .embedders import build_embedder
+
+logger = logging.getLogger(__name__)
+
+# Properties returned by the metadata search when the caller does not choose
+SEARCH_PROPERTIES = ("text", "name", "active", "date")
+
+
+def parse_search_cursor(cursor):
+    """
+    Validates a metadata search cursor, the uuid of the last object of the previous page.
+
+    Returns:
+        str: The uuid, or None for the first page.
+
+    Raises:
+        ValueError: If the cursor is not a uuid.
+    """
+    if not cursor:
+        return None
+    try:
+        return str(uuid.UUID(str(cursor)))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def hash_content(text):
+    """Returns the hex sha256 of a chunk text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_uuid(name, content_hash):
+    """
+    Returns the object uuid of a chunk: deterministic for content-addressed chunks,
+    random for chunks without a content hash.
+    """
+    if content_hash is None:
+        return str(uuid.uuid4())
+    return generate_uuid5(f"{name}:{content_hash}")
 
 
 class DocumentsPipeline :
-    def __init__(self, collection_name, embedding_model_name, cluster_URL, weaviate_api_key, hugging_api_key):
+    def __init__(self, collection_name, embedding_model_name, cluster_URL, weaviate_api_key, hugging_api_key,
+                 lexical_index=None, writer_options=None, chunker=None, registry=None, backend=None,
+                 embedding_backend="huggingface-api", embedding_options=None, embedder=None):
         self.collection_name = collection_name
         self.embedding_model_name = embedding_model_name
         self.cluster_URL = cluster_URL
         self.weaviate_api_key = weaviate_api_key
         self.text_key = 'text'
         self.hugging_api_key = hugging_api_key
-        self.client = self._init_weaviate_connection()
-        self.embedder = self.init_embedding_model()
-
-    def close_client(self):
-        self.client.close()
+        # Optional in-process index kept in sync with every add and delete
+        self.lexical_index = lexical_index
+        # Batch size, concurrency and retry settings of the ingestion writer
+        self.writer_options = writer_options or {}
+        # Splits parsed sections into token-sized plain-text chunks
+        self.chunker = chunker or SectionChunker()
+        # Optional local registry of the ingested documents, kept in sync like the lexical index
+        self.registry = registry
+        # Where the chunks are stored; the Weaviate collection unless another backend is given
+        self.backend = backend or WeaviateBackend(collection_name, cluster_URL, weaviate_api_key)
+        # The Inference API, or a model run in-process with the local backend options
+        self.embedding_backend = embedding_backend
+        self.embedding_options = embedding_options or {}
+        # An embedding model already loaded for the same settings is reused as it is
+        self.embedder = embedder or self.init_embedding_model()
 
     def init_embedding_model(self):
-        embedder = HuggingFaceInferenceAPIEmbeddings(
-        api_key=self.hugging_api_key, model_name=self.embedding_model_name)
+        embedder = build_embedder(
+        self.embedding_backend, self.embedding_model_name, self.hugging_api_key, **self.embedding_options)
         return embedder
     
-    def _init_weaviate_connection(self):
-        client = weaviate.connect_to_weaviate_cloud(
-        cluster_url=self.cluster_URL,
-        auth_credentials=Auth.api_key(self.weaviate_api_key),
-        skip_init_checks=True
-            )
-        return client 
-    
     def load_vector_store_from_collection(self):    
+        if not isinstance(self.backend, WeaviateBackend):
+            raise ValueError("LangChain vector stores are only available with the Weaviate backend")
         vector_store = WeaviateVectorStore(
-        client=self.client,
+        client=self.backend.client,
         index_name=self.collection_name,
         text_key=self.text_key,
         embedding=self.embedder
         )   
         return vector_store  
     
-    def get_collection(self):
-        collection = self.client.collections.get(self.collection_name)
-        return collection    
-    
     def add_documents_data(self, html_path, metadata):
         try:
-            convertHTMl = ConvertHTMLPipeline()
-            json_path = convertHTMl.convert_html_file_to_json(html_file_path=html_path)
-            my_documents = convertHTMl.convert_json_to_documents(json_path , metadata)
-            vector_store = self.load_vector_store_from_collection()
-            vector_store.add_documents(documents= my_documents)
+            self.ingest_html(html_path, metadata)
             return True  # Indicating success
         except ValueError as e:
             print(f"ValueError occurred: {e}")
@@ -67,44 +109,310 @@ class DocumentsPipeline :
             print("Document addition process completed.")
     
         return False  # Indicating failure if any exception was caught
-    
+
+    def ingest_html(self, html_path, metadata, progress=None):
+        """
+        Parses an HTML file, chunks it, embeds the chunks and writes them to the collection.
+
+        Chunks are content-addressed: each one carries the hash of its text and a uuid derived
+        from the document name and that hash. When a document with the same name is uploaded
+        again, only new or changed chunks are embedded and written, chunks that disappeared are
+        deleted, and unchanged chunks only get their metadata updated if it changed.
+
+        Args:
+            html_path (str): The HTML file to ingest.
+            metadata (dict): Metadata stored with every chunk (name, active, date).
+            progress (callable): Optional progress(stage, done=None, total=None) callback
+                called as the parsed / chunked / embedded / written stages advance.
+
+        Returns:
+            dict: The number of chunks in the document and how many were written,
+            left unchanged, updated and deleted, plus the chunk size and writer statistics.
+        """
+        report = progress or (lambda stage, done=None, total=None: None)
+        convertHTMl = ConvertHTMLPipeline(chunker=self.chunker)
+        with open(html_path, 'r', encoding='utf-8') as file:
+            sections = list(convertHTMl.iter_sections(file.read()))
+        report("parsed")
+        documents = list(convertHTMl.iter_documents(sections, metadata))
+        sizes = chunk_stats([document.page_content for document in documents])
+        logger.info(f"Chunked {metadata['name']}: {sizes}")
+        plan = self.plan_ingestion(documents, metadata)
+        report("chunked", done=plan["chunks"], total=plan["chunks"])
+
+        writer = self.create_writer()
+        self.write_documents(plan["new_documents"], writer=writer, progress=report)
+        result = self.finish_ingestion(plan, metadata)
+        result["chunk_sizes"] = sizes
+        result["writer"] = writer.summary()
+        return result
+
+    def plan_ingestion(self, documents, metadata):
+        """
+        Compares the chunks of a document with the stored ones.
+
+        Args:
+            documents (iterable): The Documents of one document (same name).
+            metadata (dict): The document metadata (name, active, date).
+
+        Returns:
+            dict: 'chunks' (number of distinct chunks), 'content_hash' (hash of the whole
+            document), 'new_documents' (chunks to embed and
+            write), 'stale_ids' (stored chunks to delete) and 'changed' (uuid -> Document of
+            unchanged chunks whose metadata must be updated).
+        """
+        # Key every chunk by its content; identical sections of one page are stored once
+        chunks = {}
+        for document in documents:
+            content_hash = hash_content(document.page_content)
+            document.metadata = {**document.metadata, "content_hash": content_hash}
+            chunks.setdefault(content_hash, document)
+
+        existing = self._fetch_document_chunks(metadata["name"])
+        return {
+            "chunks": len(chunks),
+            "content_hash": document_hash(chunks.keys()),
+            "new_documents": [document for content_hash, document in chunks.items() if content_hash not in existing],
+            "stale_ids": [object_id for content_hash, (object_id, _) in existing.items() if content_hash not in chunks],
+            "changed": {
+                existing[content_hash][0]: document for content_hash, document in chunks.items()
+                if content_hash in existing and any(
+                    existing[content_hash][1].get(key) != value for key, value in metadata.items()
+                )
+            },
+        }
+
+    def finish_ingestion(self, plan, metadata):
+        """
+        Updates the metadata of unchanged chunks and deletes the stale ones. Must run after
+        the new chunks of the plan were written so the document never disappears.
+
+        Returns:
+            dict: The number of chunks in the document and how many were written,
+            left unchanged, updated and deleted.
+        """
+        self._update_chunk_metadata(plan["changed"], metadata)
+        self._delete_chunks(plan["stale_ids"])
+        if self.registry is not None:
+            self.registry.upsert(metadata["name"], metadata, plan["chunks"], plan["content_hash"])
+        written = len(plan["new_documents"])
+        return {
+            "chunks": plan["chunks"],
+            "written": written,
+            "unchanged": plan["chunks"] - written,
+            "updated": len(plan["changed"]),
+            "deleted": len(plan["stale_ids"]),
+        }
+
+    def _fetch_document_chunks(self, name):
+        """
+        Returns the stored chunks of a document without their text.
+
+        Returns:
+            dict: content_hash -> (uuid, properties). Chunks stored before content hashing
+            have no hash and are keyed by their uuid, so they are replaced on re-upload.
+        """
+        chunks = {}
+        for object_id, properties in self.backend.find(
+                "name", name, return_properties=["name", "content_hash", "active", "date"]):
+            # `name` is word tokenized in Weaviate, so the filter also matches every document
+            # whose name contains the same words ("Bundle Prices" and "Bundle Prices 2024");
+            # their chunks must not end up among the stale ones
+            if properties.get("name") != name:
+                continue
+            chunks[properties.get("content_hash") or object_id] = (object_id, properties)
+        return chunks
+
+    def _update_chunk_metadata(self, changed, metadata):
+        for object_id, document in changed.items():
+            self.backend.update(object_id, metadata)
+            if self.lexical_index is not None:
+                self.lexical_index.add(object_id, {self.text_key: document.page_content, **document.metadata})
+
+    def _delete_chunks(self, object_ids):
+        if not object_ids:
+            return
+        self.backend.delete(object_ids)
+        if self.lexical_index is not None:
+            for object_id in object_ids:
+                self.lexical_index.remove(object_id)
+
+    def create_writer(self):
+        """Creates a BatchIngestionWriter for the vector backend with the configured options."""
+        return BatchIngestionWriter(
+            self.embedder,
+            self.backend,
+            text_key=self.text_key,
+            lexical_index=self.lexical_index,
+            **self.writer_options
+        )
+
+    def write_documents(self, documents, writer=None, progress=None):
+        """
+        Embeds and writes documents to the collection with the same properties
+        WeaviateVectorStore uses (the text plus the metadata).
+
+        Args:
+            documents (list): The Documents to write.
+            writer (BatchIngestionWriter): The writer to use; a new one if None.
+            progress (callable): Optional progress(stage, done=None, total=None) callback.
+
+        Returns:
+            list: The uuids of the written objects.
+
+        Raises:
+            ValueError: If some objects failed to write.
+        """
+        if not documents:
+            return []
+        writer = writer or self.create_writer()
+        failed_before = writer.stats["failed_objects"]
+        objects = [
+            (
+                chunk_uuid(document.metadata.get("name"), document.metadata.get("content_hash")),
+                {self.text_key: document.page_content, **document.metadata}
+            )
+            for document in documents
+        ]
+        ids = writer.ingest(objects, progress=progress)
+        failed = writer.stats["failed_objects"] - failed_before
+        if failed:
+            raise ValueError(f"{failed} of {len(objects)} objects failed to write: "
+                             f"{writer.stats['errors'][-1]['message'] if writer.stats['errors'] else ''}")
+        return ids
+
+    def reindex_collection(self, progress=None, page_size=1000):
+        """
+        Re-embeds every object of the collection with the current embedding model and writes
+        the new vectors in place, e.g. after switching EMBEDDING_MODEL_NAME.
+
+        Args:
+            progress (callable): Optional progress(stage, done=None, total=None) callback.
+            page_size (int): Number of objects read and re-embedded at a time.
+
+        Returns:
+            dict: The writer statistics.
+        """
+        report = progress or (lambda stage, done=None, total=None: None)
+        writer = self.create_writer()
+        page = []
+        done = 0
+        for object_id, properties in self.iter_objects():
+            page.append((object_id, properties))
+            if len(page) == page_size:
+                done += len(writer.ingest(page))
+                report("written", done=done)
+                page = []
+        if page:
+            done += len(writer.ingest(page))
+        report("written", done=done, total=done)
+        return writer.summary()
+
     def delete_documents_by_metadata(self , metadata_filter , property):
         """
         property : name (str) | active (bool) | date (str) 
         metadata_filter : the value of the property
         """
-        collection = self.get_collection()
-        search_filter = Filter.by_property(property).like(metadata_filter)
-        return collection.data.delete_many(where=search_filter)
+        result = self.backend.delete_like(property, metadata_filter)
+        if self.lexical_index is not None:
+            self.lexical_index.remove_where(property, metadata_filter)
+        if self.registry is not None:
+            self.registry.delete_where(property, metadata_filter)
+        return result
+
+    def iter_objects(self, return_properties=None):
+        """
+        Iterates over every object of the collection in uuid order, a page at a time.
+
+        Args:
+            return_properties (list): The properties to fetch; all of them if None.
+
+        Yields:
+            tuple: (uuid, properties) for each object.
+        """
+        yield from self.backend.iter_objects(return_properties=return_properties)
+
+    def rebuild_lexical_index(self):
+        """Rebuilds the lexical index from the collection."""
+        if self.lexical_index is None:
+            return 0
+        return self.lexical_index.rebuild(self.iter_objects())
     
+    def rebuild_registry(self):
+        """Rebuilds the document registry from the collection, without loading chunk text."""
+        if self.registry is None:
+            return 0
+        return self.registry.rebuild(self.iter_objects(return_properties=["name", "active", "date", "content_hash"]))
+
     def search_documents_by_metadata(self , metadata_filter , property):
         """
         property : name (str) | active (bool) | date (str) 
         metadata_filter : the value of the property
         """
-        collection = self.get_collection()
-        search_filter = Filter.by_property(property).like(metadata_filter)
-        result = collection.query.fetch_objects(filters=search_filter)
-        chunks = []
-        for o in result.objects:
-                chunks.append(o.properties)
-        return chunks
-    
+        return list(self.iter_documents_by_metadata(metadata_filter, property))
+
+    def iter_documents_by_metadata(self, metadata_filter, property, return_properties=None, after=None,
+                                   page_size=500):
+        """
+        Iterates over every object whose property matches a `like` pattern, in uuid order.
+        The pattern is applied by the store, which is paged by uuid, so there is no limit on
+        the number of results.
+
+        Args:
+            metadata_filter (str): The like pattern.
+            property (str): name | active | date.
+            return_properties (list): The properties to return; SEARCH_PROPERTIES if None.
+            after (str): Start after this uuid, e.g. a search cursor.
+            page_size (int): Number of objects fetched per request.
+
+        Yields:
+            dict: The properties of every matching object.
+        """
+        return_properties = list(return_properties or SEARCH_PROPERTIES)
+        while True:
+            page = self.backend.find_like(
+                property, metadata_filter, after=after, limit=page_size, return_properties=return_properties)
+            for _, properties in page:
+                yield properties
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+
+    def search_documents_page(self, metadata_filter, property, limit=100, cursor=None, return_properties=None):
+        """
+        Returns one page of the objects whose property matches a `like` pattern.
+
+        Args:
+            metadata_filter (str): The like pattern.
+            property (str): name | active | date.
+            limit (int): Maximum number of objects.
+            cursor (str): The cursor returned with the previous page, None for the first page.
+            return_properties (list): The properties to return; SEARCH_PROPERTIES if None.
+
+        Returns:
+            tuple: The matching properties and the cursor of the next page (None on the last
+            page), which is the uuid of the last object of this page.
+
+        Raises:
+            ValueError: If the cursor is invalid.
+        """
+        # One extra object tells whether there is a next page
+        page = self.backend.find_like(
+            property, metadata_filter, after=parse_search_cursor(cursor), limit=limit + 1,
+            return_properties=list(return_properties or SEARCH_PROPERTIES))
+        chunks = [properties for _, properties in page[:limit]]
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        return chunks, next_cursor
+
     def get_all_documents(self):
-        collection = self.get_collection()
-        result = collection.query.fetch_objects(limit=5000)
-        for o in result.objects:
-            print(o.properties)
+        for _, properties in islice(self.backend.iter_objects(), 5000):
+            print(properties)
         
-        return o.properties
+        return properties
     
     def get_all_files_uniqe_by_name(self):
-        collection = self.get_collection()
-        result = collection.query.fetch_objects(limit=5000)
         unique_files = {}
-        for o in result.objects:
-            # Get the properties of the current object
-            properties = o.properties
+        for _, properties in islice(self.backend.iter_objects(), 5000):
     
             # Exclude the 'text' key from the properties
             filtered_properties = {k: v for k, v in properties.items() if k != 'text'}
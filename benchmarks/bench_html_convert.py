@@ -0,0 +1,105 @@
+"""
+Benchmarks the HTML to Document conversion.
+
+Compares the original `_html_to_json` (html.parser, JSON string, then parsed back and
+re-serialized per section) with the single-pass `iter_sections` converter on each parser
+backend.
+
+Usage:
+    python benchmarks/bench_html_convert.py [page.html ...] [--repeat N] [--sections N]
+
+Without files, a synthetic page with nested divs, paragraphs, lists and tables is generated,
+along with an XHTML export of it (with an XML encoding declaration). Every backend must
+produce the same chunks.
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "app"))
+
+from services.convert_html_pipeline import ConvertHTMLPipeline  # noqa: E402
+
+
+def synthetic_page(sections):
+    parts = ["<html><body>"]
+    for i in range(sections):
+        parts.append(f"<div class='post'><h2>باقة رقم {i}</h2><div><div>")
+        parts.append(f"<p>تفاصيل الباقة {i}: سعر الباقة {i * 100} ليرة سورية صالحة لمدة 30 يوم.</p>")
+        parts.append("<ul>" + "".join(f"<li><p>ميزة {j}</p></li>" for j in range(5)) + "</ul>")
+        parts.append("<table><tr><th>الكود</th><th>السعر</th><th>المدة</th></tr>")
+        parts.append("".join(f"<tr><td>*{i}{j}#</td><td>{j * 500}</td><td>{j} يوم</td></tr>" for j in range(10)))
+        parts.append("</table></div></div></div>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def xhtml_export(html):
+    return '<?xml version="1.0" encoding="utf-8"?>\n' + html.replace("<html>", '<html xmlns="http://www.w3.org/1999/xhtml">', 1)
+
+
+def run_legacy(html):
+    converter = ConvertHTMLPipeline()
+    sections = json.loads(converter._html_to_json(html))
+    return [json.dumps(section, ensure_ascii=False, indent=2) for section in sections]
+
+
+def run_single_pass(parser):
+    converter = ConvertHTMLPipeline(parser=parser)
+
+    def run(html):
+        return [d.page_content for d in converter.iter_documents(converter.iter_sections(html), {})]
+    return run
+
+
+def measure(func, html, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(html)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=500)
+    args = parser.parse_args()
+
+    pages = [(path, Path(path).read_text(encoding="utf-8")) for path in args.files]
+    if not pages:
+        page = synthetic_page(args.sections)
+        pages = [(f"synthetic ({args.sections} sections)", page), ("synthetic XHTML export", xhtml_export(page))]
+
+    candidates = [("legacy _html_to_json", run_legacy), ("single-pass html.parser", run_single_pass("html.parser"))]
+    try:
+        import lxml  # noqa: F401
+        candidates.append(("single-pass lxml", run_single_pass("lxml")))
+    except ImportError:
+        print("lxml is not installed; skipping the lxml backend")
+
+    mismatches = 0
+    for name, html in pages:
+        print(f"{name}: {len(html) / 1024:.0f} KiB")
+        baseline = None
+        reference = None
+        for label, func in candidates:
+            seconds, chunks = measure(func, html, args.repeat)
+            baseline = baseline or seconds
+            print(f"  {label:<26} {seconds * 1000:8.1f} ms  {len(chunks):5d} chunks  x{baseline / seconds:.2f}")
+            if label.startswith("single-pass"):
+                if reference is None:
+                    reference = chunks
+                elif chunks != reference:
+                    mismatches += 1
+                    print(f"  {label} produced different chunks than the other single-pass backend")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
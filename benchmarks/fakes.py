@@ -0,0 +1,478 @@
+"""
+Local stand-ins for the external services, used by the load tests.
+
+Cohere (chat and chat_stream), Weaviate (the sync and async clients, near_vector queries,
+fetches, updates, deletes and dynamic batch writes), the HuggingFace embedding endpoint and
+the Telegram Bot API are replaced in-process. Every service follows a ServiceProfile that
+sets its latency, jitter and failure rate, so runs are reproducible and cost no API quota.
+
+FakeBackend.pool_class() returns a ClientPool subclass wired to the fakes; it is passed to
+ConfigService the way the application builds its real pool.
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from contextlib import contextmanager
+
+import requests
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "app"))
+
+from telegram.request import BaseRequest  # noqa: E402
+from services.client_pool import ClientPool  # noqa: E402
+from services.vectorstore_manager import DocumentsPipeline, hash_content  # noqa: E402
+from services.text_utils import like_matcher  # noqa: E402
+from services.vector_backends import WeaviateBackend  # noqa: E402
+
+EMBEDDING_DIMENSIONS = 384
+_WORD_RE = re.compile(r"\w+")
+ANSWER_WORD = "الباقة"
+
+
+class ServiceProfile:
+    """Latency and failure behaviour of one fake service."""
+
+    def __init__(self, latency=0.0, jitter=0.0, per_item=0.0, failure_rate=0.0, seed=0):
+        """
+        Args:
+            latency (float): Seconds added to every call.
+            jitter (float): Maximum random seconds added on top of the latency.
+            per_item (float): Seconds added per item of the call (texts, objects, tokens).
+            failure_rate (float): Share of calls that fail.
+            seed (int): Seed of the random jitter and failures.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.per_item = per_item
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, items=1):
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + jitter + self.per_item * items
+
+    def fails(self):
+        if not self.failure_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def to_dict(self):
+        return {"latency": self.latency, "jitter": self.jitter, "per_item": self.per_item,
+                "failure_rate": self.failure_rate}
+
+
+# Service profiles by name: embedder, weaviate_query, weaviate_write, cohere (latency is the
+# time to the first token, per_item the time per token) and telegram
+PROFILES = {
+    # No latency at all: measures the overhead of the application itself
+    "instant": {},
+    "fast": {
+        "embedder": {"latency": 0.005, "per_item": 0.0005},
+        "weaviate_query": {"latency": 0.005},
+        "weaviate_write": {"latency": 0.005, "per_item": 0.0001},
+        "cohere": {"latency": 0.05, "per_item": 0.002},
+        "telegram": {"latency": 0.005},
+    },
+    # Typical latencies of the hosted services
+    "cloud": {
+        "embedder": {"latency": 0.08, "jitter": 0.04, "per_item": 0.004},
+        "weaviate_query": {"latency": 0.03, "jitter": 0.02},
+        "weaviate_write": {"latency": 0.05, "jitter": 0.02, "per_item": 0.0005},
+        "cohere": {"latency": 0.6, "jitter": 0.3, "per_item": 0.02},
+        "telegram": {"latency": 0.05, "jitter": 0.03},
+    },
+    # Cloud latencies with failing calls, to measure retries and error paths
+    "flaky": {
+        "embedder": {"latency": 0.08, "jitter": 0.04, "per_item": 0.004, "failure_rate": 0.05},
+        "weaviate_query": {"latency": 0.03, "jitter": 0.02, "failure_rate": 0.02},
+        "weaviate_write": {"latency": 0.05, "jitter": 0.02, "per_item": 0.0005, "failure_rate": 0.02},
+        "cohere": {"latency": 0.6, "jitter": 0.3, "per_item": 0.02, "failure_rate": 0.05},
+        "telegram": {"latency": 0.05, "jitter": 0.03, "failure_rate": 0.01},
+    },
+}
+
+SERVICES = ("embedder", "weaviate_query", "weaviate_write", "cohere", "telegram")
+
+
+def build_profiles(name, failure_rate=None, seed=0):
+    """
+    Returns the ServiceProfile of every service for a named profile.
+
+    Args:
+        name (str): A key of PROFILES.
+        failure_rate (float): Overrides the failure rate of every service if not None.
+        seed (int): Base seed of the random jitter and failures.
+    """
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile {name}, expected one of {', '.join(PROFILES)}")
+    profiles = {}
+    for i, service in enumerate(SERVICES):
+        options = dict(PROFILES[name].get(service, {}))
+        if failure_rate is not None:
+            options["failure_rate"] = failure_rate
+        profiles[service] = ServiceProfile(seed=seed + i, **options)
+    return profiles
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} Server Error", response=response)
+
+
+def fake_vector(text, dimensions=EMBEDDING_DIMENSIONS):
+    """Returns a deterministic unit vector for a text; different texts are nearly orthogonal."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+class FakeEmbedder:
+    """Stands in for HuggingFaceInferenceAPIEmbeddings; blocking like the real client."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.calls = 0
+
+    def _call(self, texts):
+        self.calls += 1
+        time.sleep(self.profile.delay(len(texts)))
+        if self.profile.fails():
+            # The Inference API answers 503 while a model is loading
+            raise _http_error(503)
+        return [fake_vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._call([text])[0]
+
+    def embed_documents(self, texts):
+        return self._call(list(texts))
+
+
+class FakeStore:
+    """The objects of the fake Weaviate collection, shared by the sync and async clients."""
+
+    def __init__(self):
+        self.objects = {}  # uuid -> properties
+        self.lock = threading.Lock()
+
+    def seed(self, documents=20, chunks_per_document=50):
+        """Fills the collection with synthetic chunks."""
+        with self.lock:
+            for d in range(documents):
+                name = f"seed-document-{d}"
+                for c in range(chunks_per_document):
+                    text = f"عرض رقم {c} من الوثيقة {d}: {ANSWER_WORD} بسعر {c * 100} ليرة صالحة لمدة 30 يوم."
+                    self.objects[str(uuid.uuid5(uuid.NAMESPACE_URL, f"{name}:{c}"))] = {
+                        "text": text, "name": name, "active": True, "date": "2024-01-01",
+                        "content_hash": hash_content(text),
+                    }
+
+    def __len__(self):
+        return len(self.objects)
+
+
+def _words(value):
+    return set(_WORD_RE.findall(str(value).lower()))
+
+
+def _matches(where, object_id, properties):
+    if where is None:
+        return True
+    if type(where).__name__ == "_FilterAnd":
+        return all(_matches(condition, object_id, properties) for condition in where.filters)
+    operator = where.operator.value
+    value = object_id if where.target == "_id" else properties.get(where.target)
+    if operator == "Equal":
+        if isinstance(value, str) and where.target != "_id":
+            # Text properties are word tokenized: every word of the filter must be present
+            return _words(where.value) <= _words(value)
+        return value == where.value
+    if operator == "ContainsAny":
+        return value in where.value
+    if operator == "GreaterThan":
+        return value is not None and value > str(where.value)
+    if operator == "Like":
+        return like_matcher(where.value)(value)
+    raise NotImplementedError(f"The fake collection does not support the {operator} filter")
+
+
+def _result_object(object_id, properties, return_properties=None, distance=None):
+    if return_properties is not None:
+        properties = {key: properties.get(key) for key in return_properties}
+    return SimpleNamespace(uuid=uuid.UUID(object_id), properties=dict(properties),
+                           metadata=SimpleNamespace(distance=distance))
+
+
+class _FakeQuery:
+    def __init__(self, store, profile):
+        self.store = store
+        self.profile = profile
+
+    def fetch_objects(self, filters=None, limit=None, offset=0, after=None, return_properties=None, sort=None):
+        # Objects are always returned in uuid order, which is the only sort the app uses
+        time.sleep(self.profile.delay())
+        if self.profile.fails():
+            raise ConnectionError("Fake Weaviate query failed")
+        with self.store.lock:
+            items = sorted(self.store.objects.items())
+        if after is not None:
+            items = [item for item in items if item[0] > after]
+        items = [item for item in items if _matches(filters, *item)]
+        items = items[offset:offset + limit] if limit is not None else items[offset:]
+        return SimpleNamespace(objects=[_result_object(i, p, return_properties) for i, p in items])
+
+
+class _FakeData:
+    def __init__(self, store, profile):
+        self.store = store
+        self.profile = profile
+
+    def update(self, uuid, properties):
+        time.sleep(self.profile.delay())
+        with self.store.lock:
+            self.store.objects[str(uuid)].update(properties)
+
+    def delete_many(self, where):
+        time.sleep(self.profile.delay())
+        with self.store.lock:
+            matching = [i for i, p in self.store.objects.items() if _matches(where, i, p)]
+            for object_id in matching:
+                del self.store.objects[object_id]
+        return SimpleNamespace(matches=len(matching), successful=len(matching), failed=0)
+
+
+class _FakeBatchContext:
+    def __init__(self):
+        self.objects = []
+
+    def add_object(self, properties, uuid=None, vector=None):
+        self.objects.append((str(uuid), properties))
+
+
+class _FakeBatch:
+    def __init__(self, store, profile):
+        self.store = store
+        self.profile = profile
+        self.failed_objects = []
+
+    @contextmanager
+    def dynamic(self):
+        context = _FakeBatchContext()
+        yield context
+        failed = []
+        # The dynamic batch sends its objects in requests of about 100
+        for start in range(0, len(context.objects), 100):
+            request = context.objects[start:start + 100]
+            time.sleep(self.profile.delay(len(request)))
+            for object_id, properties in request:
+                if self.profile.fails():
+                    failed.append(SimpleNamespace(object_=SimpleNamespace(uuid=object_id), message="Fake write failure"))
+                    continue
+                with self.store.lock:
+                    self.store.objects[object_id] = dict(properties)
+        self.failed_objects = failed
+
+
+class FakeCollection:
+    """The sync collection API used by DocumentsPipeline and BatchIngestionWriter."""
+
+    def __init__(self, store, query_profile, write_profile):
+        self.store = store
+        self.query = _FakeQuery(store, query_profile)
+        self.data = _FakeData(store, write_profile)
+        self.batch = _FakeBatch(store, write_profile)
+
+
+
+class FakeWeaviateClient:
+    def __init__(self, store, query_profile, write_profile):
+        self.collections = SimpleNamespace(get=lambda name: FakeCollection(store, query_profile, write_profile))
+
+    def close(self):
+        pass
+
+
+class _FakeAsyncQuery:
+    def __init__(self, store, profile):
+        self.store = store
+        self.profile = profile
+
+    async def near_vector(self, near_vector, limit=10, return_metadata=None):
+        await asyncio.sleep(self.profile.delay())
+        if self.profile.fails():
+            raise ConnectionError("Fake Weaviate query failed")
+        # Return a deterministic slice of the collection instead of ranking every object,
+        # so the fake does not compete with the application for CPU
+        with self.store.lock:
+            ids = list(self.store.objects)
+            if not ids:
+                return SimpleNamespace(objects=[])
+            start = int(abs(near_vector[0]) * 1e6) % len(ids)
+            picked = [ids[(start + i) % len(ids)] for i in range(min(limit, len(ids)))]
+            picked = [(object_id, self.store.objects[object_id]) for object_id in picked]
+        return SimpleNamespace(objects=[
+            _result_object(object_id, properties, distance=0.1 + 0.01 * rank)
+            for rank, (object_id, properties) in enumerate(picked)
+        ])
+
+
+class FakeAsyncWeaviateClient:
+    def __init__(self, store, query_profile):
+        self.store = store
+        collection = SimpleNamespace(query=_FakeAsyncQuery(store, query_profile))
+
+        async def exists(name):
+            return True
+        self.collections = SimpleNamespace(get=lambda name: collection, exists=exists)
+
+    async def connect(self):
+        pass
+
+    async def is_ready(self):
+        return True
+
+    async def close(self):
+        pass
+
+
+def _billed(prompt, completion_tokens):
+    return SimpleNamespace(billed_units=SimpleNamespace(
+        input_tokens=len(prompt.split()), output_tokens=completion_tokens))
+
+
+class FakeCohere:
+    """Stands in for cohere.AsyncClient: chat and chat_stream with a fixed-length answer."""
+
+    def __init__(self, profile, answer_tokens=120):
+        self.profile = profile
+        self.answer_tokens = answer_tokens
+
+    def _answer(self):
+        return [f" {ANSWER_WORD}" if i else ANSWER_WORD for i in range(self.answer_tokens)]
+
+    async def chat(self, message, model=None, preamble=None, conversation_id=None, **kwargs):
+        await asyncio.sleep(self.profile.delay(self.answer_tokens))
+        if self.profile.fails():
+            raise ConnectionError("Fake Cohere chat failed")
+        return SimpleNamespace(text="".join(self._answer()), meta=_billed(message, self.answer_tokens))
+
+    async def chat_stream(self, message, model=None, preamble=None, conversation_id=None, **kwargs):
+        await asyncio.sleep(self.profile.delay(0))
+        if self.profile.fails():
+            raise ConnectionError("Fake Cohere stream failed")
+        for token in self._answer():
+            if self.profile.per_item:
+                await asyncio.sleep(self.profile.per_item)
+            yield SimpleNamespace(event_type="text-generation", text=token)
+        yield SimpleNamespace(event_type="stream-end", response=SimpleNamespace(
+            text="".join(self._answer()), meta=_billed(message, self.answer_tokens)))
+
+    async def check_api_key(self):
+        return SimpleNamespace(valid=True)
+
+
+class FakeGroq:
+    """Placeholder for the Groq client; audio transcription is not part of the scenarios."""
+
+    def __init__(self):
+        self.models = SimpleNamespace(list=self._list_models)
+
+    async def _list_models(self):
+        return SimpleNamespace(data=[])
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    Answers Bot API calls locally and records when each chat received a message or an edit,
+    so the load test can measure when a reply was first shown and when it was complete.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.calls = {}  # chat_id -> [(monotonic time, method, text)]
+        self._message_ids = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        await asyncio.sleep(self.profile.delay())
+        endpoint = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data is not None else {}
+        if self.profile.fails():
+            return 500, json.dumps({"ok": False, "error_code": 500, "description": "Fake failure"}).encode()
+        chat_id = parameters.get("chat_id")
+        if chat_id is not None:
+            self.calls.setdefault(int(chat_id), []).append((time.monotonic(), endpoint, parameters.get("text")))
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            if endpoint == "sendMessage":
+                self._message_ids += 1
+            result = {
+                "message_id": int(parameters.get("message_id", self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"},
+                "text": parameters.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class FakeBackend:
+    """All fake services of one load test run, sharing one collection."""
+
+    def __init__(self, profiles, answer_tokens=120):
+        self.profiles = profiles
+        self.store = FakeStore()
+        self.embedder = FakeEmbedder(profiles["embedder"])
+        self.cohere = FakeCohere(profiles["cohere"], answer_tokens=answer_tokens)
+        self.telegram = FakeTelegramRequest(profiles["telegram"])
+
+    def pool_class(self):
+        """Returns a ClientPool subclass whose clients are the fakes of this backend."""
+        backend = self
+
+        class FakeDocumentsPipeline(DocumentsPipeline):
+            def init_embedding_model(self):
+                return backend.embedder
+
+        class FakeClientPool(ClientPool):
+            documents_pipeline_class = FakeDocumentsPipeline
+
+            def init_vector_backend(self):
+                # The local backend is real; only Weaviate is faked
+                if self.settings["vector_backend"] != "weaviate":
+                    return super().init_vector_backend()
+                return WeaviateBackend(
+                    self.settings["weaviate_collection_name"],
+                    client=FakeWeaviateClient(backend.store, backend.profiles["weaviate_query"],
+                                              backend.profiles["weaviate_write"]),
+                    async_client=FakeAsyncWeaviateClient(backend.store, backend.profiles["weaviate_query"]),
+                )
+
+            def init_cohere_client(self):
+                return backend.cohere
+
+            def init_groq_client(self):
+                return FakeGroq()
+
+        return FakeClientPool
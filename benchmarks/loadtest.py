@@ -0,0 +1,533 @@
+"""
+Load tests the application against local stand-ins for Cohere, Weaviate, the HuggingFace
+embedding endpoint and the Telegram Bot API, so throughput and latency can be measured
+without API keys or quota.
+
+The FastAPI app is driven in-process over ASGI with its real routers, client pool, caches
+and job manager; only the clients of the external services are replaced (see fakes.py).
+With --vector-backend local, retrieval and ingestion use the real embedded vector store,
+seeded with the same corpus, instead of the fake Weaviate.
+Each scenario sends a number of requests at a fixed concurrency and reports requests per
+second, p50/p95/p99 latency, time to first token and the peak resident memory.
+
+Scenarios:
+    chat-complete   POST /chat/get-response with distinct questions
+    chat-stream     POST /chat/stream-response with distinct questions
+    chat-cached     POST /chat/stream-response cycling through a few questions (answer cache)
+    telegram        POST /telegram/webhook; latency runs until the reply is complete and
+                    the first token is the first edit of the placeholder message
+    add-document    POST /dashboard/add-document/; latency runs until the ingestion job ends
+
+After add-document, a correctness check re-ingests a document whose name is a word subset of
+another document's name and verifies that the other document keeps its chunks.
+
+Results can be stored as a baseline and later runs compared against it:
+
+    python benchmarks/loadtest.py --save-baseline
+    python benchmarks/loadtest.py --check          # exits with 1 on a regression or a failed check
+
+Usage:
+    python benchmarks/loadtest.py [--scenarios a,b] [--requests N] [--concurrency N]
+        [--profile instant|fast|cloud|flaky] [--failure-rate F] [--vector-backend weaviate|local]
+        [--baseline PATH]
+        [--save-baseline] [--check] [--tolerance F] [--output PATH]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from urllib.parse import urlencode
+from contextlib import asynccontextmanager
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "app"))
+
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+from fakes import FakeBackend, build_profiles, fake_vector  # noqa: E402
+from bench_html_convert import synthetic_page  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+SCENARIOS = ("chat-complete", "chat-stream", "chat-cached", "telegram", "add-document")
+# Metrics compared with the baseline: whether higher is better, and the smallest absolute
+# change that counts as a regression, so timer noise on short requests is not reported
+COMPARED_METRICS = {
+    "rps": (True, 0.0),
+    "p50_ms": (False, 25.0), "p95_ms": (False, 25.0), "p99_ms": (False, 25.0),
+    "ttft_p50_ms": (False, 25.0), "ttft_p95_ms": (False, 25.0),
+    "peak_rss_mb": (False, 10.0),
+}
+FAKE_TELEGRAM_TOKEN = "123456:BENCHMARK"
+
+
+def prepare_environment(workdir, vector_backend="weaviate"):
+    """Points every setting with side effects at the work directory, before the app is imported."""
+    template = Path(workdir) / "prompt_template.txt"
+    shutil.copy(ROOT / "app" / "config" / "prompt_template.txt", template)
+    env_path = Path(workdir) / ".env"
+    env_path.write_text("", encoding="utf-8")
+    os.environ.update({
+        "TELEGRAM_API_TOKEN": FAKE_TELEGRAM_TOKEN,
+        "APP_URL": "http://benchmark.local",
+        "EMBEDDING_MODEL_NAME": "fake-embedder",
+        "HUGGING_FACE_API_KEY": "benchmark",
+        "COHERE_API_KEY": "benchmark",
+        "GROQ_API_KEY": "benchmark",
+        "WEAVIATE_CLUSTER_URL": "http://benchmark.local",
+        "WEAVIATE_API_KEY": "benchmark",
+        "WEAVIATE_COLLECTION_NAME": "Benchmark",
+        "EMBEDDING_CACHE_PATH": "",
+        "DATA_DIR": str(Path(workdir) / "data"),
+        "DOCUMENT_REGISTRY_PATH": str(Path(workdir) / "documents.sqlite3"),
+        "INGESTION_JOBS_PATH": str(Path(workdir) / "jobs.sqlite3"),
+        "PROMPT_TEMPLATE_PATH": str(template),
+        "SESSION_STORE": "memory",
+        "VECTOR_BACKEND": vector_backend,
+        "LOCAL_VECTOR_PATH": str(Path(workdir) / "vectors"),
+    })
+    return str(env_path)
+
+
+def rss_bytes():
+    """Returns the resident memory of this process."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # Peak rather than current memory, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def asgi_request(app, method, path, body=b"", content_type=None):
+    """
+    Sends one request to an ASGI app and times the first and the last body chunk.
+
+    httpx's ASGI transport buffers the whole response, which hides the time to first token,
+    so the request is driven here directly.
+
+    Returns:
+        tuple: (status, body, seconds to the first body chunk, total seconds)
+    """
+    headers = [(b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 50000),
+        "server": ("benchmark.local", 80), "state": {},
+    }
+    received = False
+    finished = asyncio.Event()
+    response = {"status": None, "chunks": [], "first": None}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if response["first"] is None:
+                response["first"] = time.perf_counter()
+            response["chunks"].append(message["body"])
+
+    started = time.perf_counter()
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    ended = time.perf_counter()
+    first = response["first"] - started if response["first"] is not None else None
+    return response["status"], b"".join(response["chunks"]), first, ended - started
+
+
+def multipart(fields, files):
+    boundary = "benchmark-boundary"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: text/html\r\n\r\n'.encode() + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _is_error_text(text):
+    return text.startswith("Error") or "Error generating response" in text
+
+
+class LoadTest:
+    """Runs the scenarios against one application instance backed by the fakes."""
+
+    def __init__(self, app, backend, telegram, concurrency, html_sections=40):
+        self.app = app
+        self.backend = backend
+        self.telegram = telegram
+        self.concurrency = concurrency
+        self.html_sections = html_sections
+        self._updates = {}  # update_id -> asyncio.Event set once the update was handled
+        self._run = 0
+
+    @property
+    def pool(self):
+        return self.app.state.client_pool
+
+    async def chat(self, i, path, question):
+        body = urlencode({"question": question, "conversation_id": f"bench-{i}", "is_en": "false"}).encode()
+        status, content, first, total = await asgi_request(
+            self.app, "POST", path, body, "application/x-www-form-urlencoded")
+        text = content.decode("utf-8", errors="replace")
+        if path == "/chat/get-response" and status == 200:
+            text = json.loads(text)["response"]
+            first = None
+        return {"latency": total, "ttft": first, "error": status != 200 or _is_error_text(text)}
+
+    async def chat_complete(self, i):
+        return await self.chat(i, "/chat/get-response", f"ما هي أسعار الباقة رقم {self._run}-{i}؟")
+
+    async def chat_stream(self, i):
+        return await self.chat(i, "/chat/stream-response", f"ما هي مدة صلاحية العرض {self._run}-{i}؟")
+
+    async def chat_cached(self, i):
+        return await self.chat(i, "/chat/stream-response", f"كيف أشترك في الباقة رقم {i % 5}؟")
+
+    async def telegram_message(self, i):
+        update_id = self._run * 1_000_000 + i
+        chat_id = 10_000_000 + update_id
+        done = self._updates[update_id] = asyncio.Event()
+        update = {
+            "update_id": update_id,
+            "message": {
+                "message_id": i + 1, "date": int(time.time()), "text": f"ما هي عروض الإنترنت {update_id}؟",
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "benchmark"},
+            },
+        }
+        started = time.perf_counter()
+        status, _, _, _ = await asgi_request(
+            self.app, "POST", "/telegram/webhook", json.dumps(update).encode(), "application/json")
+        try:
+            await asyncio.wait_for(done.wait(), timeout=300)
+        except asyncio.TimeoutError:
+            return {"latency": time.perf_counter() - started, "ttft": None, "error": True}
+        finally:
+            self._updates.pop(update_id, None)
+        ended = time.perf_counter()
+        calls = self.backend.telegram.calls.pop(chat_id, [])
+        edits = [(at, text) for at, method, text in calls if method == "editMessageText"]
+        shown = edits[-1][1] if edits else ""
+        return {
+            "latency": ended - started,
+            "ttft": edits[0][0] - started if edits else None,
+            "error": status != 200 or not shown or _is_error_text(shown),
+        }
+
+    async def _update_handled(self, update, context):
+        event = self._updates.get(update.update_id)
+        if event is not None:
+            event.set()
+
+    async def upload(self, name, sections):
+        """Uploads a synthetic document and waits for its ingestion job; True if it succeeded."""
+        html = synthetic_page(sections).replace("باقة رقم", f"باقة {name} رقم")
+        body, content_type = multipart(
+            {"name": name, "active": "true", "date": "2024-01-01"},
+            {"file": (f"{name}.html", html.encode("utf-8"))},
+        )
+        status, content, _, _ = await asgi_request(self.app, "POST", "/dashboard/add-document/", body, content_type)
+        if status != 202:
+            return False
+        job_id = json.loads(content)["job_id"]
+        while (status := self.pool.ingestion_jobs.get(job_id)["status"]) not in ("succeeded", "failed"):
+            await asyncio.sleep(0.005)
+        return status == "succeeded"
+
+    async def add_document(self, i):
+        started = time.perf_counter()
+        succeeded = await self.upload(f"benchmark-{self._run}-{i}", self.html_sections)
+        return {"latency": time.perf_counter() - started, "ttft": None, "error": not succeeded}
+
+    def _count_chunks(self, name):
+        backend = self.pool.documents_pipeline.backend
+        return sum(1 for _, properties in backend.iter_objects(return_properties=["name"])
+                   if properties.get("name") == name)
+
+    async def check_reingest_isolation(self):
+        """
+        Re-ingests a document whose name is a word subset of another document's name, with
+        fewer sections so some of its chunks become stale, and checks that the other document
+        keeps all of its chunks.
+
+        Returns:
+            tuple: Whether the check passed, and a description of the outcome.
+        """
+        self._run += 1
+        name = f"Bundle Prices {self._run}"
+        other = f"{name} 2024"
+        if not (await self.upload(other, 10) and await self.upload(name, 10)):
+            return False, "the documents could not be ingested"
+        before = await asyncio.to_thread(self._count_chunks, other)
+        if not await self.upload(name, 5):
+            return False, "the re-upload failed"
+        after = await asyncio.to_thread(self._count_chunks, other)
+        return before > 0 and after == before, f"'{other}' had {before} chunks, {after} after re-ingesting '{name}'"
+
+    def handler(self, scenario):
+        return {
+            "chat-complete": self.chat_complete,
+            "chat-stream": self.chat_stream,
+            "chat-cached": self.chat_cached,
+            "telegram": self.telegram_message,
+            "add-document": self.add_document,
+        }[scenario]
+
+    async def run(self, scenario, requests, warmup=0):
+        """Runs one scenario and returns its statistics."""
+        if scenario == "telegram" and not any(
+                isinstance(h, TypeHandler) for h in self.telegram.ptb.handlers.get(1, [])):
+            # Runs after the message handler of group 0, whether it succeeded or not
+            self.telegram.ptb.add_handler(TypeHandler(Update, self._update_handled), group=1)
+        handler = self.handler(scenario)
+        self._run += 1
+        for i in range(warmup):
+            await handler(-1 - i)
+        self._run += 1
+
+        samples = []
+        next_index = 0
+        peak_rss = rss_bytes()
+        rss_before = peak_rss
+        sampling = True
+
+        async def sample_memory():
+            nonlocal peak_rss
+            while sampling:
+                peak_rss = max(peak_rss, rss_bytes())
+                await asyncio.sleep(0.05)
+
+        async def worker():
+            nonlocal next_index
+            while next_index < requests:
+                i = next_index
+                next_index += 1
+                try:
+                    samples.append(await handler(i))
+                except Exception as e:
+                    logging.getLogger(__name__).warning(f"{scenario} request {i} failed: {e}")
+                    samples.append({"latency": None, "ttft": None, "error": True})
+
+        monitor = asyncio.create_task(sample_memory())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+        sampling = False
+        await monitor
+        peak_rss = max(peak_rss, rss_bytes())
+
+        latencies = [s["latency"] * 1000 for s in samples if s["latency"] is not None]
+        ttfts = [s["ttft"] * 1000 for s in samples if s["ttft"] is not None]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for s in samples if s["error"]),
+            "seconds": round(elapsed, 3),
+            "rps": round(len(samples) / elapsed, 2) if elapsed else None,
+            "p50_ms": _round(percentile(latencies, 50)),
+            "p95_ms": _round(percentile(latencies, 95)),
+            "p99_ms": _round(percentile(latencies, 99)),
+            "ttft_p50_ms": _round(percentile(ttfts, 50)),
+            "ttft_p95_ms": _round(percentile(ttfts, 95)),
+            "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+            "rss_growth_mb": round((rss_bytes() - rss_before) / 2 ** 20, 1),
+        }
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+@asynccontextmanager
+async def running_app(backend, env_path):
+    """Starts the application the way main.lifespan does, with the pool built on the fakes."""
+    from app import main
+    from app.routers import telegram
+    from services.config_service import ConfigService
+
+    app = main.app
+    config = ConfigService(app.state, env_path=env_path, check_interval=0, pool_class=backend.pool_class())
+    await config.start()
+    app.state.config = config
+    telegram.ptb = telegram.build_application(token=FAKE_TELEGRAM_TOKEN, request=backend.telegram)
+    try:
+        async with telegram.lifespan(app):
+            yield app, telegram
+    finally:
+        await config.close()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of every metric against the baseline.
+
+    Returns:
+        list: The regressions, as (scenario, metric, baseline value, value) tuples.
+    """
+    regressions = []
+    for scenario, stats in results.items():
+        reference = baseline.get("scenarios", {}).get(scenario)
+        if reference is None:
+            print(f"  {scenario:<14} not in the baseline")
+            continue
+        changes = []
+        for metric, (higher_is_better, min_change) in COMPARED_METRICS.items():
+            old, new = reference.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            changes.append(f"{metric} {change:+.0%}")
+            worse = old - new if higher_is_better else new - old
+            if worse / old > tolerance and worse > min_change:
+                regressions.append((scenario, metric, old, new))
+        print(f"  {scenario:<14} " + ", ".join(changes))
+    return regressions
+
+
+def print_results(results):
+    columns = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms", "peak_rss_mb")
+    print(f"{'scenario':<14} " + " ".join(f"{column:>11}" for column in columns))
+    for scenario, stats in results.items():
+        values = ["-" if stats[column] is None else str(stats[column]) for column in columns]
+        print(f"{scenario:<14} " + " ".join(f"{value:>11}" for value in values))
+
+
+async def seed_local_store(store, path):
+    """Writes the seeded corpus to the embedded vector store the app will open."""
+    from services.local_vector_store import LocalVectorBackend
+    local = LocalVectorBackend(path)
+    local.write([
+        (object_id, properties, fake_vector(properties["text"]))
+        for object_id, properties in sorted(store.objects.items())
+    ])
+    await local.close()
+
+
+async def run(args, env_path):
+    profiles = build_profiles(args.profile, failure_rate=args.failure_rate, seed=args.seed)
+    backend = FakeBackend(profiles, answer_tokens=args.answer_tokens)
+    backend.store.seed(documents=args.corpus_documents, chunks_per_document=50)
+    if args.vector_backend == "local":
+        await seed_local_store(backend.store, os.environ["LOCAL_VECTOR_PATH"])
+    results = {}
+    checks = {}
+    async with running_app(backend, env_path) as (app, telegram):
+        load_test = LoadTest(app, backend, telegram, args.concurrency, html_sections=args.html_sections)
+        for scenario in args.scenarios:
+            requests = args.requests if scenario != "add-document" else max(1, args.requests // 10)
+            results[scenario] = await load_test.run(scenario, requests, warmup=args.warmup)
+            print(f"{scenario}: {results[scenario]['rps']} req/s, p95 {results[scenario]['p95_ms']} ms", flush=True)
+        if "add-document" in args.scenarios:
+            passed, detail = await load_test.check_reingest_isolation()
+            checks["reingest-isolation"] = {"passed": passed, "detail": detail}
+    return results, checks, {service: profile.to_dict() for service, profile in profiles.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (a tenth for add-document)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--profile", default="fast", help="instant, fast, cloud or flaky")
+    parser.add_argument("--failure-rate", type=float, default=None, help="overrides the failure rate of every service")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--corpus-documents", type=int, default=20, help="seeded documents of 50 chunks")
+    parser.add_argument("--html-sections", type=int, default=40, help="sections per uploaded document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vector-backend", default="weaviate", choices=("weaviate", "local"))
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a metric regressed beyond the tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    # The app configures INFO logging on import, which would log every request
+    logging.basicConfig(level=logging.WARNING, force=True)
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        env_path = prepare_environment(workdir, args.vector_backend)
+        results, checks, profiles = asyncio.run(run(args, env_path))
+
+    report = {
+        "meta": {
+            "profile": args.profile, "failure_rate": args.failure_rate, "requests": args.requests,
+            "vector_backend": args.vector_backend,
+            "concurrency": args.concurrency, "answer_tokens": args.answer_tokens,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "edit_interval": os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "profiles": profiles,
+        "scenarios": results,
+        "checks": checks,
+    }
+    print()
+    print_results(results)
+    for check, outcome in checks.items():
+        print(f"check {check}: {'ok' if outcome['passed'] else 'FAILED'} ({outcome['detail']})")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    regressions = []
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        print(f"\nCompared with {baseline_path.name} ({baseline['meta'].get('created_at')}):")
+        for key in ("profile", "requests", "concurrency", "answer_tokens", "vector_backend"):
+            if baseline["meta"].get(key) != report["meta"][key]:
+                print(f"  warning: the baseline was recorded with {key}={baseline['meta'].get(key)}")
+        regressions = compare(results, baseline, args.tolerance)
+        for scenario, metric, old, new in regressions:
+            print(f"  REGRESSION {scenario} {metric}: {old} -> {new}")
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"\nBaseline saved to {baseline_path}")
+    if args.check and (regressions or not all(outcome["passed"] for outcome in checks.values())):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()